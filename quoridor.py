@@ -0,0 +1,458 @@
+"""
+Single entry point:
+
+    python -m quoridor play [--players human search]
+    python -m quoridor train [--mode gym|actor-learner]
+    python -m quoridor eval search random [--games 10]
+    python -m quoridor serve agent_0.pth [--address /tmp/quoridor.sock] [--watch 5]
+    python -m quoridor replay runs/games [--observations]
+    python -m quoridor dataset runs/games --out data/games
+    python -m quoridor bench [imports|engine|vec-env|suite] [--save-baseline]
+
+Every subcommand imports only the subsystem it needs, so playing never pays for torch and the
+headless commands never open a display.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+DEFAULT_MODEL_FILES = ['agent_0.pth', 'agent_1.pth']
+PLAYER_KINDS = ('human', 'ai', 'search', 'mcts')
+BENCH_TARGETS = ('imports', 'engine', 'vec-env', 'suite')
+# Module -> heavy modules it must not pull in when imported on its own
+IMPORT_CHECKS = {
+    'src.game_state': ('torch', 'pygame'),
+    'src.env': ('torch', 'pygame'),
+    'src.vec_env': ('torch', 'pygame'),
+    'src.search': ('torch', 'pygame'),
+    'src.mcts': ('torch', 'pygame'),
+    'src.evaluation': ('torch', 'pygame'),
+    'src.inference_server': ('torch', 'pygame'),
+    'src.player': ('torch',),
+    'src.quoridor': ('torch',),
+    'src.actor_learner': ('pygame',),
+}
+
+
+def play(args):
+    import pygame
+    from src.constants import CELL, GAME_SIZE, HALF_DISTANCE
+    from src.quoridor import Quoridor
+
+    seats = [
+        ("Orange", pygame.Color("coral"), (GAME_SIZE * 0.5, HALF_DISTANCE)),
+        ("Blue", pygame.Color("blue"), (GAME_SIZE * 0.5, GAME_SIZE - HALF_DISTANCE)),
+    ]
+    players = []
+    for index, (kind, (name, color, position)) in enumerate(zip(args.players, seats)):
+        players.append(_make_player(kind, index, name, color, position, 0.5 * CELL, args))
+
+    Quoridor(players=players, game_records=_game_record_writer(args), render_every=args.render_every).run_game()
+
+
+def _game_record_writer(args):
+    if not args.game_records:
+        return None
+
+    from src.game_record import GameRecordWriter
+
+    return GameRecordWriter.from_spec(args.game_records)
+
+
+def _make_player(kind, index, name, color, position, radius, args):
+    if kind == 'human':
+        from src.player import Player
+
+        return Player(index=index, name=name, color=color, position=position, radius=radius)
+
+    if kind == 'search':
+        from src.player import SearchPlayer
+
+        return SearchPlayer(index, name, position, color, radius, time_budget=args.time_budget)
+
+    if kind == 'mcts':
+        from src.player import MCTSPlayer
+
+        return MCTSPlayer(index, name, position, color, radius, simulations=args.simulations,
+                          time_budget=args.time_budget)
+
+    import torch
+    from src.actions import ACTION_SIZE
+    from src.ai_player import AIPlayer
+    from src.dqn import DQN
+    from src.game_state import GameState
+    from src.quoridor import QuoridorGym
+
+    player = AIPlayer(index=index, name=name, color=color, position=position, radius=radius)
+    state_size = len(GameState().get_state())
+    player.policy_model = DQN(state_size=state_size, action_size=ACTION_SIZE)
+    player.target_model = DQN(state_size=state_size, action_size=ACTION_SIZE)
+    player.optimizer = torch.optim.Adam(player.policy_model.parameters(), player.lr)
+    if args.model_files and os.path.exists(args.model_files[index]):
+        QuoridorGym.load_checkpoints(player.policy_model, player.target_model, player.optimizer,
+                                     args.model_files[index])
+        player.epsilon = 0
+
+    return player
+
+
+def train(args):
+    from src.metrics import Metrics
+
+    model_filenames = dict(enumerate(args.model_files))
+    metrics = Metrics.from_env(args.metrics, args.metrics_every, args.profile)
+    if args.mode == 'gym':
+        from src.quoridor import QuoridorGym
+
+        QuoridorGym(
+            model_filenames=model_filenames, metrics=metrics, game_records=_game_record_writer(args),
+            render_every=args.render_every, checkpoints=_checkpoint_manager(args),
+        ).run_training_session()
+        return
+
+    from src.actor_learner import ActorLearnerTrainer, default_players
+
+    players = default_players(model_filenames)
+    if args.mode == 'offline':
+        _train_offline(args, players, metrics)
+        return
+
+    trainer = ActorLearnerTrainer(
+        players,
+        num_workers=args.workers,
+        games_per_worker=args.games_per_worker,
+        batch_size=args.batch_size,
+        total_learn_steps=args.learn_steps,
+        metrics=metrics,
+        checkpoints=_checkpoint_manager(args),
+    )
+    trainer.run()
+    print(f"{trainer.learn_steps} learn steps over {trainer.games_played} games")
+
+    from src.quoridor import QuoridorGym
+
+    for player in players:
+        QuoridorGym.save_checkpoints(player.policy_model, player.optimizer, model_filenames[player.index])
+
+
+def _checkpoint_manager(args):
+    if not args.checkpoint_dir:
+        return None
+
+    from src.checkpoints import CheckpointManager
+
+    return CheckpointManager(
+        args.checkpoint_dir,
+        every_steps=args.checkpoint_every_steps,
+        every_seconds=args.checkpoint_every_seconds,
+        keep_last=args.keep_last,
+        keep_best=args.keep_best,
+    )
+
+
+def _train_offline(args, players, metrics):
+    from src.dataset import OfflineDataset, train_offline
+    from src.quoridor import QuoridorGym
+
+    if not args.dataset:
+        raise SystemExit("--mode offline needs --dataset <directory built by 'python -m quoridor dataset'>")
+
+    dataset = OfflineDataset(args.dataset)
+    metrics.start()
+    try:
+        for player in players:
+            losses = train_offline(player, dataset, batch_size=args.batch_size, epochs=args.epochs,
+                                   seed=player.index, metrics=metrics)
+            print(f"{player.name}: {len(losses)} learn steps over {len(dataset)} transitions")
+            QuoridorGym.save_checkpoints(player.policy_model, player.optimizer, args.model_files[player.index])
+    finally:
+        metrics.close()
+
+
+def build_dataset(args):
+    from src.dataset import build_dataset
+    from src.game_record import iter_records
+
+    start = time.perf_counter()
+    transitions = build_dataset(iter_records(args.paths), args.out, transitions_per_shard=args.shard_size)
+    seconds = time.perf_counter() - start
+    print(f"{transitions} transitions written to {args.out} in {seconds:.1f}s")
+
+
+def evaluate(args):
+    from src.evaluation import make_agent, play_match
+
+    agents = [
+        make_agent(spec, time_budget=args.time_budget, simulations=args.simulations, seed=seed)
+        for seed, spec in enumerate(args.agents)
+    ]
+    result = play_match(agents, games=args.games, max_moves=args.max_moves)
+    for spec, wins in zip(args.agents, result['wins']):
+        print(f"{spec}: {wins}/{args.games} wins")
+    print(f"draws: {result['draws']}, average moves: {result['moves']:.1f}")
+
+
+def serve(args):
+    from src.inference_server import InferenceServer
+    from src.metrics import Metrics
+
+    server = InferenceServer(
+        args.checkpoint,
+        address=args.address,
+        max_batch_size=args.max_batch_size,
+        max_latency=args.max_latency_ms / 1000,
+        watch_interval=args.watch,
+        metrics=Metrics.from_env(args.metrics, args.metrics_every),
+    )
+    print(f"Serving {args.checkpoint} at {server.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def replay(args):
+    """
+    Re-simulates every recorded game, checking each move, and optionally regenerates the observations.
+    """
+    from src.game_record import Replayer, iter_records
+
+    replayer = Replayer()
+    seen = set()
+    duplicates = 0
+    illegal = 0
+    start = time.perf_counter()
+    for game, record in enumerate(iter_records(args.paths)):
+        if args.dedupe:
+            if record in seen:
+                duplicates += 1
+                continue
+            seen.add(record)
+        try:
+            if args.observations:
+                replayer.observations(record)
+            else:
+                replayer.verify(record)
+        except ValueError as error:
+            illegal += 1
+            print(f"game {game}: {error}")
+    seconds = time.perf_counter() - start
+
+    print(f"{replayer.games_replayed} games, {replayer.moves_replayed} moves replayed "
+          f"({replayer.moves_replayed / max(seconds, 1e-9):,.0f} moves/s); {illegal} illegal"
+          + (f", {duplicates} duplicates" if args.dedupe else ""))
+    if illegal:
+        sys.exit(1)
+
+
+def bench(args):
+    targets = {'imports': bench_imports, 'engine': bench_engine, 'vec-env': bench_vec_env, 'suite': bench_suite}
+    failed = False
+    for target in args.targets:
+        failed |= bool(targets[target](args))
+
+    if failed:
+        sys.exit(1)
+
+
+def bench_imports(args):
+    """
+    Imports each module in a fresh interpreter, reports how long it took and fails if it pulls in a heavy
+    module it should not need or, for the torch-free modules, exceeds max_import_seconds. Modules that
+    need torch are not held to the budget, since their time is mostly torch's own import.
+    :return: True if any check failed
+    """
+    failed = False
+    for module, forbidden in IMPORT_CHECKS.items():
+        code = (
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))\n"
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, 'PYGAME_HIDE_SUPPORT_PROMPT': '1'},
+        ).stdout
+        seconds, modules = json.loads(output.strip().splitlines()[-1])
+        leaked = [name for name in forbidden if name in modules]
+        timed = 'torch' in forbidden
+        too_slow = timed and seconds > args.max_import_seconds
+        failed |= bool(leaked) or too_slow
+        status = 'FAIL' if leaked or too_slow else 'ok'
+        note = f"  imports {', '.join(leaked)}" if leaked else "" if timed else "  (needs torch, not timed)"
+        print(f"{status:4} {module:20} {seconds:6.2f}s{note}")
+
+    return failed
+
+
+def bench_engine(args):
+    from src.evaluation import make_agent
+    from src.game_state import GameState
+
+    agent = make_agent('random', seed=0)
+    state = GameState()
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        mover = state.current_player
+        state.apply_move(agent(state))
+        if state.is_winner(mover):
+            state.reset()
+    seconds = time.perf_counter() - start
+    print(f"engine: {args.steps / seconds:,.0f} moves/s (legal action mask + move)")
+
+
+def bench_vec_env(args):
+    import numpy as np
+    from src.vec_env import VecQuoridorEnv
+
+    rng = np.random.default_rng(0)
+    env = VecQuoridorEnv(args.games)
+    _, action_masks = env.reset()
+    start = time.perf_counter()
+    for _ in range(max(args.steps // args.games, 1)):
+        actions = [rng.choice(np.flatnonzero(mask)) for mask in action_masks]
+        _, _, _, info = env.step(np.array(actions))
+        action_masks = info['action_mask']
+    seconds = time.perf_counter() - start
+    print(f"vec-env: {max(args.steps // args.games, 1) * args.games / seconds:,.0f} steps/s over {args.games} games")
+
+
+def bench_suite(args):
+    """
+    Runs src.benchmarks and compares every rate with the baseline, or records the rates as the new
+    baseline with --save-baseline.
+    :return: True if any benchmark regressed
+    """
+    from src import benchmarks
+
+    filename = args.baseline or benchmarks.DEFAULT_BASELINE
+    results = benchmarks.BenchmarkSuite(min_time=args.min_time, repeats=args.repeats).run()
+    if args.save_baseline:
+        benchmarks.save_baseline(results, filename)
+        print(f"saved {len(results)} benchmarks to {filename}")
+
+    baseline = {} if args.save_baseline else benchmarks.load_baseline(filename)
+    if not baseline and not args.save_baseline:
+        print(f"no baseline at {filename}; record one with --save-baseline")
+    comparison = benchmarks.compare(results, baseline)
+    regressed = benchmarks.regressions(comparison, args.tolerance)
+    for name, rate, baseline_rate, ratio in comparison:
+        status = 'FAIL' if name in regressed else 'ok'
+        versus = '' if ratio is None else f"  baseline {baseline_rate:12,.1f}/s  x{ratio:.2f}"
+        print(f"{status:4} {name:34} {rate:12,.1f}/s{versus}")
+
+    return bool(regressed)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m quoridor', description="Quoridor with reinforcement learning")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    play_parser = subparsers.add_parser('play', help="play a game in a window")
+    play_parser.add_argument('--players', nargs=2, choices=PLAYER_KINDS, default=['human', 'search'])
+    play_parser.add_argument('--model-files', nargs=2, default=DEFAULT_MODEL_FILES, help="checkpoints for ai players")
+    play_parser.add_argument('--time-budget', type=float, default=1.0, help="seconds per move for search/mcts")
+    play_parser.add_argument('--simulations', type=int, default=800, help="simulations per move for mcts")
+    play_parser.add_argument('--game-records', default=os.environ.get('QUORIDOR_GAME_RECORDS'),
+                             help="[jsonl:|binary:]<dir> to record the game in (default: $QUORIDOR_GAME_RECORDS)")
+    play_parser.add_argument('--render-every', type=int, default=1,
+                             help="draw AI moves every this many moves, 0 to not draw them at all")
+    play_parser.set_defaults(handler=play)
+
+    train_parser = subparsers.add_parser('train', help="train the DQN agents")
+    train_parser.add_argument('--mode', choices=('gym', 'actor-learner', 'offline'), default='actor-learner')
+    train_parser.add_argument('--model-files', nargs=2, default=DEFAULT_MODEL_FILES)
+    train_parser.add_argument('--workers', type=int, default=4)
+    train_parser.add_argument('--games-per-worker', type=int, default=16)
+    train_parser.add_argument('--batch-size', type=int, default=1000)
+    train_parser.add_argument('--learn-steps', type=int, default=10000)
+    train_parser.add_argument('--dataset', help="dataset directory for --mode offline")
+    train_parser.add_argument('--epochs', type=int, default=1, help="passes over the dataset for --mode offline")
+    train_parser.add_argument('--metrics', help="comma separated sinks: console, csv:<path>, jsonl:<path>, "
+                                                "tensorboard:<dir> or off (default: $QUORIDOR_METRICS or console)")
+    train_parser.add_argument('--metrics-every', type=float, help="seconds between metrics reports")
+    train_parser.add_argument('--profile', help="cprofile:<path> or sample:<path> (default: $QUORIDOR_PROFILE)")
+    train_parser.add_argument('--game-records', default=os.environ.get('QUORIDOR_GAME_RECORDS'),
+                              help="[jsonl:|binary:]<dir> to record gym self-play games in "
+                                   "(default: $QUORIDOR_GAME_RECORDS)")
+    train_parser.add_argument('--render-every', type=int, default=1,
+                              help="with --mode gym, draw every this many steps, 0 to not draw at all")
+    train_parser.add_argument('--checkpoint-dir',
+                              help="save the full training state (models, optimizers, epsilon, replay memories, "
+                                   "RNG states) here and resume from its latest checkpoint, if any")
+    train_parser.add_argument('--checkpoint-every-steps', type=int, help="checkpoint every this many steps")
+    train_parser.add_argument('--checkpoint-every-seconds', type=float, default=600,
+                              help="checkpoint every this many seconds (default: 600)")
+    train_parser.add_argument('--keep-last', type=int, default=3, help="most recent checkpoints to keep")
+    train_parser.add_argument('--keep-best', type=int, default=1, help="checkpoints with the lowest loss to keep")
+    train_parser.set_defaults(handler=train)
+
+    eval_parser = subparsers.add_parser('eval', help="play headless games between two agents")
+    eval_parser.add_argument('agents', nargs=2, help="random, search, mcts, dqn:<checkpoint> or remote:<address>")
+    eval_parser.add_argument('--games', type=int, default=10)
+    eval_parser.add_argument('--max-moves', type=int, default=500)
+    eval_parser.add_argument('--time-budget', type=float, default=0.5)
+    eval_parser.add_argument('--simulations', type=int, default=200)
+    eval_parser.set_defaults(handler=evaluate)
+
+    serve_parser = subparsers.add_parser('serve', help="serve a DQN checkpoint to many game workers with batched "
+                                                       "inference (agent spec remote:<address>)")
+    serve_parser.add_argument('checkpoint', help="checkpoint saved by training, e.g. agent_0.pth")
+    serve_parser.add_argument('--address', help="socket path to listen on (default: a new temporary one)")
+    serve_parser.add_argument('--max-batch-size', type=int, default=256, help="observations per forward pass")
+    serve_parser.add_argument('--max-latency-ms', type=float, default=2.0,
+                              help="longest a request waits for others to batch with")
+    serve_parser.add_argument('--watch', type=float,
+                              help="reload the checkpoint when it changes, checking every this many seconds")
+    serve_parser.add_argument('--metrics', help="as for train (default: $QUORIDOR_METRICS or console)")
+    serve_parser.add_argument('--metrics-every', type=float, help="seconds between metrics reports")
+    serve_parser.set_defaults(handler=serve)
+
+    replay_parser = subparsers.add_parser('replay', help="verify recorded games by re-simulating them")
+    replay_parser.add_argument('paths', nargs='+', help="game record shards or directories of shards")
+    replay_parser.add_argument('--observations', action='store_true', help="also regenerate every observation")
+    replay_parser.add_argument('--dedupe', action='store_true', help="count duplicate games")
+    replay_parser.set_defaults(handler=replay)
+
+    dataset_parser = subparsers.add_parser('dataset', help="build an offline training dataset from recorded games")
+    dataset_parser.add_argument('paths', nargs='+', help="game record shards or directories of shards")
+    dataset_parser.add_argument('--out', required=True, help="new directory for the dataset")
+    dataset_parser.add_argument('--shard-size', type=int, default=2 ** 16, help="transitions per shard")
+    dataset_parser.set_defaults(handler=build_dataset)
+
+    bench_parser = subparsers.add_parser('bench', help="import time check and throughput benchmarks")
+    bench_parser.add_argument('targets', nargs='*', help=f"any of {', '.join(BENCH_TARGETS)} (default: all)")
+    bench_parser.add_argument('--max-import-seconds', type=float, default=3.0,
+                              help="import time budget of the modules that must not import torch")
+    bench_parser.add_argument('--steps', type=int, default=5000)
+    bench_parser.add_argument('--games', type=int, default=64)
+    bench_parser.add_argument('--baseline', default=None,
+                              help="baseline JSON of the suite (default: benchmark_baseline.json)")
+    bench_parser.add_argument('--save-baseline', action='store_true', help="record the suite's rates as the baseline")
+    bench_parser.add_argument('--tolerance', type=float, default=0.3,
+                              help="fraction a rate may drop below its baseline before the suite fails")
+    bench_parser.add_argument('--min-time', type=float, default=0.2, help="seconds per suite measurement")
+    bench_parser.add_argument('--repeats', type=int, default=3, help="measurements per suite benchmark, best kept")
+    bench_parser.set_defaults(handler=bench)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'bench':
+        # argparse rejects an empty list for nargs='*' with choices, so the targets are checked here
+        unknown = sorted(set(args.targets) - set(BENCH_TARGETS))
+        if unknown:
+            parser.error(f"unknown bench targets {', '.join(unknown)}; choose from {', '.join(BENCH_TARGETS)}")
+        args.targets = args.targets or list(BENCH_TARGETS)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import numpy as np
+
+from src.constants import SQUARES, TOTAL_WALL_SLOTS
+
+# Actions [0, WALL_ACTIONS) place the wall with that engine index (see game_state.wall_index). The
+# remaining actions move the pawn by a (col, row) offset relative to its current cell.
+PAWN_MOVE_OFFSETS = (
+    (0, -1), (0, 1), (-1, 0), (1, 0),  # Steps: UP, DOWN, LEFT, RIGHT
+    (0, -2), (0, 2), (-2, 0), (2, 0),  # Straight jumps over an opponent
+    (-1, -1), (1, -1), (-1, 1), (1, 1),  # Side-steps around an opponent
+)
+WALL_ACTIONS = TOTAL_WALL_SLOTS * 2
+ACTION_SIZE = WALL_ACTIONS + len(PAWN_MOVE_OFFSETS)
+PAWN_ACTIONS = range(WALL_ACTIONS, ACTION_SIZE)
+
+# The cell index delta each action applies to the mover's pawn (0 for walls) and, the other way
+# round, the pawn action for each delta. Every pawn move is at most two cells away, so deltas are unique.
+ACTION_CELL_OFFSETS = np.zeros(ACTION_SIZE, dtype=np.int64)
+ACTION_CELL_OFFSETS[WALL_ACTIONS:] = [row_offset * SQUARES + col_offset for col_offset, row_offset in PAWN_MOVE_OFFSETS]
+PAWN_OFFSET_ACTIONS = {int(ACTION_CELL_OFFSETS[action]): action for action in PAWN_ACTIONS}
+
+
+def is_wall_action(action):
+    return action < WALL_ACTIONS
+
+
+def pawn_action(origin, destination):
+    """
+    :return: the action moving a pawn from the origin cell to the destination cell
+    """
+    return PAWN_OFFSET_ACTIONS[destination - origin]
+
+
+def action_destination(origin, action):
+    """
+    :return: the cell a pawn action takes a pawn on the origin cell to
+    """
+    return origin + int(ACTION_CELL_OFFSETS[action])
@@ -0,0 +1,333 @@
+import multiprocessing as mp
+import os
+import queue
+import traceback
+
+import numpy as np
+import torch
+
+from src.actions import ACTION_SIZE, WALL_ACTIONS
+from src.dqn import DQN
+from src.metrics import Metrics
+from src.vec_env import EMPTY_OBSERVATION, VecQuoridorEnv
+
+STATE_SIZE = len(EMPTY_OBSERVATION)
+# Seconds the learner waits for transitions before checking that its actors are still running
+ACTOR_POLL_SECONDS = 1.0
+
+
+def select_actions(models, observations, action_masks, current_player, epsilon, rng,
+                   randomly_move_pawn_probability=0.7):
+    """
+    Epsilon-greedy over the legal actions of a batch of games with a single forward pass per player's model.
+    Like AIPlayer.choose_action_index, exploration prefers pawn moves over walls.
+    :param epsilon: sequence with each player's exploration rate
+    :return: (games,) action indices
+    """
+    actions = np.zeros(len(observations), dtype=np.int64)
+    explore = np.zeros(len(observations), dtype=bool)
+    with torch.no_grad():
+        for player_index, model in enumerate(models):
+            games = np.flatnonzero(current_player == player_index)
+            if games.size == 0:
+                continue
+
+            q_values = model(torch.as_tensor(observations[games], dtype=torch.float32))
+            q_values[~torch.as_tensor(action_masks[games])] = float('-inf')
+            actions[games] = torch.argmax(q_values, dim=1).numpy()
+            explore[games] = rng.random(games.size) <= epsilon[player_index]
+
+    for game in np.flatnonzero(explore):
+        legal_actions = np.flatnonzero(action_masks[game])
+        legal_walls = legal_actions[legal_actions < WALL_ACTIONS]
+        legal_pawn_moves = legal_actions[legal_actions >= WALL_ACTIONS]
+        if legal_walls.size and legal_pawn_moves.size:
+            if rng.random() < randomly_move_pawn_probability:
+                legal_actions = legal_pawn_moves
+            else:
+                legal_actions = legal_walls
+        actions[game] = rng.choice(legal_actions)
+
+    return actions
+
+
+def run_actor(worker_id, games_per_worker, seed, weights_queue, transition_queue, stop_event, error_queue):
+    """
+    Self-play worker. Plays games_per_worker headless games in lockstep with the latest weights received
+    on weights_queue and streams each step's transitions, tagged with the player who moved and carrying the
+    legal action mask of each next state, to the learner. If it fails, its traceback is sent on error_queue
+    for the learner to raise.
+    """
+    try:
+        _play(worker_id, games_per_worker, seed, weights_queue, transition_queue, stop_event)
+    except Exception:
+        error_queue.put((worker_id, traceback.format_exc()))
+        raise
+
+
+def _play(worker_id, games_per_worker, seed, weights_queue, transition_queue, stop_event):
+    torch.set_num_threads(1)
+    # Transitions still buffered at shutdown are not needed, so don't wait for them to be flushed on exit.
+    transition_queue.cancel_join_thread()
+    rng = np.random.default_rng(seed + worker_id)
+    env = VecQuoridorEnv(games_per_worker)
+    models = [DQN(state_size=STATE_SIZE, action_size=ACTION_SIZE) for _ in range(env.total_players)]
+    weights, epsilon = weights_queue.get()
+    _load_weights(models, weights)
+
+    observations, action_masks = env.reset()
+    while not stop_event.is_set():
+        try:
+            weights, epsilon = weights_queue.get_nowait()
+            _load_weights(models, weights)
+        except queue.Empty:
+            pass
+
+        movers = env.current_player.copy()
+        actions = select_actions(models, observations, action_masks, movers, epsilon, rng)
+        next_observations, rewards, dones, info = env.step(actions)
+        transitions = (
+            movers,
+            observations.astype(np.int8),
+            actions,
+            info['final_observations'].astype(np.int8),
+            rewards,
+            dones,
+            info['action_mask'],
+        )
+        # The queue is bounded: when the learner falls behind, actors wait here.
+        while not stop_event.is_set():
+            try:
+                transition_queue.put(transitions, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
+        observations, action_masks = next_observations, info['action_mask']
+
+
+def _load_weights(models, weights):
+    for model, state_dict in zip(models, weights):
+        model.load_state_dict({name: torch.from_numpy(value) for name, value in state_dict.items()})
+
+
+def default_players(model_filenames=None):
+    """
+    The default AIPlayers, each given a brain sized for the VecQuoridorEnv encoding and, if
+    model_filenames ({player index: path}) point to existing checkpoints, loaded from them.
+    """
+    from src.quoridor import Quoridor, QuoridorGym
+
+    players = Quoridor.default_players()
+    for player in players:
+        player.policy_model = DQN(state_size=STATE_SIZE, action_size=ACTION_SIZE)
+        player.target_model = DQN(state_size=STATE_SIZE, action_size=ACTION_SIZE)
+        player.optimizer = torch.optim.Adam(player.policy_model.parameters(), player.lr)
+        if model_filenames and os.path.exists(model_filenames[player.index]):
+            QuoridorGym.load_checkpoints(
+                player.policy_model, player.target_model, player.optimizer, model_filenames[player.index]
+            )
+
+    return players
+
+
+class ActorLearnerTrainer:
+    """
+    Actor/learner self-play training. num_workers processes each run a headless VecQuoridorEnv of
+    games_per_worker games with their own copies of the players' policy models, and stream transitions
+    through a bounded queue to this process, which owns the players' optimizers, replay memories and
+    target networks. Fresh weights and epsilons are broadcast to the actors every broadcast_every learn
+    steps.
+
+    The players are AIPlayers whose models map STATE_SIZE observations to ACTION_SIZE q-values;
+    see default_players. metrics (by default configured from the environment, see src.metrics)
+    instruments the learner process. With a CheckpointManager (checkpoints) the run resumes from its
+    latest checkpoint, if any, and saves the full training state as it goes; total_learn_steps counts
+    the resumed learn steps too.
+    """
+
+    def __init__(
+            self,
+            players,
+            num_workers=4,
+            games_per_worker=16,
+            broadcast_every=25,
+            queue_size=32,
+            batch_size=1000,
+            total_learn_steps=10000,
+            update_target_every=50,
+            seed=0,
+            metrics=None,
+            checkpoints=None
+    ):
+        self.players = players
+        self.num_workers = num_workers
+        self.games_per_worker = games_per_worker
+        self.broadcast_every = broadcast_every
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.total_learn_steps = total_learn_steps
+        self.update_target_every = update_target_every
+        self.seed = seed
+        self.metrics = metrics if metrics is not None else Metrics.from_env()
+        self.checkpoints = checkpoints
+        self.learn_steps = 0
+        # Target networks are synced on each player's own count, since players take turns on learn_steps
+        self.player_learn_steps = [0 for _ in players]
+        self.games_played = 0
+        self.losses = []
+
+    def run(self):
+        checkpoints = self.checkpoints
+        if checkpoints is not None:
+            restored = checkpoints.restore(self.players)
+            if restored is not None:
+                self.learn_steps = restored[1]['learn_steps']
+                self.games_played = restored[1]['games_played']
+                self.player_learn_steps = restored[1].get('player_learn_steps', self.player_learn_steps)
+        checkpointed_losses = len(self.losses)
+
+        context = mp.get_context('spawn')
+        stop_event = context.Event()
+        transition_queue = context.Queue(maxsize=self.queue_size)
+        error_queue = context.Queue()
+        weights_queues = [context.Queue(maxsize=1) for _ in range(self.num_workers)]
+        workers = [
+            context.Process(
+                target=run_actor,
+                args=(worker_id, self.games_per_worker, self.seed, weights_queues[worker_id], transition_queue,
+                      stop_event, error_queue),
+                daemon=True,
+            )
+            for worker_id in range(self.num_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        metrics = self.metrics
+        metrics.start()
+        try:
+            self._broadcast(weights_queues)
+            while self.learn_steps < self.total_learn_steps:
+                with metrics.timer('wait_for_actors'):
+                    transitions = self._get_transitions(transition_queue, workers, error_queue)
+                self._store(transitions)
+                self._learn(weights_queues)
+                player = self.players[0]
+                metrics.gauge('epsilon', player.epsilon)
+                metrics.gauge('buffer_fill', len(player.memory) / player.memory.max_memory_capacity)
+                metrics.maybe_report()
+                if checkpoints is not None and len(self.losses) > checkpointed_losses:
+                    with metrics.timer('checkpoint'):
+                        if checkpoints.maybe_save(self.learn_steps, self.players, self._checkpoint_extra(),
+                                                  self._mean_loss(checkpointed_losses)):
+                            checkpointed_losses = len(self.losses)
+
+            if checkpoints is not None and len(self.losses) > checkpointed_losses:
+                with metrics.timer('checkpoint'):
+                    checkpoints.save(self.learn_steps, self.players, self._checkpoint_extra(),
+                                     self._mean_loss(checkpointed_losses))
+        finally:
+            stop_event.set()
+            self._drain(transition_queue)
+            for worker in workers:
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.terminate()
+            for weights_queue in weights_queues:
+                weights_queue.cancel_join_thread()
+            if checkpoints is not None:
+                checkpoints.close()
+            metrics.close()
+
+    @staticmethod
+    def _get_transitions(transition_queue, workers, error_queue):
+        """
+        Waits for the next transitions, raising instead of hanging if an actor has stopped.
+        """
+        while True:
+            for worker_id, worker in enumerate(workers):
+                if worker.exitcode is not None:
+                    try:
+                        failed_id, details = error_queue.get(timeout=ACTOR_POLL_SECONDS)
+                        details = f"actor {failed_id} failed:\n{details}"
+                    except queue.Empty:
+                        details = f"actor {worker_id} exited with code {worker.exitcode}"
+                    raise RuntimeError(f"Training stopped because {details}")
+            try:
+                return transition_queue.get(timeout=ACTOR_POLL_SECONDS)
+            except queue.Empty:
+                continue
+
+    def _checkpoint_extra(self):
+        return {
+            'learn_steps': self.learn_steps,
+            'player_learn_steps': list(self.player_learn_steps),
+            'games_played': self.games_played,
+        }
+
+    def _mean_loss(self, start):
+        """
+        :return: the mean loss since the start-th learn step of this run, or None if there was none
+        """
+        losses = self.losses[start:]
+        return sum(losses) / len(losses) if losses else None
+
+    def _learn(self, weights_queues):
+        """
+        One learn step for every player with a full enough memory.
+        """
+        metrics = self.metrics
+        for player in self.players:
+            if len(player.memory) < self.batch_size:
+                continue
+
+            with metrics.timer('learn'):
+                loss = player.learn(player.memory.sample_memories(self.batch_size))
+            self.losses.append(loss)
+            metrics.observe('loss', loss)
+            metrics.count('learn_steps')
+            self.learn_steps += 1
+            self.player_learn_steps[player.index] += 1
+            if self.player_learn_steps[player.index] % self.update_target_every == 0:
+                player.update_target_network()
+            if self.learn_steps % self.broadcast_every == 0:
+                with metrics.timer('broadcast'):
+                    self._broadcast(weights_queues)
+
+    def _store(self, transitions):
+        movers, states, actions, next_states, rewards, dones, next_action_masks = transitions
+        self.metrics.count('steps', len(movers))
+        for game in range(len(movers)):
+            mover = self.players[movers[game]]
+            mover.memory.push_memory(
+                states[game], int(actions[game]), next_states[game], float(rewards[game]), bool(dones[game]),
+                next_action_mask=next_action_masks[game]
+            )
+            if dones[game]:
+                self.games_played += 1
+                self.metrics.count('games')
+                for player in self.players:
+                    player.adjust_epsilon()
+
+    def _broadcast(self, weights_queues):
+        weights = [
+            {name: value.detach().cpu().numpy().copy() for name, value in player.policy_model.state_dict().items()}
+            for player in self.players
+        ]
+        epsilon = [player.epsilon for player in self.players]
+        for weights_queue in weights_queues:
+            # Only the newest weights matter, so replace anything the actor has not picked up yet.
+            try:
+                weights_queue.get_nowait()
+            except queue.Empty:
+                pass
+            weights_queue.put((weights, epsilon))
+
+    @staticmethod
+    def _drain(transition_queue):
+        try:
+            while True:
+                transition_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
@@ -0,0 +1,122 @@
+import numpy as np
+import torch
+import torch.nn as nn
+from src.actions import WALL_ACTIONS
+from src.dqn import ExperienceReplay, PrioritizedExperienceReplay
+from src.player import Player
+
+
+class AIPlayer(Player):
+
+    def __init__(
+            self,
+            index,
+            name,
+            position,
+            color,
+            radius,
+            gamma=0.75,
+            epsilon_greedy=1.0,
+            epsilon_min=0.15,
+            epsilon_decay=0.995,
+            learning_rate=1e-3,
+            max_memory_size=2000,
+            prioritized_replay=False,
+            double_dqn=False,
+            huber_loss=False,
+            update_target_every=50,
+            policy_model=None,
+            target_model=None,
+            inference_client=None
+    ):
+        self.max_memory_size = max_memory_size
+        if prioritized_replay:
+            self.memory = PrioritizedExperienceReplay(max_memory_capacity=max_memory_size)
+        else:
+            self.memory = ExperienceReplay(max_memory_capacity=max_memory_size)
+        self.gamma = gamma
+        self.epsilon = epsilon_greedy
+        self.epsilon_min = epsilon_min
+        self.epsilon_decay = epsilon_decay
+        self.lr = learning_rate
+        self.model_store_path = None
+        self.policy_model = policy_model
+        self.target_model = target_model
+        self.double_dqn = double_dqn
+        self.loss_fn = nn.HuberLoss(reduction='none') if huber_loss else nn.MSELoss(reduction='none')
+        self.optimizer = None
+        self.update_target_every = update_target_every
+        self.inference_client = inference_client
+        super(AIPlayer, self).__init__(index, name, position, color, radius, is_ai=True)
+
+    def choose_action_index(self, state, legal_action_mask, game_state=None, randomly_move_pawn_probability=0.7):
+        """
+        Epsilon-greedy over the legal actions; exploration prefers pawn moves over walls.
+        :param legal_action_mask: (ACTION_SIZE,) boolean mask, see QuoridorRulesMixin._get_legal_action_mask
+        :param game_state: unused, the network only sees state; accepted so every AI player is driven alike
+        :return: the chosen action index
+        """
+        if np.random.rand() <= self.epsilon:
+            legal_actions = np.flatnonzero(legal_action_mask)
+            legal_walls = legal_actions[legal_actions < WALL_ACTIONS]
+            legal_pawn_moves = legal_actions[legal_actions >= WALL_ACTIONS]
+            if legal_walls.size and legal_pawn_moves.size:
+                if np.random.rand() < randomly_move_pawn_probability:
+                    legal_actions = legal_pawn_moves
+                else:
+                    legal_actions = legal_walls
+            return int(np.random.choice(legal_actions))
+
+        if self.inference_client is not None:
+            # Batched with other games' requests by an InferenceServer instead of a batch-of-one pass here
+            return self.inference_client.select_action(np.asarray(state), legal_action_mask)
+
+        with torch.no_grad():
+            q_values = self.policy_model(torch.tensor(state, dtype=torch.float32).unsqueeze(0))[0]
+            q_values[~torch.from_numpy(legal_action_mask)] = float('-inf')
+
+        return torch.argmax(q_values).item()
+
+    def learn(self, batch_samples):
+        """
+        One gradient step on a batch from ExperienceReplay.sample_memories, computed as whole-batch
+        tensor operations. The bootstrap target is the largest target-network q-value among the legal
+        next actions (all actions if the batch has no masks) or, with double_dqn, the target network's
+        value of the policy network's choice.
+        :return: the loss
+        """
+        states, actions, next_states, rewards, dones, next_action_masks = batch_samples[:6]
+        with torch.no_grad():
+            next_q_values = self.target_model(next_states)
+            if self.double_dqn:
+                next_policy_q_values = self.policy_model(next_states)
+                if next_action_masks is not None:
+                    next_policy_q_values[~next_action_masks] = float('-inf')
+                next_actions = next_policy_q_values.argmax(dim=1, keepdim=True)
+                next_values = next_q_values.gather(1, next_actions).squeeze(1)
+            else:
+                if next_action_masks is not None:
+                    next_q_values[~next_action_masks] = float('-inf')
+                next_values = next_q_values.max(dim=1).values
+            # Terminal states have no legal actions to bootstrap from
+            targets = torch.where(dones, rewards, rewards + self.gamma * next_values)
+
+        self.optimizer.zero_grad()
+        pred = self.policy_model(states).gather(1, actions.unsqueeze(1)).squeeze(1)
+        losses = self.loss_fn(pred, targets)
+        if batch_samples.weight is None:
+            loss = losses.mean()
+        else:
+            loss = (batch_samples.weight * losses).mean()
+            self.memory.update_priorities(batch_samples.index, (targets - pred).detach().numpy())
+        loss.backward()
+        self.optimizer.step()
+
+        return loss.item()
+
+    def update_target_network(self):
+        self.target_model.load_state_dict(self.policy_model.state_dict())
+
+    def adjust_epsilon(self):
+        if self.epsilon > self.epsilon_min:
+            self.epsilon *= self.epsilon_decay
@@ -0,0 +1,238 @@
+"""
+Benchmark suite for the rules, the state encoding and the training loop, run with
+`python -m quoridor bench suite`.
+
+Per position benchmarks run on three fixed-seed positions (see POSITIONS) reached through the real
+Quoridor board, so the sprite bookkeeping is in the measured path. Every result is an operations per
+second rate (steps/s, games/s, ...) and is compared against a baseline JSON: a rate that drops more
+than the tolerance below its baseline is a regression.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from src.actions import WALL_ACTIONS
+from src.constants import STARTING_WALLS
+from src.game_state import GameState
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmark_baseline.json')
+# Position name -> (walls placed before the position is reached, seed)
+POSITIONS = {
+    'opening': (0, 0),
+    'midgame': (12, 1),
+    'late': (2 * STARTING_WALLS, 2),
+}
+
+
+def scripted_actions(walls_placed, seed, wall_probability=0.7):
+    """
+    Plays seeded random moves from the starting position until walls_placed walls are on the board,
+    never letting a pawn reach its goal.
+    :return: the list of actions played (encoded as in src.actions)
+    """
+    rng = np.random.default_rng(seed)
+    state = GameState()
+    actions = []
+    while bin(state.placed_walls).count('1') < walls_placed:
+        mover = state.current_player
+        legal_actions = np.flatnonzero(state.legal_action_mask())
+        legal_walls = legal_actions[legal_actions < WALL_ACTIONS]
+        pawn_moves = [action for action in legal_actions[legal_actions >= WALL_ACTIONS]
+                      if not _is_winning_move(state, mover, action)]
+        if legal_walls.size and (not pawn_moves or rng.random() < wall_probability):
+            action = int(rng.choice(legal_walls))
+        elif pawn_moves:
+            action = int(rng.choice(pawn_moves))
+        else:
+            raise ValueError(f"Seed {seed} reached a position with only winning moves; try another seed")
+
+        state.apply_move(action)
+        actions.append(action)
+
+    return actions
+
+
+def _is_winning_move(state, mover, action):
+    state.apply_move(int(action))
+    is_winner = state.is_winner(mover)
+    state.undo_move()
+    return is_winner
+
+
+def measure(function, min_time=0.2, repeats=3):
+    """
+    Calls function in a loop for at least min_time seconds, repeats times.
+    :return: the best calls per second over the repeats
+    """
+    best_rate = 0.0
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            function()
+            calls += 1
+            elapsed = time.perf_counter() - start
+        best_rate = max(best_rate, calls / elapsed)
+
+    return best_rate
+
+
+class BenchmarkSuite:
+    """
+    Builds a QuoridorGym (with a dummy display) whose AIPlayers have untrained DQNs and measures:
+        <position>/legal_pawn_moves: QuoridorRulesMixin._get_legal_pawn_moves
+        <position>/legal_walls: QuoridorRulesMixin._get_legal_walls with an empty LegalWallCache
+        <position>/check_viable_path: Board.check_viable_path with an empty DistanceMapCache
+        <position>/get_state: Board.get_state
+        <position>/choose_action_index: AIPlayer.choose_action_index (greedy, i.e. a forward pass)
+        gym_step: QuoridorGym._step with random (epsilon 1) players, restarting finished games
+        learn: AIPlayer.learn on batches of batch_size transitions
+        engine_games: headless random games on a GameState, in games/s
+    """
+
+    def __init__(self, min_time=0.2, repeats=3, batch_size=256, seed=0):
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+        import torch
+        from src.metrics import Metrics
+        from src.quoridor import QuoridorGym
+
+        torch.manual_seed(seed)
+        np.random.seed(seed)
+        self.min_time = min_time
+        self.repeats = repeats
+        self.batch_size = batch_size
+        self.seed = seed
+        # Instrumented as in training, with nowhere to report to
+        self.gym = QuoridorGym(metrics=Metrics())
+
+    def run(self):
+        """
+        :return: dict of benchmark name -> operations per second
+        """
+        results = {}
+        for name, (walls_placed, seed) in POSITIONS.items():
+            self._set_up_position(scripted_actions(walls_placed, seed))
+            for benchmark, rate in self._position_benchmarks().items():
+                results[f'{name}/{benchmark}'] = rate
+
+        results['gym_step'] = self._gym_step()
+        results['learn'] = self._learn()
+        results['engine_games'] = self._engine_games()
+        return results
+
+    def _set_up_position(self, actions):
+        gym = self.gym
+        gym._reset_env()
+        for action in actions:
+            gym._apply_action(gym.players[gym.board.state.current_player], action)
+
+    def _position_benchmarks(self):
+        from src.legal_wall_cache import LegalWallCache
+
+        gym = self.gym
+        board = gym.board
+        player = gym.players[board.state.current_player]
+        player_center = board.cell_to_coordinates(board.state.pawns[player.index])
+        state = board.get_state()
+        legal_action_mask = gym._get_legal_action_mask(player)
+
+        def legal_walls():
+            gym.legal_wall_cache = LegalWallCache()
+            gym._get_legal_walls()
+
+        def check_viable_path():
+            board.distance_maps.clear()
+            board.check_viable_path(player.index, player_center)
+
+        epsilon = player.epsilon
+        player.epsilon = 0
+        try:
+            return {
+                'legal_pawn_moves': self._measure(lambda: gym._get_legal_pawn_moves(player)),
+                'legal_walls': self._measure(legal_walls),
+                'check_viable_path': self._measure(check_viable_path),
+                'get_state': self._measure(board.get_state),
+                'choose_action_index': self._measure(lambda: player.choose_action_index(state, legal_action_mask)),
+            }
+        finally:
+            player.epsilon = epsilon
+
+    def _gym_step(self):
+        gym = self.gym
+        gym._reset_env()
+        turn = [0]
+
+        def step():
+            current_player = gym.players[turn[0]]
+            *_, done = gym._step(current_player)
+            turn[0] = 0 if done else (turn[0] + 1) % len(gym.players)
+            if done:
+                gym._reset_env()
+
+        return self._measure(step)
+
+    def _learn(self):
+        gym = self.gym
+        player = gym.players[0]
+        rng = np.random.default_rng(self.seed)
+        state_size = len(gym.board.get_state())
+        for _ in range(max(self.batch_size, 1000)):
+            state = rng.integers(0, 30, state_size)
+            next_state = rng.integers(0, 30, state_size)
+            player.memory.push_memory(
+                state, int(rng.integers(WALL_ACTIONS)), next_state, -0.1, bool(rng.random() < 0.05),
+            )
+
+        return self._measure(lambda: player.learn(player.memory.sample_memories(self.batch_size)))
+
+    def _engine_games(self):
+        from src.evaluation import make_agent, play_match
+
+        agents = [make_agent('random', seed=self.seed), make_agent('random', seed=self.seed + 1)]
+        return self._measure(lambda: play_match(agents, games=1))
+
+    def _measure(self, function):
+        return measure(function, self.min_time, self.repeats)
+
+
+def load_baseline(filename=DEFAULT_BASELINE):
+    """
+    :return: the baseline rates, or {} if there is no baseline yet
+    """
+    if not os.path.exists(filename):
+        return {}
+
+    with open(filename) as file:
+        return json.load(file)['results']
+
+
+def save_baseline(results, filename=DEFAULT_BASELINE):
+    with open(filename, 'w') as file:
+        json.dump({'results': results}, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def compare(results, baseline):
+    """
+    :return: list of (name, rate, baseline rate, ratio) for every benchmark, in the order of results;
+    the baseline rate and ratio are None for benchmarks missing from the baseline
+    """
+    comparison = []
+    for name, rate in results.items():
+        baseline_rate = baseline.get(name)
+        ratio = None if not baseline_rate else rate / baseline_rate
+        comparison.append((name, rate, baseline_rate, ratio))
+
+    return comparison
+
+
+def regressions(comparison, tolerance=0.3):
+    """
+    :param tolerance: fraction a rate may drop below its baseline before it counts as a regression
+    :return: names of the regressed benchmarks
+    """
+    return [name for name, _, _, ratio in comparison if ratio is not None and ratio < 1 - tolerance]
@@ -6,23 +6,61 @@ from pygame.rect import Rect
 
 from src.node import Node
 from src.wall import Wall
-from src.constants import DISTANCE, HALF_DISTANCE, SPACES, TERMINAL_NODE_Y, x
+from src.constants import CELL, DISTANCE, HALF_DISTANCE, SMALL_CELL, SPACES, SQUARES, TOTAL_CELLS, WALL_SQUARES, x
 from src.directions import Direction
+from src.distance_maps import DistanceMapCache
+from src.game_state import UNREACHABLE, GameState, wall_index, wall_position
+
+
+def _build_pixel_slots():
+    """
+    :return: array mapping a pixel coordinate along either axis to the index of the board slot (even
+    for nodes, odd for wall gaps) whose sprites cover it, or -1 outside the board
+    """
+    pixel_slots = np.full(int(x[-1] + DISTANCE), -1, dtype=np.int64)
+    for slot, center in enumerate(x):
+        half_width = CELL // 2 if slot % 2 == 0 else SMALL_CELL // 2
+        pixel_slots[int(center) - half_width:int(center) + half_width] = slot
+
+    return pixel_slots
+
+
+PIXEL_SLOTS = _build_pixel_slots()
 
 
 class Board:
     """
-    Represents the game board. Responsible for maintaining state
-    pertaining to the game board as well as calculating and providing
-    information pertaining to said state.
+    Represents the game board. The rules-relevant state lives in a headless
+    GameState; the board is a view over it, translating between pixel
+    coordinates and engine cells/walls and keeping the sprites in sync.
 
     Specifically, maintains the following types of objects:
     1. Nodes
     2. Walls
     """
 
-    def __init__(self):
+    def __init__(self, state=None, distance_maps=None):
+        self.state = state if state is not None else GameState()
+        self.distance_maps = distance_maps if distance_maps is not None else DistanceMapCache()
         self.nodes, self.walls = self._construct_board()
+        self._index_board()
+        for cell in self.state.pawns:
+            self.get_node(cell).is_occupied = True
+
+    def reset(self):
+        """
+        Restores the starting position in place: the state is reset, placed walls are split back into
+        their segments and killed segments rejoin the wall group, without allocating any new sprites.
+        """
+        self.state.reset()
+        for wall in self._walls_by_center.values():
+            if wall.is_occupied or not wall.alive():
+                wall.reset()
+                self.walls.add(wall)
+
+        occupied_cells = set(self.state.pawns)
+        for cell, node in enumerate(self._nodes_by_cell):
+            node.is_occupied = cell in occupied_cells
 
     def _construct_board(self) -> Tuple[list[Node], list[Wall]]:
         nodes = Group()
@@ -39,6 +77,41 @@ class Board:
                     walls.add(Wall(position=(x_coord, y_coord), is_vertical=True))
         return nodes, walls
 
+    def _index_board(self):
+        """
+        Builds the grid index once per board so that sprite lookups are constant time:
+            1. node and wall sprites keyed by their (original) centers
+            2. node sprites keyed by engine cell
+            3. for every node, the neighbouring node and wall in each direction
+        """
+        self._nodes_by_center = {node.rect.center: node for node in self.nodes}
+        self._walls_by_center = {wall.rect.center: wall for wall in self.walls}
+        self._nodes_by_cell = [self._nodes_by_center[self.cell_to_coordinates(cell)] for cell in range(TOTAL_CELLS)]
+        self._surroundings = {}
+        for center in self._nodes_by_center:
+            self._surroundings[center] = {
+                direction: (
+                    self._nodes_by_center.get(
+                        self.add_coordinates(center, Node.get_coordinates_in_direction(direction))
+                    ),
+                    self._walls_by_center.get(
+                        self.add_coordinates(center, Wall.get_coordinates_in_direction(direction))
+                    ),
+                )
+                for direction in Direction
+            }
+
+    @staticmethod
+    def _as_free_segment(wall):
+        """
+        Placed walls are merged into their anchor sprite (whose rect moves) and the adjacent segment
+        is killed; neither can be found at its original center any more.
+        """
+        if wall and wall.alive() and wall.rect.center == wall.position:
+            return wall
+
+        return None
+
     def get_adjacent_wall(self, wall: Wall):
         if wall.is_vertical:
             direction_vector = Direction.get_offset(Direction.DOWN, DISTANCE)
@@ -46,9 +119,9 @@ class Board:
             direction_vector = Direction.get_offset(Direction.RIGHT, DISTANCE)
 
         coordinate_to_search = self.add_coordinates(direction_vector, wall.rect.center)
-        for wall in self.walls:
-            if wall.position == coordinate_to_search:
-                return wall
+        adjacent_wall = self._walls_by_center.get(coordinate_to_search)
+        if adjacent_wall and adjacent_wall.alive():
+            return adjacent_wall
 
         return None
 
@@ -57,68 +130,23 @@ class Board:
         return rect.collideobjects(existing_walls)
 
     def check_viable_path(self, player_index: int, player_center):
-        seen = {}
-        terminal_y_coord = TERMINAL_NODE_Y[player_index]
-        stack = [player_center]
-        while len(stack) > 0:
-            vertex = stack.pop()
-            if vertex not in seen:
-                current_vertex = vertex
-                seen[current_vertex] = True
-                stack.append(current_vertex)
-                neighbors = self.get_nodes_around_node(current_vertex)
-                walls_between_neighbors = self.get_walls_around_node(current_vertex)
-                valid_neighbors = []
-                for direction, wall in walls_between_neighbors.items():
-                    if wall and not wall.is_occupied:
-                        valid_neighbors.append(neighbors[direction])
-
-                for neighboring_node in valid_neighbors:
-                    if neighboring_node.position not in seen:
-                        if neighboring_node.position[1] == terminal_y_coord:
-                            return True
-                        else:
-                            stack.append(neighboring_node.position)
-
-        return False
-
-    def get_state(self, players):
-        """
-        Represents the board as 17 X 17 (SPACES X SPACES) matrix with the following notation:
-            2 = all unoccupied walls
-            1 = all occupied walls
-            0 = all unoccupied nodes
-            player number * 10 = player position (and thus the only occupied nodes)
-        :return: matrix
-        """
-        game_state = np.full((SPACES, SPACES), 2)
-
-        for wall in self.walls:
-            normalized_coordinates = self.normalize_coordinates(wall.rect.center)
-            if wall.is_occupied:
-                x_coord = normalized_coordinates[0]
-                y_coord = normalized_coordinates[1]
-                if wall.is_vertical:
-                    game_state[x_coord, y_coord + 1] = 1
-                    game_state[x_coord, y_coord - 1] = 1
-                    game_state[normalized_coordinates] = 1
-                else:
-                    game_state[x_coord + 1, y_coord] = 1
-                    game_state[x_coord - 1, y_coord] = 1
-                    game_state[normalized_coordinates] = 1
-            else:
-                game_state[normalized_coordinates] = 2
-
-        for node in self.nodes:
-            normalized_coordinates = self.normalize_coordinates(node.rect.center)
-            if not node.is_occupied:
-                game_state[normalized_coordinates] = 0
-
-        for player in players:
-            normalized_coordinates = self.normalize_coordinates(player.rect.center)
-            game_state[normalized_coordinates] = player.matrix_representation
-
-        return game_state.flatten()
+        distance_map = self.distance_maps.get(self.state, player_index)
+        return distance_map[self.coordinates_to_cell(player_center)] != UNREACHABLE
+
+    def distance_map(self, player):
+        """
+        :return: tuple indexed by cell with the number of steps to the player's goal row, or UNREACHABLE
+        """
+        return self.distance_maps.get(self.state, player.index)
+
+    def distance_to_goal(self, player):
+        return self.distance_map(player)[self.state.pawns[player.index]]
+
+    def get_state(self):
+        """
+        :return: the flattened 17 X 17 matrix representation of the game (see GameState.get_state)
+        """
+        return self.state.get_state()
 
     @staticmethod
     def normalize_coordinates(coords, distance=HALF_DISTANCE):
@@ -131,30 +159,85 @@ class Board:
 
         return tuple((x, y))
 
+    @classmethod
+    def coordinates_to_cell(cls, coords):
+        x_coord, y_coord = cls.normalize_coordinates(coords)
+        return (y_coord // 2) * SQUARES + x_coord // 2
+
+    @staticmethod
+    def cell_to_coordinates(cell):
+        row, col = divmod(cell, SQUARES)
+        return int(x[2 * col]), int(x[2 * row])
+
+    @classmethod
+    def coordinates_to_wall(cls, coords):
+        """
+        :return: the engine wall index anchored at coords, or None if no wall can be anchored there
+        """
+        x_coord, y_coord = cls.normalize_coordinates(coords)
+        col, row = x_coord // 2, y_coord // 2
+        if x_coord % 2 == 0 and y_coord % 2 == 1 and col < WALL_SQUARES:  # Horizontal wall
+            return wall_index(col, row)
+        elif x_coord % 2 == 1 and y_coord % 2 == 0 and row < WALL_SQUARES:  # Vertical wall
+            return wall_index(col, row, is_vertical=True)
+
+        return None
+
+    @staticmethod
+    def wall_to_coordinates(wall):
+        col, row, is_vertical = wall_position(wall)
+        if is_vertical:
+            return int(x[2 * col + 1]), int(x[2 * row])
+
+        return int(x[2 * col]), int(x[2 * row + 1])
+
+    def get_wall_sprite(self, wall):
+        """
+        :return: the sprite anchoring the engine wall, placed or not
+        """
+        return self._walls_by_center[self.wall_to_coordinates(wall)]
+
+    def get_node(self, cell):
+        return self._nodes_by_cell[cell]
+
+    def get_node_at(self, coords):
+        return self._nodes_by_center.get(tuple(coords))
+
+    def get_wall_at(self, coords):
+        """
+        :return: the unplaced wall segment centered at coords, or None
+        """
+        return self._as_free_segment(self._walls_by_center.get(tuple(coords)))
+
+    def get_wall_at_pixel(self, pixel):
+        """
+        Hit-tests the wall segments with a grid lookup instead of testing every sprite.
+        :return: the unplaced wall segment whose sprite covers pixel, or None
+        """
+        x_pixel, y_pixel = int(pixel[0]), int(pixel[1])
+        if not (0 <= x_pixel < len(PIXEL_SLOTS) and 0 <= y_pixel < len(PIXEL_SLOTS)):
+            return None
+
+        x_slot, y_slot = PIXEL_SLOTS[x_pixel], PIXEL_SLOTS[y_pixel]
+        if x_slot < 0 or y_slot < 0 or x_slot % 2 == y_slot % 2:
+            return None
+
+        return self.get_wall_at((int(x[x_slot]), int(x[y_slot])))
+
     def get_walls_around_node(self, node_coordinates, directions=Direction):
+        surroundings = self._surroundings.get(tuple(node_coordinates), {})
         walls_around_node = {}
         for direction in directions:
-            wall_vector = Wall.get_coordinates_in_direction(direction=direction)
-            wall_coords = self.add_coordinates(node_coordinates, wall_vector)
-            wall = next(
-                (wall for wall in self.walls if wall.rect.center == wall_coords),
-                None
-            )
-
-            walls_around_node[direction] = wall
+            _, wall = surroundings.get(direction, (None, None))
+            walls_around_node[direction] = self._as_free_segment(wall)
 
         return walls_around_node
 
     def get_nodes_around_node(self, node_coordinates, directions=Direction):
+        surroundings = self._surroundings.get(tuple(node_coordinates), {})
         nodes_around_node = {}
         for direction in directions:
-            node_vector = Node.get_coordinates_in_direction(direction=direction)
-            node_coords = self.add_coordinates(node_coordinates, node_vector)
-            node = next(
-                (node for node in self.nodes if node.rect.center == node_coords),
-                None
-            )
-
+            node, _ = surroundings.get(direction, (None, None))
             nodes_around_node[direction] = node
 
         return nodes_around_node
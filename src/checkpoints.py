@@ -0,0 +1,237 @@
+"""
+Checkpoints of the complete training state, so a long run can stop and carry on where it left off
+without warming up its replay memories again.
+
+Each checkpoint is a directory <directory>/checkpoint-<step>/ holding:
+    training_state.pt: per player the policy and target weights, optimizer state and epsilon, the
+        replay memories' cursors, the python/numpy/torch RNG states and the caller's extra counters
+    memory-<player>.<array>.npy: the replay memories' arrays (see ExperienceReplay.state_dict), which
+        are memory-mapped again on restore
+and <directory>/checkpoints.json lists the checkpoints kept with their step and score.
+"""
+import copy
+import json
+import os
+import random
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+INDEX_FILE = 'checkpoints.json'
+STATE_FILE = 'training_state.pt'
+
+
+class CheckpointManager:
+    """
+    Saves on a step and/or time interval (maybe_save) or on demand (save). The training thread only takes
+    a snapshot (CPU copies of the state dicts and replay arrays); serialising it to disk happens on a
+    background thread, one checkpoint at a time. Checkpoints are written to a temporary directory and
+    renamed into place, so a crash never leaves a half written one behind.
+
+    The keep_last most recent checkpoints are kept, plus the keep_best with the best score (the lowest,
+    or the highest with higher_is_better); the rest are deleted.
+    """
+
+    def __init__(
+            self,
+            directory,
+            every_steps=None,
+            every_seconds=None,
+            keep_last=3,
+            keep_best=1,
+            higher_is_better=False
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.higher_is_better = higher_is_better
+        self.index = self._read_index()
+        self._last_step = None
+        self._last_time = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint')
+        self._pending = None
+
+    def maybe_save(self, step, players, extra=None, score=None):
+        """
+        Saves if every_steps steps or every_seconds seconds have passed since the last save (or since
+        the manager was created).
+        :return: True if a checkpoint was started
+        """
+        steps_due = self.every_steps is not None and step - (self._last_step or 0) >= self.every_steps
+        time_due = self.every_seconds is not None and time.monotonic() - self._last_time >= self.every_seconds
+        if not (steps_due or time_due) or step == self._last_step:
+            return False
+
+        self.save(step, players, extra, score)
+        return True
+
+    def save(self, step, players, extra=None, score=None):
+        """
+        Snapshots the players' training state and writes it in the background. Waits for the previous
+        checkpoint to finish first, so at most one snapshot is held in memory.
+        :param extra: JSON-like counters of the training loop, handed back by restore
+        :param score: how good the players are at this step, used to keep the best checkpoints
+        """
+        self.wait()
+        snapshot = {
+            'step': step,
+            'extra': extra or {},
+            'players': [_player_state(player) for player in players],
+            'memories': [player.memory.state_dict() for player in players],
+            'rng': {
+                'python': random.getstate(),
+                'numpy': np.random.get_state(),
+                'torch': torch.get_rng_state(),
+            },
+        }
+        self._last_step = step
+        self._last_time = time.monotonic()
+        self._pending = self._executor.submit(self._write, snapshot, score)
+
+    def wait(self):
+        """
+        Blocks until the checkpoint being written, if any, is on disk; re-raises its error if it failed.
+        """
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+
+    def latest(self):
+        """
+        :return: path of the most recent checkpoint, or None
+        """
+        if not self.index:
+            return None
+
+        return os.path.join(self.directory, max(self.index, key=lambda entry: entry['step'])['name'])
+
+    def best(self):
+        """
+        :return: path of the best scored checkpoint, or None
+        """
+        scored = [entry for entry in self.index if entry['score'] is not None]
+        if not scored:
+            return None
+
+        best = max(scored, key=self._rank) if self.higher_is_better else min(scored, key=self._rank)
+        return os.path.join(self.directory, best['name'])
+
+    def restore(self, players, path=None):
+        """
+        Loads a checkpoint (the latest by default) into the players: models, target models, optimizers,
+        epsilon and replay memories, and restores the global RNG states.
+        :return: (step, extra) of the checkpoint, or None if there is none
+        """
+        self.wait()
+        path = path or self.latest()
+        if path is None:
+            return None
+
+        state = torch.load(os.path.join(path, STATE_FILE), weights_only=False)
+        if len(state['players']) != len(players):
+            raise ValueError(f"The checkpoint holds {len(state['players'])} players but {len(players)} were given")
+
+        for index, (player, player_state, memory_state) in enumerate(zip(players, state['players'], state['memories'])):
+            player.policy_model.load_state_dict(player_state['policy_model'])
+            player.target_model.load_state_dict(player_state['target_model'])
+            player.optimizer.load_state_dict(player_state['optimizer'])
+            player.epsilon = player_state['epsilon']
+            for name in memory_state.pop('arrays'):
+                memory_state[name] = np.load(os.path.join(path, f'memory-{index}.{name}.npy'), mmap_mode='r')
+            player.memory.load_state_dict(memory_state)
+
+        random.setstate(state['rng']['python'])
+        np.random.set_state(state['rng']['numpy'])
+        torch.set_rng_state(state['rng']['torch'])
+        self._last_step = state['step']
+        self._last_time = time.monotonic()
+        return state['step'], state['extra']
+
+    def _write(self, snapshot, score):
+        name = f"checkpoint-{snapshot['step']:09d}"
+        path = os.path.join(self.directory, name)
+        temporary_path = f'{path}.tmp'
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        os.makedirs(temporary_path)
+        for index, memory_state in enumerate(snapshot['memories']):
+            arrays = [name for name, value in memory_state.items() if isinstance(value, np.ndarray)]
+            for array in arrays:
+                np.save(os.path.join(temporary_path, f'memory-{index}.{array}.npy'), memory_state.pop(array))
+            memory_state['arrays'] = arrays
+        torch.save(snapshot, os.path.join(temporary_path, STATE_FILE))
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temporary_path, path)
+        self.index = [entry for entry in self.index if entry['name'] != name]
+        self.index.append({'name': name, 'step': snapshot['step'], 'score': score, 'time': time.time()})
+        self._prune()
+        self._write_index()
+
+    def _prune(self):
+        keep = {entry['name'] for entry in sorted(self.index, key=lambda entry: entry['step'])[-self.keep_last:]}
+        if self.keep_last <= 0:
+            keep = set()
+        scored = sorted((entry for entry in self.index if entry['score'] is not None), key=self._rank,
+                        reverse=self.higher_is_better)
+        keep.update(entry['name'] for entry in scored[:self.keep_best])
+        for entry in self.index:
+            if entry['name'] not in keep:
+                shutil.rmtree(os.path.join(self.directory, entry['name']), ignore_errors=True)
+        self.index = [entry for entry in self.index if entry['name'] in keep]
+
+    @staticmethod
+    def _rank(entry):
+        return entry['score']
+
+    def _read_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return []
+
+        with open(path) as file:
+            return json.load(file)
+
+    def _write_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(self.index, file, indent=2)
+        os.replace(f'{path}.tmp', path)
+
+
+def _player_state(player):
+    return {
+        'policy_model': _cpu_copy(player.policy_model.state_dict()),
+        'target_model': _cpu_copy(player.target_model.state_dict()),
+        'optimizer': _cpu_copy(player.optimizer.state_dict()),
+        'epsilon': player.epsilon,
+    }
+
+
+def _cpu_copy(state_dict):
+    """
+    :return: a deep copy of a state dict with every tensor detached and moved to the CPU
+    """
+    return copy.deepcopy(state_dict, memo={
+        id(value): value.detach().to('cpu', copy=True) for value in _iter_tensors(state_dict)
+    })
+
+
+def _iter_tensors(value):
+    if isinstance(value, torch.Tensor):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _iter_tensors(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _iter_tensors(item)
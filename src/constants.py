@@ -19,3 +19,9 @@ GRAY = (200, 200, 200)
 SEMI_BLACK = (0, 0, 0, 128)
 DEFAULT_FONT_SIZE = 32
 WALL_EDGE_COORD = x[-1]
+WALL_SQUARES = SQUARES - 1  # Walls are anchored between squares
+TOTAL_CELLS = SQUARES * SQUARES
+TOTAL_WALL_SLOTS = WALL_SQUARES * WALL_SQUARES
+GOAL_ROWS = [SQUARES - 1, 0]
+STARTING_CELLS = [SQUARES // 2, TOTAL_CELLS - SQUARES // 2 - 1]
+STARTING_WALLS = 10
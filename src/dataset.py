@@ -0,0 +1,259 @@
+"""
+Offline datasets of transitions built from recorded games (see src.game_record), stored as sharded .npy
+arrays that are memory-mapped when read, so training can stream datasets far larger than RAM without
+replaying the engine.
+
+A dataset directory holds dataset.json (the shard sizes and the reward settings) and, per shard,
+<shard>.<array>.npy for each array in ARRAYS:
+    states, next_states: (n, STATE_SIZE) int8 GameState.get_state observations before and after the move
+    actions: (n,) int16 actions (see src.actions)
+    rewards: (n,) float32 rewards for the mover, as in QuoridorGym
+    dones: (n,) bool, True for winning moves
+    players: (n,) int8 index of the player who made the move
+    action_masks: (n, ACTION_SIZE) bool legal actions in states
+    next_action_masks: (n, ACTION_SIZE) bool legal actions in next_states (all False after a win), the
+        masks AIPlayer.learn bootstraps over
+"""
+import json
+import os
+import warnings
+
+import numpy as np
+
+from src.actions import ACTION_SIZE
+from src.constants import SQUARES
+from src.distance_maps import DistanceMapCache
+from src.game_record import Replayer
+from src.legal_wall_cache import LegalWallCache
+
+METADATA_FILE = 'dataset.json'
+ARRAYS = ('states', 'actions', 'rewards', 'next_states', 'dones', 'action_masks', 'next_action_masks', 'players')
+
+
+class DatasetWriter:
+    """
+    Buffers transitions in preallocated arrays and writes them out as a shard every
+    transitions_per_shard transitions, so memory use stays bounded whatever the dataset size.
+    """
+
+    def __init__(self, directory, state_size, transitions_per_shard=2 ** 16, step_reward=-0.1, win_reward=10):
+        if os.path.exists(os.path.join(directory, METADATA_FILE)):
+            raise ValueError(f"{directory} already holds a dataset; build into a new directory")
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.transitions_per_shard = transitions_per_shard
+        self.metadata = {'shards': [], 'state_size': state_size, 'step_reward': step_reward, 'win_reward': win_reward}
+        self._buffers = {
+            'states': np.zeros((transitions_per_shard, state_size), dtype=np.int8),
+            'actions': np.zeros(transitions_per_shard, dtype=np.int16),
+            'rewards': np.zeros(transitions_per_shard, dtype=np.float32),
+            'next_states': np.zeros((transitions_per_shard, state_size), dtype=np.int8),
+            'dones': np.zeros(transitions_per_shard, dtype=np.bool_),
+            'action_masks': np.zeros((transitions_per_shard, ACTION_SIZE), dtype=np.bool_),
+            'next_action_masks': np.zeros((transitions_per_shard, ACTION_SIZE), dtype=np.bool_),
+            'players': np.zeros(transitions_per_shard, dtype=np.int8),
+        }
+        self._size = 0
+
+    def add(self, state, action, reward, next_state, done, action_mask, next_action_mask, player):
+        buffers = self._buffers
+        index = self._size
+        buffers['states'][index] = state
+        buffers['actions'][index] = action
+        buffers['rewards'][index] = reward
+        buffers['next_states'][index] = next_state
+        buffers['dones'][index] = done
+        buffers['action_masks'][index] = action_mask
+        buffers['next_action_masks'][index] = next_action_mask
+        buffers['players'][index] = player
+        self._size += 1
+        if self._size == self.transitions_per_shard:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered transitions as a new shard and updates dataset.json.
+        """
+        if not self._size:
+            return
+
+        name = f"shard-{len(self.metadata['shards']):05d}"
+        for array in ARRAYS:
+            np.save(os.path.join(self.directory, f'{name}.{array}.npy'), self._buffers[array][:self._size])
+        self.metadata['shards'].append({'name': name, 'size': self._size})
+        self._write_metadata()
+        self._size = 0
+
+    def close(self):
+        """
+        Writes the last shard; a dataset without transitions still gets its dataset.json, so it can be opened.
+        """
+        self.flush()
+        if not self.metadata['shards']:
+            self._write_metadata()
+
+    def _write_metadata(self):
+        with open(os.path.join(self.directory, METADATA_FILE), 'w') as file:
+            json.dump(self.metadata, file, indent=2)
+
+
+def build_dataset(records, directory, transitions_per_shard=2 ** 16, step_reward=-0.1, win_reward=10):
+    """
+    Replays every record (which validates its moves) and writes one transition per move.
+    :param records: iterable of GameRecords, e.g. src.game_record.iter_records(paths)
+    :return: the number of transitions written
+    """
+    replayer = Replayer()
+    legal_wall_cache = LegalWallCache()
+    distance_maps = DistanceMapCache()
+    writer = DatasetWriter(directory, len(replayer.state.get_state()), transitions_per_shard, step_reward, win_reward)
+    transitions = 0
+    for record in records:
+        states = []
+        masks = []
+        for state, _ in replayer.positions(record):
+            states.append(state.get_state())
+            masks.append(_legal_action_mask(state, legal_wall_cache))
+        if not states:
+            continue
+
+        state = replayer.state
+        states.append(state.get_state())
+        masks.append(np.zeros(ACTION_SIZE, dtype=bool) if record.winner is not None
+                     else _legal_action_mask(state, legal_wall_cache))
+
+        last = len(record.actions) - 1
+        for ply, action in enumerate(record.actions):
+            done = ply == last and record.winner is not None
+            reward = step_reward
+            if done:
+                opponent = (record.winner + 1) % state.total_players
+                opponent_distance = distance_maps.get(state, opponent)[state.pawns[opponent]]
+                reward = win_reward * min(opponent_distance / (SQUARES - 1), 1)
+            mover = ply % state.total_players
+            writer.add(states[ply], action, reward, states[ply + 1], done, masks[ply], masks[ply + 1], mover)
+        transitions += len(record.actions)
+
+    writer.close()
+    return transitions
+
+
+def _legal_action_mask(state, legal_wall_cache):
+    player = state.current_player
+    legal_walls = legal_wall_cache.get_legal_walls(state) if state.walls_left[player] > 0 else []
+    return state.legal_action_mask(player, legal_walls=legal_walls)
+
+
+class OfflineDataset:
+    """
+    Read side of a dataset directory. Shards are opened as copy-on-write memory maps: nothing is read
+    until it is indexed, pages come straight from the file and the arrays are never written back.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, METADATA_FILE)) as file:
+            self.metadata = json.load(file)
+        self.directory = directory
+        for shard in self.metadata['shards']:
+            if not os.path.exists(os.path.join(directory, f"{shard['name']}.players.npy")):
+                raise ValueError(f"{directory} was built without the movers of its transitions; rebuild it")
+        self.shards = [
+            {array: np.load(os.path.join(directory, f"{shard['name']}.{array}.npy"), mmap_mode='c') for array in ARRAYS}
+            for shard in self.metadata['shards']
+        ]
+
+    def __len__(self):
+        return sum(shard['size'] for shard in self.metadata['shards'])
+
+    def iter_arrays(self, batch_size, shuffle=True, seed=None, drop_last=False, player=None):
+        """
+        Streams the dataset once as dicts of numpy batches keyed by ARRAYS. With shuffle the shards are
+        visited in random order and each batch draws random rows of a shard, read in file order;
+        otherwise batches are consecutive rows, as views of the memory maps where they lie in one shard.
+        Rows left over at the end of a shard start the next batch, so with drop_last only the final
+        partial batch of the whole stream is dropped.
+        :param player: only stream the moves of this player
+        """
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(self.shards)) if shuffle else range(len(self.shards))
+        contiguous = not shuffle and player is None
+        pending = None
+        for shard_index in order:
+            shard = self.shards[shard_index]
+            rows = rng.permutation(len(shard['actions'])) if shuffle else np.arange(len(shard['actions']))
+            if player is not None:
+                rows = rows[shard['players'][rows] == player]
+            start = 0
+            if pending is not None:
+                start = batch_size - len(pending['actions'])
+                head = self._take(shard, rows[:start], contiguous)
+                pending = {array: np.concatenate((pending[array], head[array])) for array in ARRAYS}
+                if len(pending['actions']) < batch_size:
+                    continue
+
+                yield pending
+                pending = None
+
+            for start in range(start, len(rows), batch_size):
+                batch = self._take(shard, rows[start:start + batch_size], contiguous)
+                if len(batch['actions']) < batch_size:
+                    pending = batch
+                    break
+
+                yield batch
+
+        if pending is not None and len(pending['actions']) and not drop_last:
+            yield pending
+
+    @staticmethod
+    def _take(shard, rows, contiguous):
+        if contiguous and len(rows):
+            return {array: values[rows[0]:rows[-1] + 1] for array, values in shard.items()}
+
+        indices = np.sort(rows)
+        return {array: values[indices] for array, values in shard.items()}
+
+    def iter_batches(self, batch_size, shuffle=True, seed=None, drop_last=False, player=None):
+        """
+        Streams the dataset once as the Transitions that ExperienceReplay.sample_memories returns, so
+        they can be passed straight to AIPlayer.learn.
+        """
+        import torch
+        from src.dqn import Transition
+
+        for batch in self.iter_arrays(batch_size, shuffle, seed, drop_last, player):
+            yield Transition(
+                state=torch.from_numpy(batch['states'].astype(np.float32)),
+                action=torch.from_numpy(batch['actions'].astype(np.int64)),
+                next_state=torch.from_numpy(batch['next_states'].astype(np.float32)),
+                reward=torch.as_tensor(batch['rewards']),
+                done=torch.as_tensor(batch['dones']),
+                next_action_mask=torch.as_tensor(batch['next_action_masks']),
+            )
+
+
+def train_offline(player, dataset, batch_size=1000, epochs=1, seed=None, metrics=None):
+    """
+    Runs AIPlayer.learn over every move player made in the dataset epochs times, updating the target
+    network every player.update_target_every learn steps. The last batch of an epoch may be smaller than
+    batch_size.
+    :param metrics: optional Metrics to report the losses and learn steps to
+    :return: the losses
+    """
+    losses = []
+    for epoch in range(epochs):
+        epoch_seed = None if seed is None else seed + epoch
+        for batch in dataset.iter_batches(batch_size, seed=epoch_seed, player=player.index):
+            loss = player.learn(batch)
+            losses.append(loss)
+            if len(losses) % player.update_target_every == 0:
+                player.update_target_network()
+            if metrics is not None:
+                metrics.observe('loss', loss)
+                metrics.count('learn_steps')
+                metrics.maybe_report()
+
+    if not losses:
+        warnings.warn(f"The dataset holds no moves of player {player.index}; nothing was trained")
+    return losses
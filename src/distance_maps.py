@@ -0,0 +1,38 @@
+from collections import OrderedDict
+
+
+class DistanceMapCache:
+    """
+    Memoises GameState.distance_map by wall configuration. Distance maps do not
+    depend on pawn positions, so every position sharing a wall layout (and every
+    game sharing an opening) reuses the same search. The least recently used
+    entries are evicted once max_size is reached.
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._distance_maps = OrderedDict()
+
+    def get(self, state, player_index):
+        key = (state.placed_walls, player_index)
+        distance_map = self._distance_maps.get(key)
+        if distance_map is not None:
+            self.hits += 1
+            self._distance_maps.move_to_end(key)
+            return distance_map
+
+        self.misses += 1
+        distance_map = state.distance_map(player_index)
+        self._distance_maps[key] = distance_map
+        if len(self._distance_maps) > self.max_size:
+            self._distance_maps.popitem(last=False)
+
+        return distance_map
+
+    def clear(self):
+        self._distance_maps.clear()
+
+    def __len__(self):
+        return len(self._distance_maps)
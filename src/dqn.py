@@ -1,6 +1,9 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+import torch
 import torch.nn as nn
-from collections import namedtuple, deque
-import random
 
 
 class DQN(nn.Module):
@@ -19,19 +22,226 @@ class DQN(nn.Module):
 
 
 class ExperienceReplay:
-    def __init__(self, max_memory_capacity):
-        self.memory = deque([], max_memory_capacity)
+    """
+    Fixed capacity ring buffer of transitions held in preallocated, contiguous arrays. Board states
+    only hold small integers, so they are stored as int8; the arrays are allocated on the first push
+    once the state shape is known. Transitions may also carry a boolean mask of the actions legal in
+    next_state, which AIPlayer.learn uses to restrict its bootstrap target. If memmap_dir is given,
+    the arrays are .npy files memory-mapped from that directory, so the buffer can be far larger than RAM.
+    """
+
+    ARRAYS = ('states', 'actions', 'next_states', 'rewards', 'dones', 'next_action_masks')
+
+    def __init__(self, max_memory_capacity, memmap_dir=None):
+        self.max_memory_capacity = max_memory_capacity
+        self.memmap_dir = memmap_dir
+        self.states = None
+        self.actions = None
+        self.next_states = None
+        self.rewards = None
+        self.dones = None
+        self.next_action_masks = None
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng()
+
+    def _allocate(self, state_shape, action_mask_shape):
+        shape = (self.max_memory_capacity, *state_shape)
+        self.states = self._create_array('states', shape, np.int8)
+        self.actions = self._create_array('actions', (self.max_memory_capacity,), np.int16)
+        self.next_states = self._create_array('next_states', shape, np.int8)
+        self.rewards = self._create_array('rewards', (self.max_memory_capacity,), np.float32)
+        self.dones = self._create_array('dones', (self.max_memory_capacity,), np.bool_)
+        if action_mask_shape is not None:
+            self.next_action_masks = self._create_array(
+                'next_action_masks', (self.max_memory_capacity, *action_mask_shape), np.bool_
+            )
 
-    def push_memory(self, *args):
-        self.memory.append(Transition(*args))
+    def _create_array(self, name, shape, dtype):
+        if self.memmap_dir is None:
+            return np.zeros(shape, dtype=dtype)
+
+        os.makedirs(self.memmap_dir, exist_ok=True)
+        filename = os.path.join(self.memmap_dir, f'{name}.npy')
+        return np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+
+    def push_memory(self, state, action, next_state, reward, done, next_action_mask=None):
+        if self.states is None:
+            self._allocate(np.shape(state), None if next_action_mask is None else np.shape(next_action_mask))
+
+        position = self.position
+        self.states[position] = state
+        self.actions[position] = action
+        self.next_states[position] = next_state
+        self.rewards[position] = reward
+        self.dones[position] = done
+        if self.next_action_masks is not None:
+            self.next_action_masks[position] = next_action_mask
+        self.position = (position + 1) % self.max_memory_capacity
+        self.size = min(self.size + 1, self.max_memory_capacity)
 
     def sample_memories(self, batch_size):
-        return random.sample(self.memory, batch_size)
+        """
+        :return: Transition of batch tensors (float32 states, int64 actions, float32 rewards, bool dones)
+        """
+        return self._transitions(self.rng.choice(self.size, batch_size, replace=False))
+
+    def _transitions(self, indices):
+        return Transition(
+            state=torch.from_numpy(self.states[indices].astype(np.float32)),
+            action=torch.from_numpy(self.actions[indices].astype(np.int64)),
+            next_state=torch.from_numpy(self.next_states[indices].astype(np.float32)),
+            reward=torch.from_numpy(self.rewards[indices]),
+            done=torch.from_numpy(self.dones[indices]),
+            next_action_mask=None if self.next_action_masks is None else torch.from_numpy(
+                self.next_action_masks[indices]
+            ),
+        )
 
     def __len__(self):
-        return len(self.memory)
+        return self.size
+
+    def state_dict(self):
+        """
+        :return: a copy of the buffer for checkpointing: the first size slots of each array in ARRAYS (None
+        until allocated) plus the cursor and sampling RNG state
+        """
+        state = {'position': self.position, 'size': self.size, 'rng': self.rng.bit_generator.state}
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            state[name] = None if array is None else np.array(array[:self.size])
+        return state
+
+    def load_state_dict(self, state):
+        """
+        Restores a state_dict into this buffer, allocating it (memory-mapped if memmap_dir is set) as needed.
+        Arrays are copied slot by slot, so they may themselves be memory maps of files larger than RAM.
+        """
+        if state['size'] > self.max_memory_capacity:
+            raise ValueError(
+                f"Cannot restore {state['size']} transitions into a memory of capacity {self.max_memory_capacity}"
+            )
+
+        if state['states'] is not None:
+            if self.states is None:
+                masks = state['next_action_masks']
+                self._allocate(state['states'].shape[1:], None if masks is None else masks.shape[1:])
+            for name in self.ARRAYS:
+                if state[name] is not None:
+                    getattr(self, name)[:state['size']] = state[name]
+        self.position = state['position']
+        self.size = state['size']
+        self.rng.bit_generator.state = state['rng']
+
+
+class SumTree:
+    """
+    Binary tree over a fixed number of non-negative priorities in which every node holds the sum of
+    its children, stored as a flat array with the root at index 1 and the leaves at [leaves, 2 * leaves).
+    Updating a priority and finding the leaf a prefix sum falls in both take O(log n), and both work on
+    whole batches of indices at once.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.leaves = 1 << max(capacity - 1, 0).bit_length()
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def __getitem__(self, indices):
+        return self.tree[np.asarray(indices) + self.leaves]
+
+    def update(self, indices, priorities):
+        nodes = np.unique(np.asarray(indices) + self.leaves)
+        self.tree[np.asarray(indices) + self.leaves] = priorities
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        :param values: prefix sums in [0, total)
+        :return: the index of the leaf each prefix sum falls in
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0.0)
+            nodes = left + go_right
+
+        # Rounding can send a prefix sum just past the last non-empty leaf
+        return np.minimum(nodes - self.leaves, self.capacity - 1)
+
+
+class PrioritizedExperienceReplay(ExperienceReplay):
+    """
+    ExperienceReplay that samples transitions with probability proportional to priority ** alpha, where
+    the priority is the size of the transition's last TD error. New transitions get the largest priority
+    seen so far so they are replayed at least once. Batches carry the sampled slots and the normalised
+    importance-sampling weights correcting for the non-uniform sampling; beta is annealed towards 1 by
+    beta_increment on every sample.
+    """
+
+    def __init__(self, max_memory_capacity, memmap_dir=None, alpha=0.6, beta=0.4, beta_increment=1e-4,
+                 epsilon=1e-3):
+        super(PrioritizedExperienceReplay, self).__init__(max_memory_capacity, memmap_dir=memmap_dir)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.priorities = SumTree(max_memory_capacity)
+
+    def push_memory(self, state, action, next_state, reward, done, next_action_mask=None):
+        self.priorities.update([self.position], self.max_priority ** self.alpha)
+        super(PrioritizedExperienceReplay, self).push_memory(
+            state, action, next_state, reward, done, next_action_mask=next_action_mask
+        )
+
+    def sample_memories(self, batch_size):
+        if batch_size > self.size:
+            raise ValueError(f"Cannot sample {batch_size} transitions from a memory of {self.size}")
+
+        # Stratified: one prefix sum from each of batch_size equal slices of the total priority
+        segment = self.priorities.total / batch_size
+        indices = self.priorities.find((np.arange(batch_size) + self.rng.random(batch_size)) * segment)
+        probabilities = self.priorities[indices] / self.priorities.total
+        weights = (self.size * probabilities) ** -self.beta
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        return self._transitions(indices)._replace(
+            weight=torch.from_numpy((weights / weights.max()).astype(np.float32)),
+            index=indices,
+        )
+
+    def state_dict(self):
+        state = super(PrioritizedExperienceReplay, self).state_dict()
+        state.update(priorities=self.priorities.tree.copy(), max_priority=self.max_priority, beta=self.beta)
+        return state
+
+    def load_state_dict(self, state):
+        if len(state['priorities']) != len(self.priorities.tree):
+            raise ValueError("The checkpointed priorities were saved for a memory of another capacity")
 
+        super(PrioritizedExperienceReplay, self).load_state_dict(state)
+        self.priorities.tree[:] = state['priorities']
+        self.max_priority = state['max_priority']
+        self.beta = state['beta']
 
-Transition = namedtuple('Transition', ('state', 'action', 'next_state', 'reward', 'done'))
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(np.asarray(td_errors, dtype=np.float64)) + self.epsilon
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.priorities.update(indices, priorities ** self.alpha)
 
 
+# next_action_mask is only set for memories given masks; weight and index only by PrioritizedExperienceReplay
+Transition = namedtuple(
+    'Transition',
+    ('state', 'action', 'next_state', 'reward', 'done', 'next_action_mask', 'weight', 'index'),
+    defaults=(None, None, None)
+)
@@ -0,0 +1,135 @@
+import numpy as np
+
+from src.actions import ACTION_SIZE
+from src.constants import SQUARES, STARTING_CELLS, STARTING_WALLS
+from src.distance_maps import DistanceMapCache
+from src.game_state import UNREACHABLE, GameState, wall_position
+from src.legal_wall_cache import LegalWallCache
+
+HORIZONTAL_WALLS, VERTICAL_WALLS, OWN_PAWN, OPPONENT_PAWN, OWN_WALLS_LEFT, OPPONENT_WALLS_LEFT = range(6)
+OWN_DISTANCES, OPPONENT_DISTANCES = range(6, 8)
+
+
+class QuoridorEnv:
+    """
+    Headless single game environment with the Gymnasium reset()/step() interface. Nothing here imports
+    pygame, so it runs without a display. One agent plays both sides: observations are from the point
+    of view of the player to move and rewards go to the player who just moved.
+
+    Observations are (planes, SQUARES, SQUARES) arrays indexed [plane, row, col]:
+        HORIZONTAL_WALLS / VERTICAL_WALLS: 1 at the (col, row) anchor of each placed wall; walls are
+            anchored on the inner WALL_SQUARES X WALL_SQUARES grid, so the last row and column stay 0
+        OWN_PAWN / OPPONENT_PAWN: 1 at the pawn's cell
+        OWN_WALLS_LEFT / OPPONENT_WALLS_LEFT: filled with the walls left (as a fraction of the starting
+            walls for float observations)
+        OWN_DISTANCES / OPPONENT_DISTANCES (with distance_planes=True): steps from each cell to the goal
+            row (divided by the number of cells for float observations); unreachable cells are 255 for
+            uint8 and 1 for float observations
+    They are written into a buffer allocated once, so each observation is only valid until the next
+    reset or step; copy it to keep it. info["action_mask"] is the (ACTION_SIZE,) boolean mask of the
+    legal actions, encoded as in src.actions.
+
+    Rewards follow QuoridorGym: step_reward for every move and, for the winning move, win_reward scaled
+    by how far the opponent still is from their goal. Illegal actions raise a ValueError.
+    """
+
+    def __init__(
+            self,
+            dtype=np.float32,
+            distance_planes=False,
+            walls_per_player=STARTING_WALLS,
+            step_reward=-0.1,
+            win_reward=10,
+            max_steps=None
+    ):
+        if np.dtype(dtype) not in (np.dtype(np.float32), np.dtype(np.uint8)):
+            raise TypeError(f"Observations must be float32 or uint8 but received {dtype}")
+
+        self.dtype = np.dtype(dtype)
+        self.distance_planes = distance_planes
+        self.walls_per_player = walls_per_player
+        self.step_reward = step_reward
+        self.win_reward = win_reward
+        self.max_steps = max_steps
+        self.state = GameState(STARTING_CELLS, walls_per_player)
+        self.distance_maps = DistanceMapCache()
+        self.legal_wall_cache = LegalWallCache()
+        self.steps = 0
+        self.action_mask = None
+        total_planes = OPPONENT_DISTANCES + 1 if distance_planes else OPPONENT_WALLS_LEFT + 1
+        self.observation_shape = (total_planes, SQUARES, SQUARES)
+        self.action_size = ACTION_SIZE
+        self._observation = np.zeros(self.observation_shape, dtype=self.dtype)
+
+    def reset(self, seed=None, options=None):
+        """
+        The game is deterministic, so seed and options are accepted for API compatibility only.
+        :return: (observation, info)
+        """
+        self.state.reset()
+        self.steps = 0
+        self.action_mask = self._legal_action_mask()
+        return self._observe(), {'action_mask': self.action_mask, 'current_player': self.state.current_player}
+
+    def step(self, action):
+        """
+        :param action: action index for the player to move
+        :return: (observation, reward, terminated, truncated, info)
+        """
+        if self.action_mask is None:
+            raise ValueError("reset must be called before step")
+        if not 0 <= action < ACTION_SIZE or not self.action_mask[action]:
+            raise ValueError(f"Illegal action {action} for player {self.state.current_player}")
+
+        state = self.state
+        mover = state.current_player
+        state.apply_move(int(action))
+        self.steps += 1
+        terminated = state.is_winner(mover)
+        truncated = not terminated and self.max_steps is not None and self.steps >= self.max_steps
+        reward = self.step_reward
+        if terminated:
+            opponent = (mover + 1) % state.total_players
+            opponent_distance = self.distance_maps.get(state, opponent)[state.pawns[opponent]]
+            reward = self.win_reward * min(opponent_distance / (SQUARES - 1), 1)
+            self.action_mask = np.zeros(ACTION_SIZE, dtype=bool)
+        else:
+            self.action_mask = self._legal_action_mask()
+
+        info = {'action_mask': self.action_mask, 'current_player': state.current_player}
+        return self._observe(), reward, terminated, truncated, info
+
+    def _legal_action_mask(self):
+        state = self.state
+        player = state.current_player
+        legal_walls = self.legal_wall_cache.get_legal_walls(state) if state.walls_left[player] > 0 else []
+        return state.legal_action_mask(player, legal_walls=legal_walls)
+
+    def _observe(self):
+        state = self.state
+        observation = self._observation
+        observation[:OPPONENT_PAWN + 1] = 0
+        for wall in state.iter_placed_walls():
+            col, row, is_vertical = wall_position(wall)
+            observation[VERTICAL_WALLS if is_vertical else HORIZONTAL_WALLS, row, col] = 1
+
+        player = state.current_player
+        opponent = (player + 1) % state.total_players
+        for plane, player_index in ((OWN_PAWN, player), (OPPONENT_PAWN, opponent)):
+            row, col = divmod(state.pawns[player_index], SQUARES)
+            observation[plane, row, col] = 1
+
+        is_float = self.dtype == np.float32
+        for plane, player_index in ((OWN_WALLS_LEFT, player), (OPPONENT_WALLS_LEFT, opponent)):
+            walls_left = state.walls_left[player_index]
+            observation[plane] = walls_left / max(self.walls_per_player, 1) if is_float else walls_left
+
+        if self.distance_planes:
+            for plane, player_index in ((OWN_DISTANCES, player), (OPPONENT_DISTANCES, opponent)):
+                distances = np.asarray(self.distance_maps.get(state, player_index)).reshape(SQUARES, SQUARES)
+                if is_float:
+                    observation[plane] = np.where(distances == UNREACHABLE, 1, distances / (SQUARES * SQUARES))
+                else:
+                    observation[plane] = np.where(distances == UNREACHABLE, 255, distances)
+
+        return observation
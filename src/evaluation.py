@@ -0,0 +1,102 @@
+import numpy as np
+
+from src.actions import ACTION_SIZE, WALL_ACTIONS
+from src.game_state import GameState
+
+AGENT_KINDS = ('random', 'search', 'mcts', 'dqn', 'remote')
+
+
+def make_agent(spec, time_budget=0.5, simulations=200, seed=None):
+    """
+    Headless agents for evaluation, each a callable mapping a GameState to the action of its player to move.
+    :param spec: 'random', 'search', 'mcts', 'dqn:<checkpoint path>' (a checkpoint saved by QuoridorGym) or
+    'remote:<address>' (the policy served by a src.inference_server.InferenceServer at that socket)
+    """
+    kind, _, argument = spec.partition(':')
+    if kind == 'random':
+        rng = np.random.default_rng(seed)
+
+        def random_agent(state, randomly_move_pawn_probability=0.7):
+            legal_actions = np.flatnonzero(state.legal_action_mask())
+            legal_walls = legal_actions[legal_actions < WALL_ACTIONS]
+            legal_pawn_moves = legal_actions[legal_actions >= WALL_ACTIONS]
+            if legal_walls.size and legal_pawn_moves.size:
+                if rng.random() < randomly_move_pawn_probability:
+                    legal_actions = legal_pawn_moves
+                else:
+                    legal_actions = legal_walls
+            return int(rng.choice(legal_actions))
+
+        return random_agent
+
+    if kind == 'search':
+        from src.search import AlphaBetaSearch
+
+        return AlphaBetaSearch(time_budget=time_budget).best_action
+
+    if kind == 'mcts':
+        from src.mcts import MCTS
+
+        return MCTS(simulations=simulations, time_budget=time_budget, seed=seed).best_action
+
+    if kind == 'dqn':
+        if not argument:
+            raise ValueError("A dqn agent needs a checkpoint path, e.g. dqn:agent_0.pth")
+
+        import torch
+        from src.dqn import DQN
+
+        model = DQN(state_size=len(GameState().get_state()), action_size=ACTION_SIZE)
+        model.load_state_dict(torch.load(argument)['model_state_dict'])
+        model.eval()
+
+        def dqn_agent(state):
+            with torch.no_grad():
+                q_values = model(torch.tensor(state.get_state(), dtype=torch.float32).unsqueeze(0))[0]
+                q_values[~torch.from_numpy(state.legal_action_mask())] = float('-inf')
+            return int(torch.argmax(q_values))
+
+        return dqn_agent
+
+    if kind == 'remote':
+        if not argument:
+            raise ValueError("A remote agent needs the address of an inference server, e.g. remote:/tmp/quoridor.sock")
+
+        from src.inference_server import InferenceClient
+
+        client = InferenceClient(argument)
+
+        def remote_agent(state):
+            return client.select_action(np.asarray(state.get_state()), state.legal_action_mask())
+
+        return remote_agent
+
+    raise ValueError(f"Unknown agent {spec!r}; expected one of {AGENT_KINDS}")
+
+
+def play_match(agents, games=10, max_moves=500):
+    """
+    Plays games between two agents, swapping who moves first every game.
+    :return: dict with the 'wins' of each agent, the number of 'draws' (games stopped after max_moves)
+    and the average number of 'moves' per game
+    """
+    wins = [0, 0]
+    draws = 0
+    total_moves = 0
+    for game in range(games):
+        state = GameState()
+        # Agent (game + seat) % 2 plays seat
+        seats = [(game + seat) % 2 for seat in range(2)]
+        moves = 0
+        while moves < max_moves:
+            mover = state.current_player
+            state.apply_move(agents[seats[mover]](state))
+            moves += 1
+            if state.is_winner(mover):
+                wins[seats[mover]] += 1
+                break
+        else:
+            draws += 1
+        total_moves += moves
+
+    return {'wins': wins, 'draws': draws, 'moves': total_moves / max(games, 1)}
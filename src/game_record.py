@@ -0,0 +1,308 @@
+"""
+Game records: finished (or abandoned) games kept as their move sequence so they can be audited,
+deduplicated and replayed into training data.
+
+Moves use the usual Quoridor notation: files a-i run left to right (engine col 0-8) and ranks 1-9
+follow the engine rows, so player 0 starts on e1 and player 1 on e9. A pawn move is written as its
+destination square (e2) and a wall as the square at its top-left (lowest file and rank) end followed
+by h or v (a3h blocks a3-a4 and b3-b4; a3v blocks a3-b3 and a4-b4).
+
+Records are appended to shard files in a directory, either as JSONL (one
+{"moves": "e2 e8 a3h ...", "winner": 0, "walls_per_player": 10} object per line) or binary: the
+SHARD_MAGIC header, then per game a GAME_HEADER (move count, winner or -1, walls per player) and one
+byte per move holding its action (see src.actions).
+"""
+import json
+import os
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from src.actions import ACTION_SIZE, is_wall_action, pawn_action, action_destination
+from src.constants import SQUARES, STARTING_CELLS, STARTING_WALLS
+from src.game_state import GameState, cell_index, cell_position, wall_index, wall_position
+
+FILES = 'abcdefghi'
+RECORD_FORMATS = ('jsonl', 'binary')
+SHARD_EXTENSIONS = {'jsonl': '.jsonl', 'binary': '.qgr'}
+SHARD_MAGIC = b'QGR1'
+GAME_HEADER = struct.Struct('<Hbb')
+
+
+class GameRecord(namedtuple('GameRecord', ('actions', 'winner', 'walls_per_player'))):
+    """
+    actions is a tuple of the actions played (encoded as in src.actions, starting with player 0),
+    winner the index of the winning player or None for an unfinished game. Records are hashable, so
+    duplicates can be dropped with a set.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_game_state(cls, state):
+        """
+        Reads the game back from the state's move history; state must have been played from its
+        starting position without set_position.
+        """
+        if state.starting_cells != tuple(STARTING_CELLS):
+            raise ValueError("Game records only support two player games from the standard starting cells")
+
+        pawns = list(state.pawns)
+        actions = []
+        for player_index, previous_cell, wall, _, _ in reversed(state.history):
+            if wall is None:
+                actions.append(pawn_action(previous_cell, pawns[player_index]))
+                pawns[player_index] = previous_cell
+            else:
+                actions.append(wall)
+        actions.reverse()
+
+        winner = next((index for index in range(state.total_players) if state.is_winner(index)), None)
+        return cls(tuple(actions), winner, state.walls_per_player)
+
+    @classmethod
+    def from_notation(cls, moves, winner=None, walls_per_player=STARTING_WALLS):
+        """
+        :param moves: space separated moves, e.g. "e2 e8 a3h"
+        """
+        state = GameState(STARTING_CELLS, walls_per_player)
+        actions = []
+        for move in moves.split():
+            action = notation_to_action(move, state.pawns[state.current_player])
+            state.apply_move(action)
+            actions.append(action)
+
+        return cls(tuple(actions), winner, walls_per_player)
+
+    def notation(self):
+        """
+        :return: the moves as space separated notation
+        """
+        pawns = list(STARTING_CELLS)
+        moves = []
+        for ply, action in enumerate(self.actions):
+            player_index = ply % len(pawns)
+            moves.append(action_to_notation(action, pawns[player_index]))
+            if not is_wall_action(action):
+                pawns[player_index] = action_destination(pawns[player_index], action)
+
+        return ' '.join(moves)
+
+
+def square_name(cell):
+    col, row = cell_position(cell)
+    return f"{FILES[col]}{row + 1}"
+
+
+def action_to_notation(action, origin):
+    """
+    :param origin: cell of the mover's pawn, needed to resolve pawn moves
+    """
+    if is_wall_action(action):
+        col, row, is_vertical = wall_position(action)
+        return f"{FILES[col]}{row + 1}{'v' if is_vertical else 'h'}"
+
+    return square_name(action_destination(origin, action))
+
+
+def notation_to_action(move, origin):
+    """
+    :param origin: cell of the mover's pawn, needed to encode pawn moves
+    """
+    move = move.strip().lower()
+    try:
+        col = FILES.index(move[0])
+        row = int(move[1]) - 1
+    except (IndexError, ValueError):
+        raise ValueError(f"Invalid move {move!r}; expected a square such as e2 or a wall such as a3h") from None
+
+    orientation = move[2:]
+    if orientation in ('h', 'v') and col < SQUARES - 1 and 0 <= row < SQUARES - 1:
+        return wall_index(col, row, orientation == 'v')
+    if not orientation and 0 <= row < SQUARES:
+        try:
+            return pawn_action(origin, cell_index(col, row))
+        except KeyError:
+            raise ValueError(f"{move} is out of reach of a pawn on {square_name(origin)}") from None
+
+    raise ValueError(f"Invalid move {move!r}; expected a square such as e2 or a wall such as a3h")
+
+
+class GameRecordWriter:
+    """
+    Appends game records to shard files in directory, starting a new shard every games_per_shard
+    games. Shards are named <prefix>-<timestamp>-<number> so writers never touch each other's files,
+    and are only appended to, so a crash loses at most the buffered games of the open shard.
+    """
+
+    def __init__(self, directory, record_format='binary', games_per_shard=10000, prefix='games'):
+        if record_format not in RECORD_FORMATS:
+            raise ValueError(f"Unknown record format {record_format!r}; expected one of {RECORD_FORMATS}")
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.record_format = record_format
+        self.games_per_shard = games_per_shard
+        self.prefix = f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.games_written = 0
+        self.shard_paths = []
+        self._file = None
+        self._games_in_shard = 0
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        :param spec: '<directory>' or '<format>:<directory>', e.g. 'jsonl:runs/games'
+        """
+        record_format, separator, directory = spec.partition(':')
+        if not separator or record_format not in RECORD_FORMATS:
+            record_format, directory = 'binary', spec
+        return cls(directory, record_format)
+
+    def write(self, record):
+        if self._file is None or self._games_in_shard >= self.games_per_shard:
+            self._open_shard()
+
+        if self.record_format == 'jsonl':
+            line = {'moves': record.notation(), 'winner': record.winner, 'walls_per_player': record.walls_per_player}
+            self._file.write((json.dumps(line) + '\n').encode())
+        else:
+            winner = -1 if record.winner is None else record.winner
+            self._file.write(GAME_HEADER.pack(len(record.actions), winner, record.walls_per_player))
+            self._file.write(bytes(record.actions))
+
+        self._games_in_shard += 1
+        self.games_written += 1
+
+    def write_game(self, state):
+        """
+        Records the game played on state, if any move was made.
+        """
+        if state.history:
+            self.write(GameRecord.from_game_state(state))
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open_shard(self):
+        self.close()
+        path = os.path.join(
+            self.directory, f"{self.prefix}-{len(self.shard_paths):05d}{SHARD_EXTENSIONS[self.record_format]}"
+        )
+        self._file = open(path, 'ab')
+        if self.record_format == 'binary':
+            self._file.write(SHARD_MAGIC)
+        self.shard_paths.append(path)
+        self._games_in_shard = 0
+
+
+def read_shard(path):
+    """
+    :return: iterator over the GameRecords of a JSONL or binary shard
+    """
+    if path.endswith(SHARD_EXTENSIONS['jsonl']):
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    game = json.loads(line)
+                    yield GameRecord.from_notation(game['moves'], game['winner'], game['walls_per_player'])
+        return
+
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data[:len(SHARD_MAGIC)] != SHARD_MAGIC:
+        raise ValueError(f"{path} is not a game record shard")
+
+    offset = len(SHARD_MAGIC)
+    while offset < len(data):
+        moves, winner, walls_per_player = GAME_HEADER.unpack_from(data, offset)
+        offset += GAME_HEADER.size
+        actions = tuple(data[offset:offset + moves])
+        if len(actions) != moves:
+            raise ValueError(f"{path} ends in the middle of a game")
+        offset += moves
+        yield GameRecord(actions, None if winner < 0 else winner, walls_per_player)
+
+
+def iter_records(paths):
+    """
+    :param paths: shard files and/or directories of shards
+    :return: iterator over the GameRecords of every shard, in name order within directories
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.endswith(tuple(SHARD_EXTENSIONS.values())))
+            yield from iter_records([os.path.join(path, name) for name in names])
+        else:
+            yield from read_shard(path)
+
+
+class Replayer:
+    """
+    Re-simulates records on one reused GameState without pygame, checking every move against the
+    rules: a pawn move must be one of legal_pawn_moves and a wall must be legal with walls left.
+    Only the wall being played is validated, never the whole legal wall set, so replays run at
+    engine speed.
+    """
+
+    def __init__(self):
+        self.state = GameState()
+        self.moves_replayed = 0
+        self.games_replayed = 0
+
+    def positions(self, record):
+        """
+        Replays a record, yielding before every move so the position can be inspected or encoded.
+        :return: iterator of (state, action); the state is shared and only valid until the next item
+        :raises ValueError: on the first illegal move, or if the final position disagrees with the winner
+        """
+        state = self.state
+        if state.walls_per_player != record.walls_per_player:
+            self.state = state = GameState(STARTING_CELLS, record.walls_per_player)
+        state.reset()
+        winner = None
+        for ply, action in enumerate(record.actions):
+            if winner is not None:
+                raise ValueError(f"Ply {ply}: move after player {winner} has already won")
+            if not 0 <= action < ACTION_SIZE or not self._is_legal(state, action):
+                origin = state.pawns[state.current_player]
+                notation = action_to_notation(action, origin) if 0 <= action < ACTION_SIZE else str(action)
+                raise ValueError(f"Ply {ply}: illegal move {notation} for player {state.current_player}")
+
+            yield state, action
+            mover = state.current_player
+            state.apply_move(action)
+            if state.is_winner(mover):
+                winner = mover
+            self.moves_replayed += 1
+
+        if winner != record.winner:
+            raise ValueError(f"Record says the winner is {record.winner} but the moves give {winner}")
+        self.games_replayed += 1
+
+    def verify(self, record):
+        for _ in self.positions(record):
+            pass
+
+    def observations(self, record):
+        """
+        :return: (observations, actions) arrays with the get_state observation before every move
+        """
+        observations = [state.get_state() for state, _ in self.positions(record)]
+        return np.array(observations), np.array(record.actions, dtype=np.int16)
+
+    @staticmethod
+    def _is_legal(state, action):
+        player_index = state.current_player
+        if is_wall_action(action):
+            return state.walls_left[player_index] > 0 and state.is_wall_legal(action)
+
+        destination = action_destination(state.pawns[player_index], action)
+        return destination in state.legal_pawn_moves(player_index)
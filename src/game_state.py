@@ -0,0 +1,545 @@
+import random
+from collections import deque, namedtuple
+
+import numpy as np
+
+from src.actions import ACTION_SIZE, PAWN_OFFSET_ACTIONS, action_destination, is_wall_action
+from src.constants import (
+    GOAL_ROWS,
+    SPACES,
+    SQUARES,
+    STARTING_CELLS,
+    STARTING_WALLS,
+    TOTAL_CELLS,
+    TOTAL_WALL_SLOTS,
+    WALL_SQUARES,
+)
+
+# Each cell keeps a bitmask of the edges that are still open. The order of STEPS
+# mirrors the iteration order of Direction (UP, DOWN, LEFT, RIGHT).
+EDGE_UP = 1
+EDGE_DOWN = 2
+EDGE_LEFT = 4
+EDGE_RIGHT = 8
+STEPS = (
+    (EDGE_UP, -SQUARES),
+    (EDGE_DOWN, SQUARES),
+    (EDGE_LEFT, -1),
+    (EDGE_RIGHT, 1),
+)
+OPPOSITE_EDGE = {EDGE_UP: EDGE_DOWN, EDGE_DOWN: EDGE_UP, EDGE_LEFT: EDGE_RIGHT, EDGE_RIGHT: EDGE_LEFT}
+PERPENDICULAR_STEPS = {
+    EDGE_UP: ((EDGE_RIGHT, 1), (EDGE_LEFT, -1)),
+    EDGE_DOWN: ((EDGE_RIGHT, 1), (EDGE_LEFT, -1)),
+    EDGE_LEFT: ((EDGE_UP, -SQUARES), (EDGE_DOWN, SQUARES)),
+    EDGE_RIGHT: ((EDGE_UP, -SQUARES), (EDGE_DOWN, SQUARES)),
+}
+TOTAL_WALLS = TOTAL_WALL_SLOTS * 2
+UNREACHABLE = -1
+MAX_PLAYERS = 4
+
+
+def cell_index(col, row):
+    return row * SQUARES + col
+
+
+def cell_position(cell):
+    """
+    :return: (col, row) of the cell
+    """
+    row, col = divmod(cell, SQUARES)
+    return col, row
+
+
+def wall_index(col, row, is_vertical=False):
+    """
+    Walls are identified by the (col, row) of their upper-most or left-most segment. Horizontal walls
+    occupy indices [0, TOTAL_WALL_SLOTS) and vertical walls [TOTAL_WALL_SLOTS, TOTAL_WALLS).
+    """
+    return row * WALL_SQUARES + col + (TOTAL_WALL_SLOTS if is_vertical else 0)
+
+
+def wall_position(wall):
+    """
+    :return: (col, row, is_vertical) of the wall
+    """
+    is_vertical = wall >= TOTAL_WALL_SLOTS
+    row, col = divmod(wall % TOTAL_WALL_SLOTS, WALL_SQUARES)
+    return col, row, is_vertical
+
+
+def _build_open_edges():
+    open_edges = []
+    for cell in range(TOTAL_CELLS):
+        col, row = cell_position(cell)
+        edges = 0
+        if row > 0:
+            edges |= EDGE_UP
+        if row < SQUARES - 1:
+            edges |= EDGE_DOWN
+        if col > 0:
+            edges |= EDGE_LEFT
+        if col < SQUARES - 1:
+            edges |= EDGE_RIGHT
+        open_edges.append(edges)
+
+    return open_edges
+
+
+def _build_neighbours():
+    """
+    For every cell and every possible open-edge bitmask, the tuple of reachable neighbouring cells.
+    Lets path searches skip the bit twiddling entirely.
+    """
+    neighbours = []
+    for cell in range(TOTAL_CELLS):
+        by_mask = []
+        for mask in range(16):
+            by_mask.append(tuple(cell + offset for edge, offset in STEPS if mask & edge))
+        neighbours.append(by_mask)
+
+    return neighbours
+
+
+def edge_key(cell, neighbour):
+    """
+    :return: an identifier for the undirected edge between two neighbouring cells
+    """
+    return min(cell, neighbour) * TOTAL_CELLS + max(cell, neighbour)
+
+
+def _build_wall_tables():
+    """
+    :return: (conflicts, blocked_edges, edge_keys) where conflicts[wall] is a bitmask of every wall that
+    overlaps or crosses it (itself included), blocked_edges[wall] lists the (cell, edge, neighbour,
+    opposite_edge) pairs it cuts and edge_keys[wall] holds the edge_key of each of those pairs.
+    """
+    conflicts = []
+    blocked_edges = []
+    edge_keys = []
+    for wall in range(TOTAL_WALLS):
+        col, row, is_vertical = wall_position(wall)
+        conflicting = [wall, wall_index(col, row, not is_vertical)]
+        if is_vertical:
+            if row > 0:
+                conflicting.append(wall_index(col, row - 1, True))
+            if row < WALL_SQUARES - 1:
+                conflicting.append(wall_index(col, row + 1, True))
+            first_cell = cell_index(col, row)
+            second_cell = cell_index(col, row + 1)
+            edges = [
+                (first_cell, EDGE_RIGHT, first_cell + 1, EDGE_LEFT),
+                (second_cell, EDGE_RIGHT, second_cell + 1, EDGE_LEFT),
+            ]
+        else:
+            if col > 0:
+                conflicting.append(wall_index(col - 1, row))
+            if col < WALL_SQUARES - 1:
+                conflicting.append(wall_index(col + 1, row))
+            first_cell = cell_index(col, row)
+            second_cell = cell_index(col + 1, row)
+            edges = [
+                (first_cell, EDGE_DOWN, first_cell + SQUARES, EDGE_UP),
+                (second_cell, EDGE_DOWN, second_cell + SQUARES, EDGE_UP),
+            ]
+
+        conflict_mask = 0
+        for conflicting_wall in conflicting:
+            conflict_mask |= 1 << conflicting_wall
+        conflicts.append(conflict_mask)
+        blocked_edges.append(tuple(edges))
+        edge_keys.append(frozenset(edge_key(cell, neighbour) for cell, _, neighbour, _ in edges))
+
+    return conflicts, blocked_edges, edge_keys
+
+
+def _build_zobrist_keys(seed=0x5EED):
+    """
+    Random 64 bit keys for every pawn cell, wall, walls left count and side to move. A position's
+    Zobrist hash is the XOR of the keys of its features, so a move updates it with a couple of XORs.
+    :return: (pawn_keys[player][cell], wall_keys[wall], walls_left_keys[player][count], side_keys[player])
+    """
+    rng = random.Random(seed)
+    pawn_keys = [[rng.getrandbits(64) for _ in range(TOTAL_CELLS)] for _ in range(MAX_PLAYERS)]
+    wall_keys = [rng.getrandbits(64) for _ in range(TOTAL_WALLS)]
+    walls_left_keys = [[rng.getrandbits(64) for _ in range(TOTAL_WALLS + 1)] for _ in range(MAX_PLAYERS)]
+    side_keys = [rng.getrandbits(64) for _ in range(MAX_PLAYERS)]
+    return pawn_keys, wall_keys, walls_left_keys, side_keys
+
+
+INITIAL_OPEN_EDGES = _build_open_edges()
+NEIGHBOURS = _build_neighbours()
+WALL_CONFLICTS, WALL_BLOCKED_EDGES, WALL_EDGE_KEYS = _build_wall_tables()
+ZOBRIST_PAWNS, ZOBRIST_WALLS, ZOBRIST_WALLS_LEFT, ZOBRIST_SIDE = _build_zobrist_keys()
+
+
+class Position(namedtuple('Position', ('pawns', 'walls_left', 'placed_walls', 'current_player'))):
+    """
+    Immutable snapshot of a GameState: pawn cells and walls left per player as tuples, the placed walls
+    bitmask and the side to move. Being a tuple of ints it is cheap to create, hashable and picklable,
+    so it can key caches and be sent to other processes; GameState.from_position turns it back into a
+    playable state.
+    """
+    __slots__ = ()
+
+
+class GameState:
+    """
+    Headless representation of a game of Quoridor. Pawns are cell indices (row * SQUARES + col),
+    placed walls are a bitmask over wall indices (see wall_index) and the cell graph is kept as
+    a per-cell bitmask of open edges. Nothing here depends on pygame, so it can be stepped as fast
+    as Python allows; Board, Player and RenderMixin are views over it.
+
+    Every move is pushed onto a history stack so it can be taken back with undo_move, which lets
+    search and legality probing walk the game tree on a single state. zobrist_hash identifies the
+    position (pawns, walls, walls left and side to move) and is updated incrementally by every move.
+    """
+
+    def __init__(self, starting_cells=STARTING_CELLS, walls_per_player=STARTING_WALLS):
+        self.starting_cells = tuple(starting_cells)
+        self.walls_per_player = walls_per_player
+        self.pawns = list(starting_cells)
+        self.walls_left = [walls_per_player for _ in starting_cells]
+        self.placed_walls = 0
+        self.open_edges = list(INITIAL_OPEN_EDGES)
+        self.current_player = 0
+        self.zobrist_hash = self._compute_zobrist_hash()
+        # (player_index, previous_cell, wall, previous_current_player, previous_hash); wall is None for pawn moves
+        self.history = []
+
+    @classmethod
+    def from_position(cls, position, starting_cells=STARTING_CELLS, walls_per_player=STARTING_WALLS):
+        state = cls(starting_cells, walls_per_player)
+        state.set_position(position)
+        return state
+
+    def position(self):
+        return Position(tuple(self.pawns), tuple(self.walls_left), self.placed_walls, self.current_player)
+
+    def set_position(self, position):
+        """
+        Replaces the position in place; the move history is cleared.
+        """
+        self.pawns[:] = position.pawns
+        self.walls_left[:] = position.walls_left
+        self.placed_walls = position.placed_walls
+        self.open_edges[:] = INITIAL_OPEN_EDGES
+        for wall in self.iter_placed_walls():
+            self._block_edges(wall)
+        self.current_player = position.current_player
+        self.zobrist_hash = self._compute_zobrist_hash()
+        self.history.clear()
+
+    def reset(self):
+        """
+        Restores the starting position in place.
+        """
+        self.pawns[:] = self.starting_cells
+        self.walls_left[:] = [self.walls_per_player for _ in self.starting_cells]
+        self.placed_walls = 0
+        self.open_edges[:] = INITIAL_OPEN_EDGES
+        self.current_player = 0
+        self.zobrist_hash = self._compute_zobrist_hash()
+        self.history.clear()
+
+    def _compute_zobrist_hash(self):
+        zobrist_hash = ZOBRIST_SIDE[self.current_player]
+        for player_index, cell in enumerate(self.pawns):
+            zobrist_hash ^= ZOBRIST_PAWNS[player_index][cell]
+            zobrist_hash ^= ZOBRIST_WALLS_LEFT[player_index][self.walls_left[player_index]]
+        for wall in self.iter_placed_walls():
+            zobrist_hash ^= ZOBRIST_WALLS[wall]
+
+        return zobrist_hash
+
+    @property
+    def total_players(self):
+        return len(self.pawns)
+
+    def is_winner(self, player_index):
+        return self.pawns[player_index] // SQUARES == GOAL_ROWS[player_index]
+
+    def is_wall_placed(self, wall):
+        return bool(self.placed_walls >> wall & 1)
+
+    def iter_placed_walls(self):
+        remaining = self.placed_walls
+        while remaining:
+            lowest_bit = remaining & -remaining
+            yield lowest_bit.bit_length() - 1
+            remaining ^= lowest_bit
+
+    def is_wall_placeable(self, wall):
+        """
+        :return: True if the wall neither overlaps nor crosses an existing wall; paths are not considered
+        """
+        return not self.placed_walls & WALL_CONFLICTS[wall]
+
+    def is_wall_legal(self, wall):
+        if not self.is_wall_placeable(wall):
+            return False
+
+        return not self.wall_disconnects(wall, range(self.total_players))
+
+    def legal_walls(self):
+        """
+        A wall can only cut a player off from their goal if it blocks an edge of every path they have,
+        in particular of their current shortest path. So one search per player finds the walls that
+        could matter and only those get a confirmation search.
+        :return: a list of wall indices that are currently eligible to be placed
+        """
+        path_edges = [self.shortest_path_edges(player_index) for player_index in range(self.total_players)]
+        if None in path_edges:
+            return []
+
+        legal_walls = []
+        for wall in range(TOTAL_WALLS):
+            if not self.is_wall_placeable(wall):
+                continue
+
+            edge_keys = WALL_EDGE_KEYS[wall]
+            cut_players = [
+                player_index for player_index in range(self.total_players)
+                if not edge_keys.isdisjoint(path_edges[player_index])
+            ]
+            if cut_players and self.wall_disconnects(wall, cut_players):
+                continue
+
+            legal_walls.append(wall)
+
+        return legal_walls
+
+    def wall_disconnects(self, wall, player_indices):
+        """
+        :return: True if placing the (placeable) wall would leave any of the players without a path
+        """
+        self._block_edges(wall)
+        viable_paths_remain = all(self.has_path(player_index) for player_index in player_indices)
+        self._unblock_edges(wall)
+        return not viable_paths_remain
+
+    def has_path(self, player_index, start=None):
+        """
+        Breadth first search from the player's cell (or start) to their goal row. Pawns do not block paths.
+        """
+        start = self.pawns[player_index] if start is None else start
+        goal_row = GOAL_ROWS[player_index]
+        if start // SQUARES == goal_row:
+            return True
+
+        open_edges = self.open_edges
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            for neighbour in NEIGHBOURS[cell][open_edges[cell]]:
+                if neighbour not in seen:
+                    if neighbour // SQUARES == goal_row:
+                        return True
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+
+        return False
+
+    def shortest_path(self, player_index, start=None):
+        """
+        Breadth first search from the player's cell (or start) to their goal row. Pawns do not block paths.
+        :return: list of cells from start to the goal row (inclusive), or None if the goal is unreachable
+        """
+        start = self.pawns[player_index] if start is None else start
+        goal_row = GOAL_ROWS[player_index]
+        if start // SQUARES == goal_row:
+            return [start]
+
+        open_edges = self.open_edges
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            for neighbour in NEIGHBOURS[cell][open_edges[cell]]:
+                if neighbour not in parents:
+                    parents[neighbour] = cell
+                    if neighbour // SQUARES == goal_row:
+                        path = [neighbour]
+                        while parents[path[-1]] is not None:
+                            path.append(parents[path[-1]])
+                        return path[::-1]
+                    queue.append(neighbour)
+
+        return None
+
+    def distance_map(self, player_index):
+        """
+        Breadth first search outwards from the player's goal row. Only depends on the walls, so the
+        result is shared by every pawn position (see DistanceMapCache).
+        :return: tuple with the number of steps from each cell to the goal row, or UNREACHABLE
+        """
+        goal_row = GOAL_ROWS[player_index]
+        open_edges = self.open_edges
+        distances = [UNREACHABLE] * TOTAL_CELLS
+        queue = deque(range(goal_row * SQUARES, (goal_row + 1) * SQUARES))
+        for cell in queue:
+            distances[cell] = 0
+        while queue:
+            cell = queue.popleft()
+            distance = distances[cell] + 1
+            for neighbour in NEIGHBOURS[cell][open_edges[cell]]:
+                if distances[neighbour] == UNREACHABLE:
+                    distances[neighbour] = distance
+                    queue.append(neighbour)
+
+        return tuple(distances)
+
+    def shortest_path_edges(self, player_index):
+        """
+        :return: set of edge_keys along the player's shortest path, or None if the goal is unreachable
+        """
+        path = self.shortest_path(player_index)
+        if path is None:
+            return None
+
+        return {edge_key(cell, neighbour) for cell, neighbour in zip(path, path[1:])}
+
+    def legal_pawn_moves(self, player_index):
+        """
+        A pawn may step to any open, unoccupied neighbour. When an opponent blocks the step the pawn may
+        jump straight over them if nothing is behind them, and may always side-step around them.
+        :return: list of destination cells
+        """
+        origin = self.pawns[player_index]
+        pawns = self.pawns
+        open_edges = self.open_edges
+        moves = []
+        for edge, offset in STEPS:
+            if not open_edges[origin] & edge:
+                continue
+
+            target = origin + offset
+            if target not in pawns:
+                moves.append(target)
+                continue
+
+            if open_edges[target] & edge and target + offset not in pawns:
+                moves.append(target + offset)
+
+            for side_edge, side_offset in PERPENDICULAR_STEPS[edge]:
+                if open_edges[target] & side_edge and target + side_offset not in pawns:
+                    moves.append(target + side_offset)
+
+        return moves
+
+    def legal_action_mask(self, player_index=None, legal_walls=None):
+        """
+        :param player_index: defaults to the player whose turn it is
+        :param legal_walls: the result of legal_walls, if already known (e.g. from a LegalWallCache)
+        :return: (ACTION_SIZE,) boolean mask of the player's legal actions, encoded as in src.actions
+        """
+        if player_index is None:
+            player_index = self.current_player
+
+        mask = np.zeros(ACTION_SIZE, dtype=bool)
+        if self.walls_left[player_index] > 0:
+            mask[self.legal_walls() if legal_walls is None else legal_walls] = True
+
+        origin = self.pawns[player_index]
+        for cell in self.legal_pawn_moves(player_index):
+            mask[PAWN_OFFSET_ACTIONS[cell - origin]] = True
+
+        return mask
+
+    def apply_move(self, action):
+        """
+        Plays an action (encoded as in src.actions) for the player whose turn it is. Actions are assumed
+        to be legal, see legal_action_mask.
+        """
+        player_index = self.current_player
+        if is_wall_action(action):
+            self.place_wall(player_index, action)
+        else:
+            self.move_pawn(player_index, action_destination(self.pawns[player_index], action))
+
+    def undo_move(self):
+        """
+        Takes back the most recent pawn move or wall placement.
+        """
+        player_index, previous_cell, wall, previous_current_player, previous_hash = self.history.pop()
+        if wall is None:
+            self.pawns[player_index] = previous_cell
+        else:
+            self.placed_walls &= ~(1 << wall)
+            self._unblock_edges(wall)
+            self.walls_left[player_index] += 1
+        self.current_player = previous_current_player
+        self.zobrist_hash = previous_hash
+
+    def move_pawn(self, player_index, cell):
+        """
+        Moves are assumed to have been validated by legal_pawn_moves.
+        """
+        previous_cell = self.pawns[player_index]
+        next_player = (player_index + 1) % self.total_players
+        self.history.append((player_index, previous_cell, None, self.current_player, self.zobrist_hash))
+        self.zobrist_hash ^= (
+            ZOBRIST_PAWNS[player_index][previous_cell] ^ ZOBRIST_PAWNS[player_index][cell]
+            ^ ZOBRIST_SIDE[self.current_player] ^ ZOBRIST_SIDE[next_player]
+        )
+        self.pawns[player_index] = cell
+        self.current_player = next_player
+
+    def place_wall(self, player_index, wall):
+        """
+        Walls are assumed to have been validated by is_wall_legal.
+        """
+        walls_left = self.walls_left[player_index]
+        next_player = (player_index + 1) % self.total_players
+        self.history.append((player_index, self.pawns[player_index], wall, self.current_player, self.zobrist_hash))
+        self.zobrist_hash ^= (
+            ZOBRIST_WALLS[wall]
+            ^ ZOBRIST_WALLS_LEFT[player_index][walls_left] ^ ZOBRIST_WALLS_LEFT[player_index][walls_left - 1]
+            ^ ZOBRIST_SIDE[self.current_player] ^ ZOBRIST_SIDE[next_player]
+        )
+        self.placed_walls |= 1 << wall
+        self._block_edges(wall)
+        self.walls_left[player_index] = walls_left - 1
+        self.current_player = next_player
+
+    def _block_edges(self, wall):
+        open_edges = self.open_edges
+        for cell, edge, neighbour, opposite_edge in WALL_BLOCKED_EDGES[wall]:
+            open_edges[cell] &= ~edge
+            open_edges[neighbour] &= ~opposite_edge
+
+    def _unblock_edges(self, wall):
+        open_edges = self.open_edges
+        for cell, edge, neighbour, opposite_edge in WALL_BLOCKED_EDGES[wall]:
+            open_edges[cell] |= edge
+            open_edges[neighbour] |= opposite_edge
+
+    def get_state(self):
+        """
+        Represents the board as 17 X 17 (SPACES X SPACES) matrix, indexed [x, y], with the following notation:
+            2 = all unoccupied walls
+            1 = all occupied walls
+            0 = all unoccupied nodes
+            player number * 10 = player position (and thus the only occupied nodes)
+        :return: flattened matrix
+        """
+        game_state = EMPTY_STATE.copy()
+        for wall in self.iter_placed_walls():
+            col, row, is_vertical = wall_position(wall)
+            x_coord = 2 * col + 1
+            y_coord = 2 * row + 1
+            if is_vertical:
+                game_state[x_coord, y_coord - 1:y_coord + 2] = 1
+            else:
+                game_state[x_coord - 1:x_coord + 2, y_coord] = 1
+
+        for player_index, cell in enumerate(self.pawns):
+            col, row = cell_position(cell)
+            game_state[2 * col, 2 * row] = (player_index + 1) * 10
+
+        return game_state.flatten()
+
+
+EMPTY_STATE = np.full((SPACES, SPACES), 2)
+EMPTY_STATE[::2, ::2] = 0
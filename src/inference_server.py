@@ -0,0 +1,334 @@
+"""
+Local inference service for DQN policies. One server process loads a checkpoint once and answers the
+greedy, legal-action-masked choices of many game workers, which connect with InferenceClient over a
+Unix socket (a named pipe on Windows). Requests arriving within max_latency seconds of each other are
+stacked into one forward pass of up to max_batch_size observations, so concurrent games share the
+model instead of each running batch-of-one passes.
+
+Messages are pickled tuples over multiprocessing.connection:
+    ('act', observations, action_masks) -> ('ok', actions): (n, STATE_SIZE) observations and
+        (n, ACTION_SIZE) boolean masks of the legal actions; actions are the (n,) argmax actions
+    ('reload', path or None) -> ('ok', version): loads new weights (from path, or the served checkpoint
+        again); requests already queued are answered by the old or the new model, never dropped
+    ('info',) -> ('ok', dict) with the checkpoint, model version and request/batch totals
+Failures come back as ('error', message).
+
+Only the server imports torch, so clients stay as light as the headless game workers.
+"""
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from src.actions import ACTION_SIZE
+from src.metrics import Metrics
+
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_LATENCY = 0.002
+
+_Request = namedtuple('_Request', ('connection', 'observations', 'action_masks', 'arrived'))
+
+
+def load_policy_model(path):
+    """
+    :param path: checkpoint saved by QuoridorGym.save_checkpoints
+    :return: the DQN in eval mode
+    """
+    import torch
+    from src.dqn import DQN
+    from src.game_state import GameState
+
+    model = DQN(state_size=len(GameState().get_state()), action_size=ACTION_SIZE)
+    model.load_state_dict(torch.load(path)['model_state_dict'])
+    model.eval()
+    return model
+
+
+class InferenceServer:
+    """
+    Serves the policy model of checkpoint at address (a fresh socket path if None; see self.address).
+    A thread per connection reads requests into a queue; the batching thread takes the oldest request
+    and keeps collecting until max_batch_size observations are waiting or max_latency seconds have passed
+    since that request arrived, then answers them all from one forward pass.
+
+    Weights are hot reloaded with reload(), a 'reload' request or, with watch_interval, whenever the
+    checkpoint file changes on disk: the new model is loaded off the batching thread and swapped in
+    between two batches.
+
+    metrics (by default configured from the environment, see src.metrics) counts requests and batches
+    and times the forward passes.
+    """
+
+    def __init__(
+            self,
+            checkpoint,
+            address=None,
+            max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+            max_latency=DEFAULT_MAX_LATENCY,
+            watch_interval=None,
+            authkey=None,
+            metrics=None
+    ):
+        self.checkpoint = checkpoint
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.watch_interval = watch_interval
+        self.metrics = metrics if metrics is not None else Metrics.from_env()
+        self.model = load_policy_model(checkpoint)
+        self.state_size = self.model.linear_relu[0].in_features
+        self.version = 0
+        self.requests_served = 0
+        self.batches_served = 0
+        self._checkpoint_mtime = os.path.getmtime(checkpoint)
+        self._reload_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._stop = threading.Event()
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        self._threads = []
+
+    def start(self):
+        """
+        Starts serving in background threads and returns.
+        """
+        self.metrics.start()
+        self._start_thread(self._accept, 'inference-accept')
+        self._start_thread(self._batch, 'inference-batch')
+        if self.watch_interval:
+            self._start_thread(self._watch, 'inference-watch')
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self._stop.is_set():
+            return
+
+        self._stop.set()
+        self._requests.put(None)
+        self._listener.close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self.metrics.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def reload(self, path=None):
+        """
+        Loads new weights (from path, or the served checkpoint again) and swaps them in for the next batch.
+        :return: the new model version
+        """
+        with self._reload_lock:
+            path = path or self.checkpoint
+            model = load_policy_model(path)
+            self.checkpoint = path
+            self._checkpoint_mtime = os.path.getmtime(path)
+            self.model = model
+            self.version += 1
+            return self.version
+
+    def info(self):
+        return {
+            'checkpoint': self.checkpoint,
+            'version': self.version,
+            'requests': self.requests_served,
+            'batches': self.batches_served,
+        }
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                # The listener was closed
+                return
+            threading.Thread(target=self._handle, args=(connection,), name='inference-connection', daemon=True).start()
+
+    def _handle(self, connection):
+        """
+        Reads one client's requests. Actions are queued for the batching thread, which replies; anything
+        else is answered here.
+        """
+        with connection:
+            while not self._stop.is_set():
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    if message[0] == 'act':
+                        self._requests.put(self._make_request(connection, *message[1:]))
+                    elif message[0] == 'reload':
+                        connection.send(('ok', self.reload(message[1])))
+                    elif message[0] == 'info':
+                        connection.send(('ok', self.info()))
+                    else:
+                        raise ValueError(f"Unknown request {message[0]!r}; expected act, reload or info")
+                except Exception as error:
+                    connection.send(('error', f"{type(error).__name__}: {error}"))
+
+    def _make_request(self, connection, observations, action_masks):
+        """
+        Checks a request before it is queued, so a malformed one fails on its own instead of its batch.
+        """
+        observations = np.asarray(observations)
+        action_masks = np.asarray(action_masks)
+        state_size = self.state_size
+        if (
+                observations.ndim != 2 or observations.shape[1] != state_size or observations.dtype.kind not in 'biuf'
+                or action_masks.shape != (len(observations), ACTION_SIZE) or action_masks.dtype.kind not in 'biu'
+        ):
+            raise ValueError(
+                f"Expected numeric (n, {state_size}) observations and (n, {ACTION_SIZE}) boolean action masks but got "
+                f"{observations.dtype} {observations.shape} and {action_masks.dtype} {action_masks.shape}"
+            )
+        return _Request(connection, observations, action_masks.astype(bool), time.perf_counter())
+
+    def _batch(self):
+        requests = self._requests
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+
+            batch = [request]
+            rows = len(request.observations)
+            deadline = request.arrived + self.max_latency
+            while rows < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = requests.get(timeout=timeout) if timeout > 0 else requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._serve(batch)
+                    return
+                batch.append(request)
+                rows += len(request.observations)
+
+            self._serve(batch)
+
+    def _serve(self, batch):
+        """
+        Answers a batch; if it cannot be evaluated, every request in it gets the error and serving goes on.
+        """
+        try:
+            replies = self._evaluate(batch)
+        except Exception as error:
+            replies = [('error', f"{type(error).__name__}: {error}")] * len(batch)
+
+        for request, reply in zip(batch, replies):
+            try:
+                request.connection.send(reply)
+            except OSError:
+                # The client has gone; the others still get their answers
+                pass
+
+    def _evaluate(self, batch):
+        import torch
+
+        metrics = self.metrics
+        model = self.model
+        observations = np.concatenate([request.observations for request in batch])
+        action_masks = np.concatenate([request.action_masks for request in batch])
+        with metrics.timer('forward'), torch.no_grad():
+            q_values = model(torch.as_tensor(observations, dtype=torch.float32))
+            q_values[~torch.from_numpy(action_masks)] = float('-inf')
+            actions = torch.argmax(q_values, dim=1).numpy()
+
+        replies = []
+        start = 0
+        for request in batch:
+            stop = start + len(request.observations)
+            replies.append(('ok', actions[start:stop]))
+            start = stop
+
+        self.requests_served += len(batch)
+        self.batches_served += 1
+        metrics.count('requests', len(batch))
+        metrics.count('batches')
+        metrics.observe('batch_size', len(observations))
+        metrics.maybe_report()
+        return replies
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            try:
+                changed = os.path.getmtime(self.checkpoint) != self._checkpoint_mtime
+            except OSError:
+                # Being replaced right now; look again next time
+                continue
+            if changed:
+                try:
+                    self.reload()
+                except Exception as error:
+                    # A half written file; the next change or poll retries
+                    print(f"Could not reload {self.checkpoint}: {error}")
+
+
+class InferenceClient:
+    """
+    Connection to an InferenceServer. A client sends one request at a time, so give every thread or
+    process its own client.
+    """
+
+    def __init__(self, address, authkey=None):
+        self.connection = Client(address, authkey=authkey)
+
+    def select_actions(self, observations, action_masks):
+        """
+        :param observations: (n, STATE_SIZE) observations, e.g. from GameState.get_state or VecQuoridorEnv
+        :param action_masks: (n, ACTION_SIZE) boolean masks of the legal actions
+        :return: (n,) greedy legal actions
+        """
+        observations = np.asarray(observations, dtype=np.int8)
+        return self._call('act', observations, np.asarray(action_masks, dtype=bool))
+
+    def select_action(self, observation, action_mask):
+        return int(self.select_actions(observation[None], action_mask[None])[0])
+
+    def reload(self, path=None):
+        """
+        Asks the server to load new weights.
+        :return: the new model version
+        """
+        return self._call('reload', path)
+
+    def info(self):
+        return self._call('info')
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _call(self, *message):
+        self.connection.send(message)
+        status, payload = self.connection.recv()
+        if status == 'error':
+            raise ValueError(payload)
+        return payload
@@ -0,0 +1,120 @@
+from src.game_state import TOTAL_WALLS, WALL_CONFLICTS, WALL_EDGE_KEYS
+
+
+class LegalWallCache:
+    """
+    Keeps the legal wall set of a GameState up to date across turns instead of
+    recomputing it every move. The cache remembers the pawns and walls it was
+    last computed for and, on each query, works out what changed:
+        1. nothing: the cached set is returned as is
+        2. one wall was placed: walls overlapping or crossing it are dropped and
+           the walls cutting each player's shortest path are re-validated
+        3. one pawn moved: only that player's blocking walls are re-validated
+        4. anything else (a new game, several moves, an undone wall): full recompute
+
+    For every player it keeps the set of placeable walls that would disconnect
+    them from their goal; a wall is legal if it is placeable and in none of them.
+    With verify=True every answer is checked against GameState.legal_walls.
+    """
+
+    def __init__(self, verify=False):
+        self.verify = verify
+        self.full_recomputes = 0
+        self.incremental_updates = 0
+        self._state = None
+        self._pawns = None
+        self._placed_walls = None
+        self._placeable_walls = set()
+        self._path_edges = []
+        self._disconnecting_walls = []
+
+    def get_legal_walls(self, state):
+        """
+        :return: a list of wall indices that are currently eligible to be placed
+        """
+        if state is not self._state:
+            self._recompute(state)
+        elif state.pawns != self._pawns or state.placed_walls != self._placed_walls:
+            self._update(state)
+
+        legal_walls = sorted(self._placeable_walls.difference(*self._disconnecting_walls))
+        if self.verify:
+            expected_walls = state.legal_walls()
+            if legal_walls != expected_walls:
+                raise RuntimeError(
+                    f"Legal wall cache diverged from a full recompute: "
+                    f"missing {sorted(set(expected_walls) - set(legal_walls))}, "
+                    f"unexpected {sorted(set(legal_walls) - set(expected_walls))}"
+                )
+
+        return legal_walls
+
+    def _update(self, state):
+        new_walls = state.placed_walls & ~self._placed_walls
+        removed_walls = self._placed_walls & ~state.placed_walls
+        moved_players = [
+            player_index for player_index, cell in enumerate(state.pawns) if cell != self._pawns[player_index]
+        ]
+
+        if removed_walls or len(moved_players) + bin(new_walls).count("1") != 1:
+            self._recompute(state)
+        elif new_walls:
+            self._apply_wall(state, new_walls.bit_length() - 1)
+        else:
+            self._apply_pawn_move(state, moved_players[0])
+
+    def _recompute(self, state):
+        self.full_recomputes += 1
+        self._state = state
+        self._remember(state)
+        self._placeable_walls = {wall for wall in range(TOTAL_WALLS) if state.is_wall_placeable(wall)}
+        self._path_edges = [None for _ in range(state.total_players)]
+        self._disconnecting_walls = [set() for _ in range(state.total_players)]
+        for player_index in range(state.total_players):
+            self._revalidate_player(state, player_index)
+
+    def _apply_wall(self, state, placed_wall):
+        """
+        Walls only ever remove edges, so walls that already disconnected a player still do. The placed
+        wall's own conflicts become unplaceable and the remaining walls cutting a path are re-checked.
+        """
+        self.incremental_updates += 1
+        self._remember(state)
+        conflicts = WALL_CONFLICTS[placed_wall]
+        self._placeable_walls = {wall for wall in self._placeable_walls if not conflicts >> wall & 1}
+        placed_edge_keys = WALL_EDGE_KEYS[placed_wall]
+        for player_index in range(state.total_players):
+            path_edges = self._path_edges[player_index]
+            if path_edges is None or not placed_edge_keys.isdisjoint(path_edges):
+                self._revalidate_player(state, player_index)
+                continue
+
+            disconnecting_walls = self._disconnecting_walls[player_index] & self._placeable_walls
+            for wall in self._placeable_walls - disconnecting_walls:
+                if not WALL_EDGE_KEYS[wall].isdisjoint(path_edges) and state.wall_disconnects(wall, [player_index]):
+                    disconnecting_walls.add(wall)
+            self._disconnecting_walls[player_index] = disconnecting_walls
+
+    def _apply_pawn_move(self, state, player_index):
+        """
+        The wall layout is unchanged, so only the player who moved can gain or lose blocking walls.
+        """
+        self.incremental_updates += 1
+        self._remember(state)
+        self._revalidate_player(state, player_index)
+
+    def _revalidate_player(self, state, player_index):
+        path_edges = state.shortest_path_edges(player_index)
+        self._path_edges[player_index] = path_edges
+        if path_edges is None:
+            self._disconnecting_walls[player_index] = set(self._placeable_walls)
+            return
+
+        self._disconnecting_walls[player_index] = {
+            wall for wall in self._placeable_walls
+            if not WALL_EDGE_KEYS[wall].isdisjoint(path_edges) and state.wall_disconnects(wall, [player_index])
+        }
+
+    def _remember(self, state):
+        self._pawns = list(state.pawns)
+        self._placed_walls = state.placed_walls
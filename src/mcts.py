@@ -0,0 +1,290 @@
+import math
+import time
+
+import numpy as np
+
+from src.distance_maps import DistanceMapCache
+from src.game_state import GameState
+from src.transposition_table import TranspositionTable
+
+
+class MCTSNode:
+    """
+    An expanded position. Statistics of the edges to its legal actions are kept in arrays on the node,
+    from the point of view of the player to move here, so selection is a handful of vector operations.
+    Children are only created once an edge has been evaluated. Once the node has been a root with
+    Dirichlet noise, network_priors keeps its noise-free priors.
+    """
+    __slots__ = (
+        'actions', 'priors', 'network_priors', 'visits', 'value_sums', 'total_visits', 'children', 'zobrist_hash'
+    )
+
+    def __init__(self, actions, priors, zobrist_hash):
+        self.actions = actions
+        self.priors = priors
+        self.network_priors = None
+        self.visits = np.zeros(len(actions), dtype=np.float64)
+        self.value_sums = np.zeros(len(actions), dtype=np.float64)
+        self.total_visits = 0
+        self.children = {}
+        self.zobrist_hash = zobrist_hash
+
+
+class MCTS:
+    """
+    PUCT Monte Carlo tree search for two player games on a GameState.
+
+    Leaves are scored by model, a network mapping get_state observations either to ACTION_SIZE q-values
+    (a DQN: priors are the softmax of the legal q-values / temperature and the value is
+    tanh(max legal q-value / value_scale)) or to a (policy logits, value in [-1, 1]) tuple. Without a
+    model, priors are uniform and the value comes from the shortest path difference.
+
+    Every round descends batch_size times, adding a virtual loss to each edge on the way so the
+    descents spread over different leaves, and then scores all the new leaves with one forward pass.
+    Searching stops after simulations leaf evaluations or time_budget seconds, whichever comes first
+    (either may be None). The subtree of the position actually reached is kept for the next search.
+    """
+
+    def __init__(
+            self,
+            model=None,
+            simulations=800,
+            time_budget=None,
+            batch_size=16,
+            c_puct=1.5,
+            temperature=1.0,
+            value_scale=10.0,
+            root_dirichlet_alpha=None,
+            root_noise_fraction=0.25,
+            seed=None
+    ):
+        if simulations is None and time_budget is None:
+            raise ValueError("At least one of simulations and time_budget must be given")
+
+        self.model = model
+        self.simulations = simulations
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+        self.c_puct = c_puct
+        self.temperature = temperature
+        self.value_scale = value_scale
+        self.root_dirichlet_alpha = root_dirichlet_alpha
+        self.root_noise_fraction = root_noise_fraction
+        self.rng = np.random.default_rng(seed)
+        self.root = None
+        self.legal_masks = TranspositionTable()
+        self.distance_maps = DistanceMapCache()
+        self.evaluations = 0
+        self.forward_passes = 0
+
+    def best_action(self, game_state, temperature=0):
+        """
+        Searches a private copy of game_state, which is left untouched.
+        :param temperature: 0 plays the most visited action, otherwise actions are sampled in proportion
+        to visits ** (1 / temperature)
+        :return: the chosen action (encoded as in src.actions)
+        """
+        root = self.search(game_state)
+        if temperature == 0:
+            index = int(np.argmax(root.visits))
+        else:
+            weights = root.visits ** (1 / temperature)
+            index = int(self.rng.choice(len(weights), p=weights / weights.sum()))
+
+        return int(root.actions[index])
+
+    def search(self, game_state):
+        """
+        :return: the root node, whose visits give the search policy over root.actions
+        """
+        if game_state.total_players != 2:
+            raise ValueError(f"MCTS requires exactly 2 players but the game has {game_state.total_players}")
+
+        state = GameState.from_position(game_state.position(), game_state.starting_cells, game_state.walls_per_player)
+        self.root = self._reused_root(state.zobrist_hash)
+        if self.root is None:
+            self.root = self._expand([self._leaf(state)])[0][0]
+        if self.root_dirichlet_alpha:
+            # Fresh noise over the network's priors every search, so noise never compounds on a reused root
+            root = self.root
+            if root.network_priors is None:
+                root.network_priors = root.priors
+            noise = self.rng.dirichlet([self.root_dirichlet_alpha] * len(root.actions))
+            root.priors = (1 - self.root_noise_fraction) * root.network_priors + self.root_noise_fraction * noise
+
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        evaluations = 0
+        while self.simulations is None or evaluations < self.simulations:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+
+            batch_size = self.batch_size if self.simulations is None else min(
+                self.batch_size, self.simulations - evaluations
+            )
+            evaluations += self._run_batch(state, batch_size)
+
+        return self.root
+
+    def advance(self, action):
+        """
+        Moves the root to the child reached by action, e.g. after it has been played.
+        """
+        if self.root is None:
+            return
+
+        index = np.flatnonzero(self.root.actions == action)
+        self.root = self.root.children.get(int(index[0])) if index.size else None
+
+    def _reused_root(self, zobrist_hash):
+        """
+        :return: the node of the previous tree for this position, looking up to two moves past the old
+        root (our move and the reply), or None
+        """
+        if self.root is None:
+            return None
+
+        frontier = [self.root]
+        for _ in range(3):
+            for node in frontier:
+                if node.zobrist_hash == zobrist_hash:
+                    return node
+            frontier = [child for node in frontier for child in node.children.values()]
+
+        return None
+
+    def _run_batch(self, state, batch_size):
+        """
+        Descends up to batch_size times with virtual losses, then evaluates and backs up every leaf.
+        :return: the number of simulations completed
+        """
+        paths = []
+        leaves = []
+        pending = set()
+        completed = 0
+        for _ in range(batch_size):
+            path, value = self._descend(state)
+            leaf_edge = (id(path[-1][0]), path[-1][1])
+            if value is None and leaf_edge in pending:
+                # Another descent of this batch is already evaluating this leaf
+                self._revert_virtual_loss(path)
+                self._undo(state, path)
+                break
+
+            if value is None:
+                pending.add(leaf_edge)
+                paths.append(path)
+                leaves.append(self._leaf(state))
+            else:
+                self._backup(path, value)
+            self._undo(state, path)
+            completed += 1
+
+        if leaves:
+            children, values = self._expand(leaves)
+            for path, child, value in zip(paths, children, values):
+                node, index = path[-1]
+                node.children[index] = child
+                self._backup(path, value)
+
+        return completed
+
+    def _descend(self, state):
+        """
+        Follows the PUCT choice from the root until it reaches an edge without a child, playing the
+        moves on state and adding a virtual loss to every edge taken.
+        :return: (path of (node, edge index), value) where value is None for a leaf awaiting evaluation,
+        else the value of the finished game for the player to move at its end
+        """
+        node = self.root
+        path = []
+        while True:
+            exploration = self.c_puct * math.sqrt(node.total_visits + 1) / (1 + node.visits)
+            q_values = node.value_sums / np.maximum(node.visits, 1)
+            index = int(np.argmax(q_values + exploration * node.priors))
+            node.visits[index] += 1
+            node.value_sums[index] -= 1
+            node.total_visits += 1
+            path.append((node, index))
+            mover = state.current_player
+            state.apply_move(int(node.actions[index]))
+            if state.is_winner(mover):
+                return path, -1.0
+
+            child = node.children.get(index)
+            if child is None:
+                return path, None
+            node = child
+
+    def _backup(self, path, value):
+        """
+        :param value: value of the position at the end of path for the player to move there
+        """
+        for node, index in reversed(path):
+            value = -value
+            # The visit was already counted by the virtual loss; replace the loss with the real value
+            node.value_sums[index] += value + 1
+
+    @staticmethod
+    def _revert_virtual_loss(path):
+        for node, index in path:
+            node.visits[index] -= 1
+            node.value_sums[index] += 1
+            node.total_visits -= 1
+
+    @staticmethod
+    def _undo(state, path):
+        for _ in path:
+            state.undo_move()
+
+    def _leaf(self, state):
+        """
+        :return: (zobrist_hash, legal action mask, observation, heuristic value) of the position, taken
+        while the descent is still at it; only the inputs needed by the evaluation are computed
+        """
+        mask = self.legal_masks.get_or_compute(state.zobrist_hash, state.legal_action_mask)
+        if self.model is None:
+            return state.zobrist_hash, mask, None, self._heuristic_value(state)
+
+        return state.zobrist_hash, mask, state.get_state(), None
+
+    def _expand(self, leaves):
+        """
+        Scores all leaves with a single forward pass of the model.
+        :return: (nodes, values) with a new node for each leaf and its value for the player to move
+        """
+        hashes, masks, observations, values = zip(*leaves)
+        masks = np.stack(masks)
+        if self.model is None:
+            logits = np.zeros(masks.shape, dtype=np.float64)
+        else:
+            logits, values = self._evaluate(np.stack(observations), masks)
+
+        self.evaluations += len(leaves)
+        nodes = []
+        for zobrist_hash, mask, leaf_logits in zip(hashes, masks, logits):
+            actions = np.flatnonzero(mask)
+            legal_logits = leaf_logits[actions] - leaf_logits[actions].max()
+            priors = np.exp(legal_logits)
+            nodes.append(MCTSNode(actions, priors / priors.sum(), zobrist_hash))
+
+        return nodes, values
+
+    def _evaluate(self, observations, masks):
+        import torch
+
+        self.forward_passes += 1
+        with torch.no_grad():
+            output = self.model(torch.as_tensor(observations, dtype=torch.float32))
+
+        if isinstance(output, tuple):
+            logits, values = output
+            return logits.double().numpy(), values.reshape(-1).double().numpy()
+
+        q_values = output.double().numpy()
+        best_q_values = np.where(masks, q_values, -np.inf).max(axis=1)
+        return q_values / self.temperature, np.tanh(best_q_values / self.value_scale)
+
+    def _heuristic_value(self, state):
+        player = state.current_player
+        distances = [self.distance_maps.get(state, index)[state.pawns[index]] for index in range(2)]
+        return math.tanh((distances[1 - player] - distances[player]) / 4)
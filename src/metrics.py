@@ -0,0 +1,363 @@
+"""
+Training instrumentation: timers and counters cheap enough for the hot loop, aggregated every
+report_every seconds into a row of rates and averages that is handed to each sink.
+
+Everything is switchable without code edits through environment variables (or the matching
+`python -m quoridor train` flags):
+    QUORIDOR_METRICS: comma separated sinks, any of console, csv:<path>, jsonl:<path> and
+        tensorboard:<log dir> (default console; off disables instrumentation)
+    QUORIDOR_METRICS_EVERY: seconds between reports (default 10)
+    QUORIDOR_PROFILE: cprofile:<path> dumps cProfile stats (for pstats or snakeviz) on close, and
+        sample:<path> writes a sampled profile of the training thread in the folded stack format of
+        flamegraph.pl / speedscope (the same as `py-spy record --format raw`)
+"""
+import cProfile
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+DEFAULT_REPORT_EVERY = 10.0
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+class _Timer:
+    """
+    Reused context manager adding the time spent inside it to its metric. Not reentrant: the same
+    name must not be timed inside itself.
+    """
+    __slots__ = ('totals', 'calls', 'name', 'start')
+
+    def __init__(self, totals, calls, name):
+        self.totals = totals
+        self.calls = calls
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.totals[self.name] += time.perf_counter() - self.start
+        self.calls[self.name] += 1
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Collects, between two reports:
+        timers: total seconds and calls of each timed block (timer), reported as the mean
+            milliseconds per call (<name>_ms) and the share of wall time spent in it (<name>_share)
+        counters: events such as steps or games (count), reported as totals and per second rates
+            (<name>_per_second)
+        observations: values such as losses (observe), reported as their mean over the period
+        gauges: the latest value of anything else, e.g. epsilon or the buffer fill (gauge)
+    With enabled=False every call is a no-op, so instrumented code needs no branches.
+    """
+
+    def __init__(self, sinks=(), report_every=DEFAULT_REPORT_EVERY, enabled=True, profiler=None):
+        self.sinks = list(sinks)
+        self.report_every = report_every
+        self.enabled = enabled
+        self.profiler = profiler
+        self.totals = Counter()
+        self._timer_seconds = defaultdict(float)
+        self._timer_calls = Counter()
+        self._timers = {}
+        self._counts = Counter()
+        self._observations = defaultdict(list)
+        self._gauges = {}
+        self._started = time.perf_counter()
+        self._last_report = self._started
+
+    def start(self):
+        """
+        Restarts the clock (so set-up time is not reported as part of the first period) and starts the
+        profiler, if any; call it when the loop being measured begins.
+        """
+        self._started = self._last_report = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.start()
+
+    @classmethod
+    def from_env(cls, metrics=None, report_every=None, profile=None):
+        """
+        Builds Metrics from the environment variables; arguments given (in the same format) take
+        precedence over them.
+        """
+        metrics = os.environ.get('QUORIDOR_METRICS', 'console') if metrics is None else metrics
+        if report_every is None:
+            report_every = float(os.environ.get('QUORIDOR_METRICS_EVERY', DEFAULT_REPORT_EVERY))
+        profile = os.environ.get('QUORIDOR_PROFILE') if profile is None else profile
+
+        specs = [spec.strip() for spec in metrics.split(',') if spec.strip()]
+        enabled = specs != ['off']
+        sinks = [make_sink(spec) for spec in specs] if enabled else []
+        return cls(sinks, report_every, enabled, make_profiler(profile) if profile else None)
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = _Timer(self._timer_seconds, self._timer_calls, name)
+        return timer
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self._counts[name] += amount
+
+    def observe(self, name, value):
+        if self.enabled:
+            self._observations[name].append(value)
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self._gauges[name] = value
+
+    def maybe_report(self):
+        """
+        Reports if report_every seconds have passed since the last report; call it once per step.
+        """
+        if self.enabled and time.perf_counter() - self._last_report >= self.report_every:
+            self.report()
+
+    def report(self):
+        """
+        Aggregates everything collected since the last report, sends the row to every sink and starts
+        a new period.
+        :return: the row
+        """
+        now = time.perf_counter()
+        seconds = max(now - self._last_report, 1e-9)
+        self.totals.update(self._counts)
+        row = {'time': now - self._started}
+        for name, count in self._counts.items():
+            row[name] = self.totals[name]
+            row[f'{name}_per_second'] = count / seconds
+        for name, values in self._observations.items():
+            row[name] = sum(values) / len(values)
+        row.update(self._gauges)
+        for name, total in self._timer_seconds.items():
+            row[f'{name}_ms'] = 1000 * total / self._timer_calls[name]
+            row[f'{name}_share'] = total / seconds
+
+        for sink in self.sinks:
+            sink.write(row)
+
+        self._timer_seconds.clear()
+        self._timer_calls.clear()
+        self._counts.clear()
+        self._observations.clear()
+        self._last_report = now
+        return row
+
+    def close(self):
+        """
+        Reports what is left of the last period and closes the sinks and the profiler.
+        """
+        if self.enabled and (self._counts or self._observations or self._timer_calls):
+            self.report()
+        for sink in self.sinks:
+            sink.close()
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+
+
+def make_sink(spec):
+    kind, _, path = spec.partition(':')
+    if kind == 'console':
+        return ConsoleSink()
+    if not path:
+        raise ValueError(f"Metrics sink {spec!r} needs a path, e.g. {kind}:runs/metrics")
+    if kind == 'csv':
+        return CsvSink(path)
+    if kind == 'jsonl':
+        return JsonlSink(path)
+    if kind == 'tensorboard':
+        return TensorBoardSink(path)
+
+    raise ValueError(f"Unknown metrics sink {spec!r}; expected console, csv:, jsonl: or tensorboard:")
+
+
+def make_profiler(spec):
+    kind, _, path = spec.partition(':')
+    if kind not in ('cprofile', 'sample') or not path:
+        raise ValueError(f"Unknown profile {spec!r}; expected cprofile:<path> or sample:<path>")
+
+    return CProfiler(path) if kind == 'cprofile' else SamplingProfiler(path)
+
+
+def _ensure_parent_dir(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+class ConsoleSink:
+    """
+    One line per report with the headline numbers.
+    """
+    HEADLINES = (
+        'steps', 'steps_per_second', 'games', 'games_per_second', 'learn_steps', 'learn_steps_per_second', 'loss',
+        'epsilon', 'buffer_fill',
+    )
+
+    def write(self, row):
+        headlines = [f"{name} {row[name]:.4g}" for name in self.HEADLINES if name in row]
+        timers = [f"{name[:-3]} {value:.3g}ms" for name, value in row.items() if name.endswith('_ms')]
+        print(f"[{row['time']:.0f}s] " + ', '.join(headlines) + (' | ' + ', '.join(timers) if timers else ''))
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    def __init__(self, path):
+        _ensure_parent_dir(path)
+        self.file = open(path, 'a')
+
+    def write(self, row):
+        self.file.write(json.dumps(row) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink:
+    """
+    Rows are appended to the file as they come. Columns are the keys seen so far; when a report brings a
+    new one (e.g. the loss once learning starts) the file is read back and rewritten with the wider
+    header, which happens only a few times per run.
+    """
+
+    def __init__(self, path):
+        _ensure_parent_dir(path)
+        self.path = path
+        self.fieldnames = []
+        self.file = None
+        self.writer = None
+
+    def write(self, row):
+        new_fields = [name for name in row if name not in self.fieldnames]
+        if new_fields or self.file is None:
+            self._rewrite(self.fieldnames + new_fields)
+        self.writer.writerow(row)
+        self.file.flush()
+
+    def _rewrite(self, fieldnames):
+        rows = []
+        if self.file is not None:
+            self.file.close()
+            with open(self.path, newline='') as file:
+                rows = list(csv.DictReader(file))
+        self.fieldnames = fieldnames
+        self.file = open(self.path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames)
+        self.writer.writeheader()
+        self.writer.writerows(rows)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class TensorBoardSink:
+    """
+    Scalars for TensorBoard, stepped by the number of env steps. Needs the tensorboard package.
+    """
+
+    def __init__(self, log_dir):
+        try:
+            from torch.utils.tensorboard import SummaryWriter
+        except ImportError as error:
+            raise ImportError("The tensorboard metrics sink needs the tensorboard package") from error
+
+        self.writer = SummaryWriter(log_dir)
+
+    def write(self, row):
+        step = int(row.get('steps', row['time']))
+        for name, value in row.items():
+            self.writer.add_scalar(name, value, step)
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+class CProfiler:
+    def __init__(self, path):
+        self.path = path
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        _ensure_parent_dir(self.path)
+        self.profile.dump_stats(self.path)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the thread that started it every interval seconds from a background thread
+    and writes one 'frame;frame;... count' line per distinct stack. Unlike cProfile it does not hook
+    every call, so timings stay representative, but the sampler thread takes the GIL to walk the stack,
+    which adds a small overhead in proportion to the sampling rate.
+    """
+
+    def __init__(self, path, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample, name='quoridor-sampler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        if self._sampler is None:
+            return
+
+        self._stop.set()
+        self._sampler.join()
+        _ensure_parent_dir(self.path)
+        with open(self.path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
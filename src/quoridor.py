@@ -1,29 +1,40 @@
 import os
 import pygame
 from pygame.sprite import Group
+from src.actions import ACTION_SIZE
 from src.board import Board
 from src.constants import (
     DEFAULT_FONT_SIZE,
     SCREEN_SIZE_X,
     SCREEN_SIZE_Y,
+    SQUARES,
     GAME_SIZE,
     CELL,
     HALF_DISTANCE,
-    TERMINAL_NODE_Y,
-    WALL_EDGE_COORD,
 )
 from src.directions import Direction
-from src.dqn import DQN
-from src.player import AIPlayer
+from src.distance_maps import DistanceMapCache
+from src.legal_wall_cache import LegalWallCache
+from src.metrics import Metrics
 from src.render_mixin import RenderMixin
 from src.rules_mixin import QuoridorRulesMixin
-import time
-import torch
+from src.transposition_table import TranspositionTable
 import warnings
 
 
 class Quoridor(RenderMixin, QuoridorRulesMixin):
-    def __init__(self, players=None, font_size=DEFAULT_FONT_SIZE):
+    def __init__(
+            self,
+            players=None,
+            font_size=DEFAULT_FONT_SIZE,
+            verify_legal_walls=False,
+            game_records=None,
+            render_every=1
+    ):
+        """
+        :param game_records: GameRecordWriter that every game played is appended to (see src.game_record)
+        :param render_every: draw a frame every this many moves; 0 or None never draws (see RenderMixin)
+        """
         # Set up game infrastructure.
         pygame.init()
         pygame.display.set_caption("Quoridor")
@@ -33,13 +44,19 @@ class Quoridor(RenderMixin, QuoridorRulesMixin):
 
         # Set up players and board.
         self.players = players if players else self.default_players()
-        self.board = Board()
-        self.action_space = self.default_action_space()
+        self.distance_maps = DistanceMapCache()
+        self.board = Board(distance_maps=self.distance_maps)
+        self.legal_wall_cache = LegalWallCache(verify=verify_legal_walls)
+        self.transpositions = TranspositionTable()
+        self.game_records = game_records
+        self.render_every = render_every
         self.player_group = Group()
         self.player_group.add(self.players)
 
     @staticmethod
     def default_players():
+        from src.ai_player import AIPlayer
+
         return [
             AIPlayer(
                 index=0,
@@ -57,53 +74,23 @@ class Quoridor(RenderMixin, QuoridorRulesMixin):
             ),
         ]
 
-    def default_action_space(
-            self,
-            eligible_movements=(
-                    (Direction.UP, Direction.UP),
-                    (Direction.UP, Direction.RIGHT),
-                    (Direction.UP, Direction.LEFT),
-                    (Direction.DOWN, Direction.DOWN),
-                    (Direction.DOWN, Direction.RIGHT),
-                    (Direction.DOWN, Direction.LEFT),
-                    (Direction.RIGHT, Direction.DOWN),
-                    (Direction.RIGHT, Direction.UP),
-                    (Direction.RIGHT, Direction.UP),
-                    (Direction.LEFT, Direction.DOWN),
-                    (Direction.LEFT, Direction.RIGHT),
-                    (Direction.LEFT, Direction.LEFT),
-                    Direction.UP,
-                    Direction.DOWN,
-                    Direction.RIGHT,
-                    Direction.LEFT
-            )
-    ):
-        wall_actions = [wall.rect.center for wall in self.board.walls if WALL_EDGE_COORD not in wall.rect.center]
-        pawn_actions = [direction_tuple for direction_tuple in eligible_movements]
-        action_list = wall_actions + pawn_actions
-        return action_list
-
-    def run_game(self):
+    def run_game(self, max_games=None):
+        """
+        Plays until the window is closed, or until max_games games have been won. A game ends at its
+        first win: it is recorded (see game_records) and the board is reset for the next one.
+        :param max_games: number of games to play; None plays on until the window is closed
+        :return: the number of games played
+        """
+        games_played = 0
         current_player_index = 0
-        while True:
+        while max_games is None or games_played < max_games:
             current_player = self.players[current_player_index]
             if current_player.is_ai:
-                success = False
-                while not success:
-                    board = self.board
-                    state = board.get_state(self.players)
-                    legal_move_dict = self._get_legal_moves(current_player)
-                    action_index = current_player.choose_action_index(self.action_space, state, legal_move_dict)
-                    action = self.action_space[action_index]
-                    if action in legal_move_dict['place_wall']:
-                        current_player.place_wall(board, action)
-                    else:
-                        node = legal_move_dict['move_pawn'].get(action)
-                        current_player.move_player(board, node.rect.center)
-
-                    success = True
-
-                current_player_index = (current_player_index + 1) % len(self.players)
+                self._handle_quit(pygame.event.get())
+                state = self.board.get_state()
+                legal_action_mask = self._get_legal_action_mask(current_player)
+                action_index = current_player.choose_action_index(state, legal_action_mask, game_state=self.board.state)
+                self._apply_action(current_player, action_index)
                 self._render(current_player)
 
             else:
@@ -111,20 +98,16 @@ class Quoridor(RenderMixin, QuoridorRulesMixin):
                 while not success:
                     events = pygame.event.get()
                     pos = pygame.mouse.get_pos()
+                    self._handle_quit(events)
                     for event in events:
-                        if event.type == pygame.QUIT:
-                            pygame.quit()
-                            quit()
-                        elif event.type == pygame.MOUSEBUTTONDOWN:
-                            wall_to_place = next(
-                                (wall for wall in self.board.walls if wall.rect.collidepoint(pos))
-                                , None
-                            )
+                        if event.type == pygame.MOUSEBUTTONDOWN:
+                            wall_to_place = self.board.get_wall_at_pixel(pos)
                             if not wall_to_place:
                                 success = False
                                 continue
 
-                            if self._wall_is_legal(wall_to_place) and current_player.total_walls > 0:
+                            walls_left = self.board.state.walls_left[current_player.index]
+                            if walls_left > 0 and self._wall_is_legal(wall_to_place):
                                 current_player.place_wall(self.board, wall_to_place.rect.center)
                                 success = True
                         elif event.type == pygame.KEYDOWN:
@@ -136,24 +119,62 @@ class Quoridor(RenderMixin, QuoridorRulesMixin):
                                 adjacent_movement = key_list[0]
                                 legal_adjacent_moves = self._get_legal_adjacent_moves(current_player)
                                 if adjacent_movement in legal_adjacent_moves:
-                                    new_node = legal_adjacent_moves[adjacent_movement]
-                                    current_player.move_player(self.board, new_node.rect.center)
+                                    current_player.move_player(self.board, legal_adjacent_moves[adjacent_movement])
                                     success = True
 
                             elif key_list:
                                 movement = key_list[0]
                                 legal_lateral_moves = self._get_legal_lateral_moves(current_player)
                                 if movement in legal_lateral_moves:
-                                    new_node = legal_lateral_moves[movement]
-                                    current_player.move_player(self.board, new_node.rect.center)
+                                    current_player.move_player(self.board, legal_lateral_moves[movement])
                                     success = True
 
-                    self._render(current_player)
+                        # Only one move per turn, however many events came in with it
+                        if success:
+                            break
+
+                    self._render(current_player, force=True)
+
+            if self._is_winner(current_player):
+                self._reset_env()
+                games_played += 1
+                current_player_index = 0
+            else:
                 current_player_index = (current_player_index + 1) % len(self.players)
 
-    @staticmethod
-    def _is_winner(current_player):
-        return TERMINAL_NODE_Y[current_player.index] == current_player.rect.center[1]
+        if self.game_records is not None:
+            self.game_records.flush()
+        return games_played
+
+    def _handle_quit(self, events):
+        """
+        Records the game in progress and exits if the window was closed.
+        """
+        if any(event.type == pygame.QUIT for event in events):
+            self._close_game_records()
+            pygame.quit()
+            quit()
+
+    def _reset_env(self):
+        """
+        Records the game just played and sets up the board and players for the next one.
+        """
+        if self.game_records is not None:
+            self.game_records.write_game(self.board.state)
+        for player in self.players:
+            player.reset()
+        self.board.reset()
+
+    def _is_winner(self, current_player):
+        return self.board.state.is_winner(current_player.index)
+
+    def _close_game_records(self):
+        """
+        Records the game in progress, if any, and closes the writer.
+        """
+        if self.game_records is not None:
+            self.game_records.write_game(self.board.state)
+            self.game_records.close()
 
 
 class QuoridorGym(Quoridor):
@@ -161,12 +182,26 @@ class QuoridorGym(Quoridor):
             self,
             games_to_sim=1000,
             update_target_every=50,
-            model_filenames=None
+            model_filenames=None,
+            metrics=None,
+            game_records=None,
+            render_every=1,
+            checkpoints=None
     ):
-        super().__init__()
+        """
+        :param metrics: Metrics instrumenting the training loop; by default configured from the
+        environment (see src.metrics)
+        :param game_records: GameRecordWriter that every self-play game is appended to
+        :param render_every: draw a frame every this many training steps; 0 or None never draws
+        :param checkpoints: CheckpointManager to resume the session from (its latest checkpoint, if any)
+        and to save the full training state to as it runs
+        """
+        super().__init__(game_records=game_records, render_every=render_every)
         self.update_target_every = update_target_every
         self.games_to_sim = games_to_sim
         self.model_filenames = model_filenames
+        self.metrics = metrics if metrics is not None else Metrics.from_env()
+        self.checkpoints = checkpoints
         self.give_players_a_brain()
 
     def give_players_a_brain(self):
@@ -174,8 +209,11 @@ class QuoridorGym(Quoridor):
 
         :return:
         """
-        state_size = len(self.board.get_state(self.players))
-        action_size = len(self.action_space)
+        import torch
+        from src.dqn import DQN
+
+        state_size = len(self.board.get_state())
+        action_size = ACTION_SIZE
         for player in self.players:
             player.policy_model = DQN(action_size=action_size, state_size=state_size)
             player.target_model = DQN(action_size=action_size, state_size=state_size)
@@ -196,26 +234,42 @@ class QuoridorGym(Quoridor):
                     warnings.warn('Model filenames were given but none were found; base models will be used for the remainder of the training')
 
     def run_training_session(self):
-        losses = []
+        self.metrics.start()
+        try:
+            self._run_training_session()
+        finally:
+            if self.checkpoints is not None:
+                self.checkpoints.close()
+            self.metrics.close()
+            self._close_game_records()
+
+    def _run_training_session(self):
+        metrics = self.metrics
+        checkpoints = self.checkpoints
         batch_size = 1000
+        episodes = 2
         current_player_index = 0
         total_loops = 0
+        start_episode = 0
+        losses = []
+        if checkpoints is not None:
+            restored = checkpoints.restore(self.players)
+            if restored is not None:
+                total_loops, extra = restored
+                start_episode = extra['episode']
+
         current_player = self.players[current_player_index]
         while len(current_player.memory) < batch_size:
-            print(len(current_player.memory))
             current_player = self.players[current_player_index]
             state, action_index, next_state, reward, done = self._step(current_player)
             current_player.memory.push_memory(state, action_index, next_state, reward, done)
+            self._record_step(current_player, done)
             total_loops += 1
             if done:
                 self._reset_env()
             current_player_index = (current_player_index + 1) % len(self.players)
 
-        start_time = 0
-        end_time = 0
-        for episode in range(2):
-            print(f"Episode #{episode}; time elapsed between last episode: {end_time - start_time}")
-            start_time = time.time()
+        for episode in range(start_episode, episodes):
             done = False
             next_player_index = 0
             while not done:
@@ -223,65 +277,78 @@ class QuoridorGym(Quoridor):
                 current_player = self.players[current_player_index]
                 state, action_index, next_state, reward, done = self._step(current_player)
                 current_player.memory.push_memory(state, action_index, next_state, reward, done)
-                self._render(current_player)
+                with metrics.timer('render'):
+                    self._render(current_player)
                 if done:
                     self._reset_env()
                 batch_samples = current_player.memory.sample_memories(batch_size)
-                loss = current_player.learn(batch_samples)
-                losses.append(loss)
+                with metrics.timer('learn'):
+                    loss = current_player.learn(batch_samples)
+                metrics.observe('loss', loss)
+                metrics.count('learn_steps')
+                self._record_step(current_player, done)
                 total_loops += 1
+                losses.append(loss)
+                if checkpoints is not None:
+                    with metrics.timer('checkpoint'):
+                        score = sum(losses) / len(losses)
+                        if checkpoints.maybe_save(total_loops, self.players, {'episode': episode}, score):
+                            losses = []
                 next_player_index = (current_player_index + 1) % len(self.players)
                 if episode % self.update_target_every == 0:
                     current_player.update_target_network()
                     self.players[current_player_index].update_target_network()
 
-            end_time = time.time()
             current_player.adjust_epsilon()
+            metrics.count('episodes')
 
-            print(losses[-1])
-
-        for player in self.players:
-            filename = self.model_filenames[player.index]
-            self.save_checkpoints(player.policy_model, player.optimizer, filename)
+        with metrics.timer('checkpoint'):
+            if checkpoints is not None and losses:
+                checkpoints.save(total_loops, self.players, {'episode': episodes}, sum(losses) / len(losses))
+            for player in self.players:
+                filename = self.model_filenames[player.index]
+                self.save_checkpoints(player.policy_model, player.optimizer, filename)
 
-    def _reset_env(self):
-        for player in self.players:
-            player.reset()
-        self.board = Board()
-        self.player_group = Group()
-        self.player_group.add(self.players)
+    def _record_step(self, current_player, done):
+        metrics = self.metrics
+        metrics.count('steps')
+        if done:
+            metrics.count('games')
+        metrics.gauge('epsilon', current_player.epsilon)
+        metrics.gauge('buffer_fill', len(current_player.memory) / current_player.memory.max_memory_capacity)
+        metrics.maybe_report()
 
     def _step(self, current_player):
-        board = self.board
-        state = board.get_state(self.players)
-        legal_move_dict = self._get_legal_moves(current_player)
-        action_index = current_player.choose_action_index(self.action_space, state, legal_move_dict)
-        action = self.action_space[action_index]
-        if action in legal_move_dict['place_wall']:
-            current_player.place_wall(board, action)
-        else:
-            node = legal_move_dict['move_pawn'].get(action)
-            current_player.move_player(board, node.rect.center)
-
-        next_state = board.get_state(self.players)
-        done = self._is_winner(current_player)
-        reward = self._assign_reward(current_player, done)
+        metrics = self.metrics
+        with metrics.timer('env_step'):
+            board = self.board
+            state = board.get_state()
+            with metrics.timer('legal_moves'):
+                legal_action_mask = self._get_legal_action_mask(current_player)
+            with metrics.timer('choose_action'):
+                action_index = current_player.choose_action_index(
+                    state, legal_action_mask, game_state=self.board.state
+                )
+            self._apply_action(current_player, action_index)
+            next_state = board.get_state()
+            done = self._is_winner(current_player)
+            reward = self._assign_reward(current_player, done)
         return state, action_index, next_state, reward, done
 
     def _assign_reward(self, current_player, done):
         if done:
-            max_distance = SCREEN_SIZE_Y - HALF_DISTANCE
             next_player_index = (current_player.index + 1) % len(self.players)
-            y_distance = current_player.rect.centery - self.players[next_player_index].rect.centery
-            reward = 10*(1 - abs(y_distance/max_distance))
-            print(reward)
-            return reward
-
-        print(-0.1)
-        return -0.1
+            opponent_distance = self.board.distance_to_goal(self.players[next_player_index])
+            reward = 10*min(opponent_distance/(SQUARES - 1), 1)
+        else:
+            reward = -0.1
+        self.metrics.observe('reward', reward)
+        return reward
 
     @staticmethod
     def save_checkpoints(model, optimizer, filename):
+        import torch
+
         checkpoint = {
             'model_state_dict': model.state_dict(),
             'optimizer_state_dict': optimizer.state_dict()
@@ -290,6 +357,8 @@ class QuoridorGym(Quoridor):
 
     @staticmethod
     def load_checkpoints(policy_model, target_model, optimizer, filename):
+        import torch
+
         checkpoint = torch.load(filename)
         policy_model.load_state_dict(checkpoint['model_state_dict'])
         target_model.load_state_dict(checkpoint['model_state_dict'])
@@ -1,36 +1,141 @@
+from collections import namedtuple
+
 import pygame
 from src.player import Player
-from src.constants import GAME_SIZE, SEMI_BLACK, WHITE
+from src.constants import GAME_SIZE, SCREEN_SIZE_X, SCREEN_SIZE_Y, SEMI_BLACK, WHITE
+
+INFO_PANEL_RECT = pygame.Rect(int(GAME_SIZE), 0, int(SCREEN_SIZE_X - GAME_SIZE), int(SCREEN_SIZE_Y))
+
+# What the last drawn frame showed, to find what has to be repainted
+ScreenSnapshot = namedtuple(
+    'ScreenSnapshot', ('placed_walls', 'player_rects', 'walls_left', 'current_player', 'hovered_wall')
+)
 
 
 class RenderMixin:
-    def _render(self, current_player: Player, render_win_screen=False):
+    """
+    Draws the game incrementally. The first frame, and any frame after walls were taken off the board
+    (a new game), is drawn in full; every other frame compares a snapshot of the game with the last
+    frame drawn and repaints only the rectangles that changed (placed walls, moved pawns, the hovered
+    wall segment and the info panel), pushing just those to the display. Text surfaces are rendered
+    once and cached, and the hovered wall is found with one grid lookup per frame.
+
+    render_every sets how many _render calls make one frame: 1 draws every move, n every nth move and
+    0 or None never, e.g. for training or AI-vs-AI games. Frames forced by waiting for a human move
+    are always drawn.
+    """
+    render_every = 1
+    _render_calls = 0
+    _screen_snapshot = None
+    _hovered_wall = None
+    _text_cache = None
+
+    def _render(self, current_player: Player, render_win_screen=False, force=False):
+        self._render_calls += 1
+        if not force and (not self.render_every or self._render_calls % self.render_every):
+            return
+
+        snapshot = self._take_screen_snapshot(current_player)
+        previous = self._screen_snapshot
+        if previous is None or previous.placed_walls & ~snapshot.placed_walls:
+            self._render_full_frame(current_player)
+        else:
+            dirty_rects = self._dirty_rects(previous, snapshot)
+            for rect in dirty_rects:
+                self._repaint(rect, current_player)
+            if dirty_rects:
+                pygame.display.update(dirty_rects)
+        self._screen_snapshot = snapshot
+
+        if self._is_winner(current_player) and render_win_screen:
+            self._render_winner_screen(current_player=current_player)
+            self._screen_snapshot = None
+
+    def _take_screen_snapshot(self, current_player):
+        state = self.board.state
+        return ScreenSnapshot(
+            placed_walls=state.placed_walls,
+            player_rects=tuple(tuple(player.rect) for player in self.players),
+            walls_left=tuple(state.walls_left),
+            current_player=current_player.index,
+            hovered_wall=self._update_hovered_wall(),
+        )
+
+    def _update_hovered_wall(self):
+        """
+        Highlights the free wall segment under the mouse, if any, and clears the previous highlight.
+        :return: the hovered segment or None
+        """
+        wall = self.board.get_wall_at_pixel(pygame.mouse.get_pos())
+        previous = self._hovered_wall
+        if previous is not None and previous is not wall and not previous.is_occupied:
+            previous.image = previous.original_image
+        if wall is not None:
+            wall.image = wall.hover_image
+        self._hovered_wall = wall
+        return wall
+
+    def _dirty_rects(self, previous, snapshot):
+        board = self.board
+        dirty_rects = []
+        new_walls = snapshot.placed_walls & ~previous.placed_walls
+        for wall in range(new_walls.bit_length()):
+            if new_walls >> wall & 1:
+                # The anchor segment's rect now spans the whole placed wall
+                dirty_rects.append(board.get_wall_sprite(wall).rect.copy())
+        for old_rect, new_rect in zip(previous.player_rects, snapshot.player_rects):
+            if old_rect != new_rect:
+                dirty_rects.extend((pygame.Rect(old_rect), pygame.Rect(new_rect)))
+        if previous.hovered_wall is not snapshot.hovered_wall:
+            dirty_rects.extend(wall.rect.copy() for wall in (previous.hovered_wall, snapshot.hovered_wall) if wall)
+        if previous.walls_left != snapshot.walls_left or previous.current_player != snapshot.current_player:
+            dirty_rects.append(INFO_PANEL_RECT.copy())
+
+        return dirty_rects
+
+    def _render_full_frame(self, current_player):
         self.screen.fill(WHITE)
-        self.board.walls.update()
         self.board.walls.draw(self.screen)
         self.board.nodes.draw(self.screen)
         self.player_group.draw(self.screen)
         self._render_metadata(current_player)
-        if self._is_winner(current_player) and render_win_screen:
-            self._render_winner_screen(current_player=current_player)
         pygame.display.flip()
 
+    def _repaint(self, rect, current_player):
+        """
+        Redraws everything overlapping rect, clipped to it.
+        """
+        screen = self.screen
+        screen.set_clip(rect)
+        screen.fill(WHITE)
+        for group in (self.board.walls, self.board.nodes, self.player_group):
+            for sprite in group:
+                if sprite.rect.colliderect(rect):
+                    screen.blit(sprite.image, sprite.rect)
+        if rect.colliderect(INFO_PANEL_RECT):
+            self._render_metadata(current_player)
+        screen.set_clip(None)
+
+    def _render_text(self, text, color):
+        if self._text_cache is None:
+            self._text_cache = {}
+
+        key = (text, tuple(color))
+        surface = self._text_cache.get(key)
+        if surface is None:
+            surface = self._text_cache[key] = self.font.render(text, False, color)
+        return surface
+
     def _render_metadata(self, current_player: Player):
         self.screen.blit(
-            self.font.render(
-                f"Current player: {current_player.name}", False, current_player.color
-            ),
+            self._render_text(f"Current player: {current_player.name}", current_player.color),
             (GAME_SIZE, 0),
         )
         for i, player in enumerate(self.players):
             row = self.font_size * (i + 1) * 2
+            self.screen.blit(self._render_text(f"{player.name}", player.color), (GAME_SIZE, row))
             self.screen.blit(
-                self.font.render(f"{player.name}", False, player.color), (GAME_SIZE, row)
-            )
-            self.screen.blit(
-                self.font.render(
-                    f"Total walls: {player.total_walls}", False, (0, 0, 0)
-                ),
+                self._render_text(f"Total walls: {self.board.state.walls_left[player.index]}", (0, 0, 0)),
                 (GAME_SIZE + 20, row + self.font_size),
             )
 
@@ -53,4 +158,4 @@ class RenderMixin:
                 if event.type == pygame.QUIT:
                     pygame.quit()
                 elif event.type == pygame.KEYDOWN or event.type == pygame.MOUSEBUTTONDOWN:
-                    waiting = True
\ No newline at end of file
+                    waiting = True
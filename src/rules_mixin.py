@@ -1,122 +1,98 @@
+from src.actions import action_destination, is_wall_action
+from src.constants import SQUARES
 from src.directions import Direction
-import pygame
 
 
-class QuoridorRulesMixin:
-    def _get_legal_moves(self, current_player):
-        eligible_wall_coords = []
-        if current_player.total_walls > 0:
-            walls = self._get_legal_walls()
-            eligible_wall_coords = []
-            for wall in walls:
-                eligible_wall_coords.append(wall.rect.center)
+def _cell_offset(direction):
+    x_offset, y_offset = Direction.get_offset(direction, 1)
+    return y_offset * SQUARES + x_offset
 
-        eligible_lateral_moves = self._get_legal_lateral_moves(current_player)
-        eligible_adjacent_moves = self._get_legal_adjacent_moves(current_player)
 
-        pawn_move_dict = {**eligible_adjacent_moves, **eligible_lateral_moves}
+CELL_OFFSET_DIRECTIONS = {_cell_offset(direction): direction for direction in Direction}
 
-        move_dict = {
-            'place_wall': eligible_wall_coords,
-            'move_pawn': pawn_move_dict
-        }
 
-        return move_dict
+class QuoridorRulesMixin:
+    """
+    Translates the headless GameState's legal moves into the action encoding used by the AI players
+    (see src.actions) and into the pixel coordinates and direction keys used by human players.
+    """
 
-    def _get_legal_walls(self):
+    def _get_legal_action_mask(self, current_player):
         """
-        :return: a list of wall coordinates that are currently eligible to be placed
+        Masks are cached in the transposition table by position, so positions revisited by shuffling
+        pawns back and forth are not re-derived. The returned mask is shared and must not be modified.
+        :return: (ACTION_SIZE,) boolean mask of the player's legal actions
+        """
+        state = self.board.state
+        return self.transpositions.get_or_compute(
+            ('legal_action_mask', state.zobrist_hash, current_player.index),
+            lambda: state.legal_action_mask(
+                current_player.index,
+                legal_walls=self._get_legal_walls() if state.walls_left[current_player.index] > 0 else [],
+            ),
+        )
+
+    def _apply_action(self, current_player, action):
+        """
+        Plays an action that the player's legal action mask allows.
         """
-        walls = self.board.walls
-        legal_walls = []
-        for wall in walls:
-            if self._wall_is_legal(wall):
-                legal_walls.append(wall)
-
-        return legal_walls
-
-    def _wall_is_legal(self, wall):
         board = self.board
-        adjacent_wall = board.get_adjacent_wall(wall)
-        if adjacent_wall and not adjacent_wall.is_occupied:
-            proposed_new_wall = pygame.Rect.union(wall.rect, adjacent_wall.rect)
-            if not board.is_rect_intersecting_existing_wall(proposed_new_wall):
-                adjacent_wall.is_occupied = True
-                wall.is_occupied = True
-
-                for player in self.players:
-                    viable_path_remains = board.check_viable_path(
-                        player.index, player.rect.center
-                    )
+        if is_wall_action(action):
+            current_player.place_wall(board, board.wall_to_coordinates(action))
+        else:
+            destination = action_destination(board.state.pawns[current_player.index], action)
+            current_player.move_player(board, board.cell_to_coordinates(destination))
 
-                    if not viable_path_remains:
-                        adjacent_wall.is_occupied = False
-                        wall.is_occupied = False
-                        return False
-
-                adjacent_wall.is_occupied = False
-                wall.is_occupied = False
-                return True
+    def _get_legal_walls(self):
+        """
+        :return: a list of engine wall indices that are currently eligible to be placed
+        """
+        return self.legal_wall_cache.get_legal_walls(self.board.state)
 
-        return False
+    def _wall_is_legal(self, wall):
+        wall_index = self.board.coordinates_to_wall(wall.position)
+        return wall_index is not None and self.board.state.is_wall_legal(wall_index)
 
     def _get_legal_adjacent_moves(self, current_player):
         """
         :param current_player:
-        :return: dictionary of structure {DirectionTuple: node} for  all eligible adjacent moves
-        (if no eligible moves, returns {})
+        :return: dictionary of structure {Direction: coordinates} for all eligible moves to the side of
+        an opponent directly in front of the current player (if no eligible moves, returns {})
         """
-        other_player_direction = self.board.get_direction_of_proximal_player(current_player)
-        board = self.board
-        eligible_adjacent_directions = {}
-        if other_player_direction:
-            other_player_node_dict = board.get_nodes_around_node(current_player.rect.center, [other_player_direction])
-            other_player_node = other_player_node_dict[other_player_direction]
-            adjacent_directions = Direction.get_adjacent_directions(other_player_direction)
-            walls_around_player_node_dict = board.get_walls_around_node(current_player.rect.center, [other_player_direction])
-            wall_between_players = walls_around_player_node_dict[other_player_direction]
-            if wall_between_players and not wall_between_players.is_occupied:
-                for direction in adjacent_directions:
-                    is_legal_move, direction_tuple, node = self._is_legal_lateral_move(
-                        direction, other_player_node.rect.center, current_player
-                    )
-                    if is_legal_move:
-                        eligible_adjacent_directions[direction_tuple] = node
-
-        return eligible_adjacent_directions
+        return self._get_legal_pawn_moves(current_player)[1]
 
     def _get_legal_lateral_moves(self, current_player):
         """
         :param current_player:
-        :return: dictionary of structure {DirectionTuple: node} for  all eligible moves (UP, DOWN, LEFT, RIGHT)
-        (if no eligible moves, returns {})
+        :return: dictionary of structure {Direction: coordinates} for all eligible moves (UP, DOWN, LEFT, RIGHT),
+        including straight jumps over an opponent (if no eligible moves, returns {})
         """
-        legal_lateral_moves = {}
-        starting_node = current_player.rect.center
-        for direction in Direction:
-            is_legal_move, direction_tuple, node = self._is_legal_lateral_move(direction, starting_node, current_player)
-            if is_legal_move:
-                legal_lateral_moves[direction_tuple] = node
-
-        return legal_lateral_moves
+        return self._get_legal_pawn_moves(current_player)[0]
 
-    def _is_legal_lateral_move(self, direction, starting_node, current_player):
+    def _get_legal_pawn_moves(self, current_player):
+        """
+        Splits the engine's legal pawn moves into lateral moves (steps and straight jumps) and adjacent moves
+        (side-steps around an opponent), keyed by direction.
+        :return: (lateral_moves, adjacent_moves)
+        """
         board = self.board
-        proximal_node_dict = board.get_nodes_around_node(starting_node, [direction])
-        proximal_node = proximal_node_dict[direction]
-
-        proximal_wall_dict = board.get_walls_around_node(starting_node, [direction])
-        proximal_wall = proximal_wall_dict[direction]
-        if not proximal_wall or proximal_wall.is_occupied or not proximal_node:
-            return False, None, None
-
-        if not proximal_node.is_occupied:
-            return True, direction, proximal_node
-
-        next_proximal_wall_dict = board.get_walls_around_node(proximal_node.rect.center, [direction])
-        if next_proximal_wall_dict[direction] and not next_proximal_wall_dict[direction].is_occupied:
-            next_proximal_node_dict = board.get_nodes_around_node(proximal_node.rect.center, [direction])
-            next_proximal_node = next_proximal_node_dict[direction]
-            return True, (direction, direction) if current_player.is_ai else direction, next_proximal_node
-
-        return False, None, None
\ No newline at end of file
+        state = board.state
+        origin = state.pawns[current_player.index]
+        lateral_moves = {}
+        adjacent_moves = {}
+        for cell in state.legal_pawn_moves(current_player.index):
+            coords = board.cell_to_coordinates(cell)
+            offset = cell - origin
+            if offset in CELL_OFFSET_DIRECTIONS:
+                lateral_moves[CELL_OFFSET_DIRECTIONS[offset]] = coords
+            elif offset % 2 == 0 and offset // 2 in CELL_OFFSET_DIRECTIONS:
+                lateral_moves[CELL_OFFSET_DIRECTIONS[offset // 2]] = coords
+            else:
+                side_offset = next(
+                    offset - opponent_offset for opponent_offset in CELL_OFFSET_DIRECTIONS
+                    if origin + opponent_offset in state.pawns
+                    and offset - opponent_offset in CELL_OFFSET_DIRECTIONS
+                )
+                adjacent_moves[CELL_OFFSET_DIRECTIONS[side_offset]] = coords
+
+        return lateral_moves, adjacent_moves
@@ -0,0 +1,200 @@
+import time
+
+from src.actions import pawn_action
+from src.distance_maps import DistanceMapCache
+from src.game_state import WALL_EDGE_KEYS, GameState, edge_key
+from src.transposition_table import TranspositionTable
+
+WIN_SCORE = 10000
+DISTANCE_WEIGHT = 10
+WALL_WEIGHT = 1
+EXACT, LOWER_BOUND, UPPER_BOUND = range(3)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class AlphaBetaSearch:
+    """
+    Negamax alpha-beta search over a two player GameState with iterative deepening: depth 1, 2, ... are
+    searched until time_budget seconds have passed, and the best move of the deepest completed search is
+    played. Positions are scored from the side to move as the difference of the two players' shortest
+    path lengths (plus a little for walls in hand).
+
+    Only walls that cut the opponent's current shortest path are searched, since no other wall can slow
+    them down. Moves are ordered with the transposition table's best move first, then pawn moves by how
+    close they bring the pawn to its goal, then walls by how close to the opponent they cut their path.
+    The transposition table persists between moves, so a new search starts from the previous one's results.
+    """
+
+    def __init__(self, time_budget=1.0, max_depth=32, transpositions=None, distance_maps=None):
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.transpositions = transpositions if transpositions is not None else TranspositionTable(max_size=2 ** 18)
+        self.distance_maps = distance_maps if distance_maps is not None else DistanceMapCache()
+        self.nodes = 0
+        self.completed_depth = 0
+        self._deadline = None
+
+    def best_action(self, game_state):
+        """
+        Searches a private copy of game_state, which is left untouched.
+        :return: the best action (encoded as in src.actions) for the side to move
+        """
+        if game_state.total_players != 2:
+            raise ValueError(f"Search requires exactly 2 players but the game has {game_state.total_players}")
+
+        state = GameState.from_position(game_state.position(), game_state.starting_cells, game_state.walls_per_player)
+        self.nodes = 0
+        self.completed_depth = 0
+        self._deadline = time.perf_counter() + self.time_budget
+        best_action = self._ordered_actions(state)[0]
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score, action = self._search_root(state, depth)
+            except SearchTimeout:
+                break
+
+            best_action = action
+            self.completed_depth = depth
+            if abs(score) >= WIN_SCORE - self.max_depth:
+                break
+
+        return best_action
+
+    def evaluate(self, state):
+        player = state.current_player
+        opponent = 1 - player
+        distance_difference = self._distance(state, opponent) - self._distance(state, player)
+        wall_difference = state.walls_left[player] - state.walls_left[opponent]
+        return DISTANCE_WEIGHT * distance_difference + WALL_WEIGHT * wall_difference
+
+    def _search_root(self, state, depth):
+        alpha = -WIN_SCORE - 1
+        best_action = None
+        for action in self._ordered_actions(state, self._transposition_move(state)):
+            state.apply_move(action)
+            try:
+                score = -self._negamax(state, depth - 1, -WIN_SCORE - 1, -alpha, 1)
+            finally:
+                state.undo_move()
+            if score > alpha:
+                alpha = score
+                best_action = action
+
+        self.transpositions.put(state.zobrist_hash, (depth, alpha, EXACT, best_action))
+        return alpha, best_action
+
+    def _negamax(self, state, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+
+        if state.is_winner(1 - state.current_player):
+            return -(WIN_SCORE - ply)
+        if depth == 0:
+            return self.evaluate(state)
+
+        entry = self.transpositions.get(state.zobrist_hash)
+        transposition_move = None
+        if entry is not None:
+            entry_depth, score, flag, transposition_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return score
+                if flag == LOWER_BOUND:
+                    alpha = max(alpha, score)
+                elif flag == UPPER_BOUND:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        best_action = None
+        for action in self._ordered_actions(state, transposition_move):
+            state.apply_move(action)
+            try:
+                score = -self._negamax(state, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                state.undo_move()
+            if score > best_score:
+                best_score = score
+                best_action = action
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.transpositions.put(state.zobrist_hash, (depth, best_score, flag, best_action))
+        return best_score
+
+    def _transposition_move(self, state):
+        entry = self.transpositions.get(state.zobrist_hash)
+        return entry[3] if entry is not None else None
+
+    def _ordered_actions(self, state, first_action=None):
+        player = state.current_player
+        opponent = 1 - player
+        origin = state.pawns[player]
+        distance_map = self.distance_maps.get(state, player)
+        actions = [
+            pawn_action(origin, cell)
+            for cell in sorted(state.legal_pawn_moves(player), key=distance_map.__getitem__)
+        ]
+        if state.walls_left[player] > 0:
+            actions.extend(self._path_cutting_walls(state, player, opponent))
+
+        if first_action in actions:
+            actions.remove(first_action)
+            actions.insert(0, first_action)
+
+        return actions
+
+    @staticmethod
+    def _path_cutting_walls(state, player, opponent):
+        """
+        :return: the legal walls cutting the opponent's shortest path, those nearest the opponent first
+        """
+        opponent_path = state.shortest_path(opponent)
+        own_path_edges = state.shortest_path_edges(player)
+        walls = []
+        seen = set()
+        for cell, neighbour in zip(opponent_path, opponent_path[1:]):
+            path_edge = edge_key(cell, neighbour)
+            for wall in WALL_EDGE_TO_WALLS.get(path_edge, ()):
+                if wall in seen or not state.is_wall_placeable(wall):
+                    continue
+
+                seen.add(wall)
+                cut_players = [opponent]
+                if not WALL_EDGE_KEYS[wall].isdisjoint(own_path_edges):
+                    cut_players.append(player)
+                if not state.wall_disconnects(wall, cut_players):
+                    walls.append(wall)
+
+        return walls
+
+    def _distance(self, state, player_index):
+        return self.distance_maps.get(state, player_index)[state.pawns[player_index]]
+
+
+def _build_edge_walls():
+    """
+    :return: {edge_key: walls blocking that edge}
+    """
+    edge_walls = {}
+    for wall, edge_keys in enumerate(WALL_EDGE_KEYS):
+        for key in edge_keys:
+            edge_walls.setdefault(key, []).append(wall)
+
+    return edge_walls
+
+
+WALL_EDGE_TO_WALLS = _build_edge_walls()
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TranspositionTable:
+    """
+    Size-capped cache of anything derived from a position (legal moves, path distances, q-values,
+    search results), keyed by GameState.zobrist_hash or by a tuple starting with it when several kinds
+    of entry share a table. Once max_size entries are stored the least recently used one is replaced.
+    Keys are not verified against the position, so two positions sharing a 64 bit hash (vanishingly
+    rare) would share entries.
+    """
+
+    def __init__(self, max_size=2 ** 16):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        :param compute: called without arguments to produce the entry when the key is missing
+        """
+        entry = self.get(key, _MISSING)
+        if entry is _MISSING:
+            entry = compute()
+            self.put(key, entry)
+
+        return entry
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
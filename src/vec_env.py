@@ -0,0 +1,291 @@
+import numpy as np
+
+from src.actions import ACTION_CELL_OFFSETS, ACTION_SIZE, PAWN_OFFSET_ACTIONS, WALL_ACTIONS
+from src.constants import GOAL_ROWS, SPACES, SQUARES, STARTING_CELLS, STARTING_WALLS, TOTAL_CELLS, WALL_SQUARES
+from src.game_state import (
+    EDGE_DOWN,
+    EDGE_RIGHT,
+    EMPTY_STATE,
+    PERPENDICULAR_STEPS,
+    STEPS,
+    TOTAL_WALLS,
+    UNREACHABLE,
+    WALL_BLOCKED_EDGES,
+    WALL_CONFLICTS,
+    cell_position,
+    wall_position,
+)
+
+# Rows of the board are packed into the low SQUARES bits of a uint16, bit c being column c.
+# right_open[row] has bit c set if (c, row) -> (c + 1, row) is open and down_open[row] has bit c
+# set if (c, row) -> (c, row + 1) is open.
+COLUMNS = np.arange(SQUARES, dtype=np.uint16)
+ROW_BITS = np.left_shift(np.uint16(1), COLUMNS)
+EMPTY_RIGHT_OPEN = np.full(SQUARES, (1 << (SQUARES - 1)) - 1, dtype=np.uint16)
+EMPTY_DOWN_OPEN = np.full(SQUARES - 1, (1 << SQUARES) - 1, dtype=np.uint16)
+# Posts are the corners between cells, (SQUARES + 1) X (SQUARES + 1) of them, indexed row * POSTS + col.
+POSTS = SQUARES + 1
+BORDER_POSTS = np.array([
+    post // POSTS in (0, POSTS - 1) or post % POSTS in (0, POSTS - 1) for post in range(POSTS * POSTS)
+])
+GOAL_ROW_ARRAY = np.array(GOAL_ROWS)
+EDGE_DIRECTIONS = {edge: direction for direction, (edge, _) in enumerate(STEPS)}
+
+
+def _build_wall_arrays():
+    """
+    :return: (conflict_matrix, right_bits, down_bits, posts, state_cells) where conflict_matrix[wall] flags
+    every wall overlapping or crossing it, right_bits/down_bits hold the packed edges each wall closes, posts
+    the three posts it runs through and state_cells the three flattened get_state cells it covers.
+    """
+    conflict_matrix = np.zeros((TOTAL_WALLS, TOTAL_WALLS), dtype=np.int32)
+    right_bits = np.zeros((TOTAL_WALLS, SQUARES), dtype=np.uint16)
+    down_bits = np.zeros((TOTAL_WALLS, SQUARES - 1), dtype=np.uint16)
+    posts = np.zeros((TOTAL_WALLS, 3), dtype=np.int64)
+    state_cells = np.zeros((TOTAL_WALLS, 3), dtype=np.int64)
+    for wall in range(TOTAL_WALLS):
+        for other_wall in range(TOTAL_WALLS):
+            conflict_matrix[wall, other_wall] = WALL_CONFLICTS[wall] >> other_wall & 1
+
+        for cell, edge, _, _ in WALL_BLOCKED_EDGES[wall]:
+            col, row = cell_position(cell)
+            if edge == EDGE_RIGHT:
+                right_bits[wall, row] |= 1 << col
+            elif edge == EDGE_DOWN:
+                down_bits[wall, row] |= 1 << col
+
+        col, row, is_vertical = wall_position(wall)
+        x_coord = 2 * col + 1
+        y_coord = 2 * row + 1
+        for offset in (-1, 0, 1):
+            if is_vertical:
+                posts[wall, offset + 1] = (row + 1 + offset) * POSTS + col + 1
+                state_cells[wall, offset + 1] = x_coord * SPACES + y_coord + offset
+            else:
+                posts[wall, offset + 1] = (row + 1) * POSTS + col + 1 + offset
+                state_cells[wall, offset + 1] = (x_coord + offset) * SPACES + y_coord
+
+    return conflict_matrix, right_bits, down_bits, posts, state_cells
+
+
+WALL_CONFLICT_MATRIX, WALL_RIGHT_BITS, WALL_DOWN_BITS, WALL_POSTS, WALL_STATE_CELLS = _build_wall_arrays()
+WALL_POST_MATRIX = np.zeros((TOTAL_WALLS, POSTS * POSTS), dtype=np.int32)
+WALL_POST_MATRIX[np.arange(TOTAL_WALLS)[:, None], WALL_POSTS] = 1
+PAWN_STATE_CELLS = np.array([2 * col * SPACES + 2 * row for col, row in map(cell_position, range(TOTAL_CELLS))])
+EMPTY_OBSERVATION = EMPTY_STATE.flatten()
+
+
+def flood_distances(start_cells, goal_rows, right_open, down_open):
+    """
+    Synchronous flood fill over bit-packed rows, one breadth first layer per iteration, for every
+    item at once. Pawns do not block paths.
+    :param start_cells: (K,) cells to search from
+    :param goal_rows: (K,) row each search is trying to reach
+    :param right_open: (K, SQUARES) packed open horizontal edges
+    :param down_open: (K, SQUARES - 1) packed open vertical edges
+    :return: (K,) number of steps from each start cell to its goal row, or UNREACHABLE
+    """
+    rows, cols = np.divmod(start_cells, SQUARES)
+    distances = np.where(rows == goal_rows, 0, UNREACHABLE)
+
+    # Searches that finish or stop growing are dropped so the remaining iterations only touch live items.
+    active = np.flatnonzero(distances == UNREACHABLE)
+    reach = np.zeros((active.size, SQUARES), dtype=np.uint16)
+    reach[np.arange(active.size), rows[active]] = ROW_BITS[cols[active]]
+    goal_rows, right_open, down_open = goal_rows[active], right_open[active], down_open[active]
+    steps = 0
+    while active.size:
+        expanded = reach | ((reach & right_open) << 1) | ((reach >> 1) & right_open)
+        expanded[:, 1:] |= reach[:, :-1] & down_open
+        expanded[:, :-1] |= reach[:, 1:] & down_open
+        steps += 1
+
+        reached = expanded[np.arange(active.size), goal_rows] != 0
+        distances[active[reached]] = steps
+        live = ~reached & (expanded != reach).any(axis=1)
+        active, reach = active[live], expanded[live]
+        goal_rows, right_open, down_open = goal_rows[live], right_open[live], down_open[live]
+
+    return distances
+
+
+class VecQuoridorEnv:
+    """
+    Runs num_games independent two player games in lockstep as stacked NumPy arrays:
+        pawns: (num_games, 2) cell indices
+        walls: (num_games, 2, WALL_SQUARES, WALL_SQUARES) horizontal and vertical wall planes,
+            which flatten to engine wall indices
+        walls_left: (num_games, 2)
+        current_player: (num_games,)
+    Each step applies one action per game for that game's current player. Observations use the
+    flattened 17 X 17 encoding of GameState.get_state and actions the encoding in src.actions, so one
+    forward pass of a DQN scores every game at once. Finished games are reset automatically.
+    """
+
+    def __init__(self, num_games, walls_per_player=STARTING_WALLS, step_reward=-0.1, win_reward=10):
+        self.num_games = num_games
+        self.walls_per_player = walls_per_player
+        self.step_reward = step_reward
+        self.win_reward = win_reward
+        self.total_players = len(STARTING_CELLS)
+        self.pawns = np.zeros((num_games, self.total_players), dtype=np.int64)
+        self.walls = np.zeros((num_games, 2, WALL_SQUARES, WALL_SQUARES), dtype=bool)
+        self.flat_walls = self.walls.reshape(num_games, TOTAL_WALLS)
+        self.walls_left = np.zeros((num_games, self.total_players), dtype=np.int64)
+        self.current_player = np.zeros(num_games, dtype=np.int64)
+        self.action_masks = None
+        self.reset()
+
+    def reset(self):
+        """
+        :return: (observations, action_masks) of every game
+        """
+        self._reset_games(slice(None))
+        self.action_masks = self.legal_action_masks()
+        return self.observations(), self.action_masks
+
+    def step(self, actions):
+        """
+        :param actions: (num_games,) action indices, one per game, for each game's current player
+        :return: (observations, rewards, dones, info). Rewards are for the player who moved and finished games
+        are already reset in observations; info holds the 'final_observations' reached by each action and the
+        'action_mask' of the next positions.
+        """
+        actions = np.asarray(actions)
+        games = np.arange(self.num_games)
+        illegal_games = np.flatnonzero(~self.action_masks[games, actions])
+        if illegal_games.size:
+            raise ValueError(f"Illegal actions {actions[illegal_games].tolist()} for games {illegal_games.tolist()}")
+
+        movers = self.current_player.copy()
+        is_wall = actions < WALL_ACTIONS
+        self.flat_walls[games[is_wall], actions[is_wall]] = True
+        self.walls_left[games[is_wall], movers[is_wall]] -= 1
+        is_pawn = ~is_wall
+        self.pawns[games[is_pawn], movers[is_pawn]] += ACTION_CELL_OFFSETS[actions[is_pawn]]
+        self.current_player = (movers + 1) % self.total_players
+
+        final_observations = self.observations()
+        dones = self.pawns[games, movers] // SQUARES == GOAL_ROW_ARRAY[movers]
+        rewards = np.full(self.num_games, self.step_reward, dtype=np.float32)
+        observations = final_observations
+        if dones.any():
+            finished = np.flatnonzero(dones)
+            opponents = (movers[finished] + 1) % self.total_players
+            right_open, down_open = self._open_bits(self.flat_walls[finished])
+            opponent_distances = flood_distances(
+                self.pawns[finished, opponents], GOAL_ROW_ARRAY[opponents], right_open, down_open
+            )
+            rewards[finished] = self.win_reward * np.minimum(opponent_distances / (SQUARES - 1), 1)
+            self._reset_games(finished)
+            observations = self.observations()
+
+        self.action_masks = self.legal_action_masks()
+        info = {'final_observations': final_observations, 'action_mask': self.action_masks}
+        return observations, rewards, dones, info
+
+    def observations(self):
+        """
+        :return: (num_games, SPACES * SPACES) matrix, each row equivalent to GameState.get_state
+        """
+        games = np.arange(self.num_games)
+        observations = np.tile(EMPTY_OBSERVATION, (self.num_games, 1))
+        wall_games, walls = np.nonzero(self.flat_walls)
+        observations[wall_games[:, None], WALL_STATE_CELLS[walls]] = 1
+        for player_index in range(self.total_players):
+            observations[games, PAWN_STATE_CELLS[self.pawns[:, player_index]]] = (player_index + 1) * 10
+
+        return observations
+
+    def legal_action_masks(self):
+        """
+        :return: (num_games, ACTION_SIZE) boolean mask of the current player's legal actions in each game
+        """
+        right_open, down_open = self._open_bits(self.flat_walls)
+        masks = self._legal_pawn_mask(right_open, down_open)
+        masks[:, :WALL_ACTIONS] = self._legal_wall_mask(right_open, down_open)
+        return masks
+
+    def _legal_wall_mask(self, right_open, down_open):
+        """
+        A wall is legal if it fits, the current player has walls left and, with it in place, every
+        player can still reach their goal. A wall can only cut the board if it closes a loop, i.e. at
+        least two of its posts already touch a wall or the border; the path checks for the remaining
+        candidates of all games are flooded together.
+        """
+        games = np.arange(self.num_games)
+        placed = self.flat_walls.astype(np.int32)
+        placeable = (placed @ WALL_CONFLICT_MATRIX) == 0
+        placeable &= (self.walls_left[games, self.current_player] > 0)[:, None]
+        touched_posts = BORDER_POSTS | ((placed @ WALL_POST_MATRIX) > 0)
+        closes_loop = touched_posts[:, WALL_POSTS].sum(axis=2) >= 2
+        candidate_games, candidate_walls = np.nonzero(placeable & closes_loop)
+        if candidate_games.size == 0:
+            return placeable
+
+        candidate_right_open = right_open[candidate_games] & ~WALL_RIGHT_BITS[candidate_walls]
+        candidate_down_open = down_open[candidate_games] & ~WALL_DOWN_BITS[candidate_walls]
+        players = np.repeat(np.arange(self.total_players), candidate_games.size)
+        distances = flood_distances(
+            self.pawns[np.tile(candidate_games, self.total_players), players],
+            GOAL_ROW_ARRAY[players],
+            np.tile(candidate_right_open, (self.total_players, 1)),
+            np.tile(candidate_down_open, (self.total_players, 1)),
+        )
+        disconnects = (distances == UNREACHABLE).reshape(self.total_players, -1).any(axis=0)
+        placeable[candidate_games[disconnects], candidate_walls[disconnects]] = False
+        return placeable
+
+    def _legal_pawn_mask(self, right_open, down_open):
+        """
+        Same rules as GameState.legal_pawn_moves: step to an open, empty neighbour, jump straight over an
+        adjacent opponent if nothing is behind them or side-step around them.
+        :return: (num_games, ACTION_SIZE) mask with only the legal pawn actions set
+        """
+        games = np.arange(self.num_games)
+        open_edges = self._open_edges(right_open, down_open)
+        origins = self.pawns[games, self.current_player]
+        opponents = self.pawns[games, (self.current_player + 1) % self.total_players]
+        mask = np.zeros((self.num_games, ACTION_SIZE), dtype=bool)
+        for direction, (edge, offset) in enumerate(STEPS):
+            open_from_origin = open_edges[games, direction, origins]
+            facing_opponent = open_from_origin & (origins + offset == opponents)
+            mask[:, PAWN_OFFSET_ACTIONS[offset]] = open_from_origin & ~facing_opponent
+            mask[:, PAWN_OFFSET_ACTIONS[2 * offset]] = facing_opponent & open_edges[games, direction, opponents]
+            for side_edge, side_offset in PERPENDICULAR_STEPS[edge]:
+                side_direction = EDGE_DIRECTIONS[side_edge]
+                mask[:, PAWN_OFFSET_ACTIONS[offset + side_offset]] |= (
+                    facing_opponent & open_edges[games, side_direction, opponents]
+                )
+
+        return mask
+
+    def _open_bits(self, flat_walls):
+        """
+        :return: (right_open, down_open) packed rows for each of the given wall configurations
+        """
+        placed = flat_walls[:, :, None]
+        right_blocked = np.bitwise_or.reduce(WALL_RIGHT_BITS * placed, axis=1)
+        down_blocked = np.bitwise_or.reduce(WALL_DOWN_BITS * placed, axis=1)
+        return EMPTY_RIGHT_OPEN & ~right_blocked, EMPTY_DOWN_OPEN & ~down_blocked
+
+    @staticmethod
+    def _open_edges(right_open, down_open):
+        """
+        :return: (games, 4, TOTAL_CELLS) boolean open edges, directions in the order of STEPS
+        """
+        games = len(right_open)
+        right = ((right_open[:, :, None] >> COLUMNS) & 1).astype(bool)
+        left = np.zeros_like(right)
+        left[:, :, 1:] = right[:, :, :-1]
+        down = np.zeros_like(right)
+        down[:, :-1, :] = ((down_open[:, :, None] >> COLUMNS) & 1).astype(bool)
+        up = np.zeros_like(right)
+        up[:, 1:, :] = down[:, :-1, :]
+        return np.stack([up, down, left, right], axis=1).reshape(games, len(STEPS), TOTAL_CELLS)
+
+    def _reset_games(self, games):
+        self.pawns[games] = STARTING_CELLS
+        self.walls[games] = False
+        self.walls_left[games] = self.walls_per_player
+        self.current_player[games] = 0
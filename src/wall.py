@@ -32,6 +32,15 @@ class Wall(pygame.sprite.Sprite):
 
         return img
 
+    def reset(self):
+        """
+        Splits a placed wall back into its original, unoccupied segment.
+        """
+        self.image = self.original_image
+        self.rect = pygame.Rect(0, 0, self.w, self.h)
+        self.rect.center = self.position
+        self.is_occupied = False
+
     def update(self):
         pos = pygame.mouse.get_pos()
         hit = self.rect.collidepoint(pos)
@@ -0,0 +1,35 @@
+"""
+Checks the learner side of ActorLearnerTrainer without starting actor processes.
+"""
+import numpy as np
+import torch
+
+from src.actions import ACTION_SIZE
+from src.actor_learner import STATE_SIZE, ActorLearnerTrainer, default_players
+from src.metrics import Metrics
+
+
+def test_every_player_syncs_its_target_network():
+    rng = np.random.default_rng(0)
+    players = default_players()
+    for player in players:
+        for _ in range(32):
+            player.memory.push_memory(
+                rng.integers(-1, 2, STATE_SIZE), int(rng.integers(ACTION_SIZE)), rng.integers(-1, 2, STATE_SIZE),
+                -0.1, False, next_action_mask=np.ones(ACTION_SIZE, dtype=bool),
+            )
+    trainer = ActorLearnerTrainer(
+        players, batch_size=16, update_target_every=4, broadcast_every=1000, metrics=Metrics(enabled=False)
+    )
+    initial_targets = [{name: value.clone() for name, value in player.target_model.state_dict().items()}
+                       for player in players]
+
+    for _ in range(trainer.update_target_every):
+        trainer._learn(weights_queues=[])
+
+    assert trainer.player_learn_steps == [trainer.update_target_every] * len(players)
+    for player, initial_target in zip(players, initial_targets):
+        target = player.target_model.state_dict()
+        assert any(not torch.equal(target[name], value) for name, value in initial_target.items())
+        for name, value in player.policy_model.state_dict().items():
+            assert torch.equal(target[name], value)
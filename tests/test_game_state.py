@@ -0,0 +1,173 @@
+"""
+Checks the GameState engine and LegalWallCache against a naive reference of the rules over seeded
+random games.
+"""
+from collections import deque
+
+import numpy as np
+import pytest
+
+from src.actions import WALL_ACTIONS, action_destination, is_wall_action
+from src.constants import GOAL_ROWS, SQUARES, TOTAL_CELLS
+from src.game_state import TOTAL_WALLS, GameState, cell_index, cell_position, wall_position
+from src.legal_wall_cache import LegalWallCache
+
+SEEDS = range(6)
+MAX_PLIES = 120
+# The naive legal wall reference takes hundreds of searches per position, so it checks every nth one
+WALL_CHECK_EVERY = 3
+
+
+def blocked_edges(placed_walls):
+    """
+    :return: set of (cell, neighbour) pairs cut by the walls, lower cell first
+    """
+    blocked = set()
+    for wall in placed_walls:
+        col, row, is_vertical = wall_position(wall)
+        if is_vertical:
+            pairs = [((col, row), (col + 1, row)), ((col, row + 1), (col + 1, row + 1))]
+        else:
+            pairs = [((col, row), (col, row + 1)), ((col + 1, row), (col + 1, row + 1))]
+        blocked.update((cell_index(*first), cell_index(*second)) for first, second in pairs)
+    return blocked
+
+
+def neighbours(cell, blocked):
+    col, row = cell_position(cell)
+    for step_col, step_row in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+        next_col, next_row = col + step_col, row + step_row
+        if 0 <= next_col < SQUARES and 0 <= next_row < SQUARES:
+            neighbour = cell_index(next_col, next_row)
+            if (min(cell, neighbour), max(cell, neighbour)) not in blocked:
+                yield neighbour, (step_col, step_row)
+
+
+def reaches_goal(start, goal_row, blocked):
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        if cell // SQUARES == goal_row:
+            return True
+        for neighbour, _ in neighbours(cell, blocked):
+            if neighbour not in seen:
+                seen.add(neighbour)
+                queue.append(neighbour)
+    return False
+
+
+def walls_conflict(first, second):
+    first_col, first_row, first_vertical = wall_position(first)
+    second_col, second_row, second_vertical = wall_position(second)
+    if first_vertical != second_vertical:
+        # Crossing at the same centre
+        return (first_col, first_row) == (second_col, second_row)
+    if first_vertical:
+        return first_col == second_col and abs(first_row - second_row) <= 1
+    return first_row == second_row and abs(first_col - second_col) <= 1
+
+
+def reference_legal_walls(state):
+    placed = list(state.iter_placed_walls())
+    already_blocked = blocked_edges(placed)
+    legal = []
+    for wall in range(TOTAL_WALLS):
+        if any(walls_conflict(wall, other) for other in placed):
+            continue
+        blocked = already_blocked | blocked_edges([wall])
+        if all(reaches_goal(pawn, GOAL_ROWS[player], blocked) for player, pawn in enumerate(state.pawns)):
+            legal.append(wall)
+    return legal
+
+
+def reference_pawn_moves(state, player_index):
+    blocked = blocked_edges(state.iter_placed_walls())
+    pawns = state.pawns
+    moves = set()
+    for target, (step_col, step_row) in neighbours(pawns[player_index], blocked):
+        if target not in pawns:
+            moves.add(target)
+            continue
+
+        for beyond, step in neighbours(target, blocked):
+            straight = step == (step_col, step_row)
+            sideways = step != (-step_col, -step_row) and not straight
+            if (straight or sideways) and beyond not in pawns:
+                moves.add(beyond)
+    return moves
+
+
+def random_game(seed, state=None, wall_probability=0.3):
+    """
+    Plays random legal moves, preferring pawn moves, yielding the state before every move and finally
+    after the last one.
+    :return: iterator of (state, action), action None at the end
+    """
+    rng = np.random.default_rng(seed)
+    state = state or GameState()
+    for _ in range(MAX_PLIES):
+        mask = state.legal_action_mask()
+        actions = np.flatnonzero(mask)
+        walls = actions[actions < WALL_ACTIONS]
+        pawn_moves = actions[actions >= WALL_ACTIONS]
+        pool = walls if walls.size and rng.random() < wall_probability else pawn_moves
+        action = int(rng.choice(pool))
+        yield state, action
+        mover = state.current_player
+        state.apply_move(action)
+        if state.is_winner(mover):
+            break
+    yield state, None
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_rules_match_reference(seed):
+    for ply, (state, action) in enumerate(random_game(seed)):
+        for player_index in range(state.total_players):
+            assert set(state.legal_pawn_moves(player_index)) == reference_pawn_moves(state, player_index)
+            assert state.is_winner(player_index) == (state.pawns[player_index] // SQUARES == GOAL_ROWS[player_index])
+        if ply % WALL_CHECK_EVERY == 0 or action is None:
+            assert state.legal_walls() == reference_legal_walls(state)
+        if action is not None:
+            mover = state.current_player
+            if is_wall_action(action):
+                assert state.walls_left[mover] > 0
+            else:
+                assert action_destination(state.pawns[mover], action) in reference_pawn_moves(state, mover)
+        assert 0 <= min(state.pawns) and max(state.pawns) < TOTAL_CELLS
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_undo_restores_position_and_hash(seed):
+    state = GameState()
+    start = state.position()
+    positions = []
+    for state, action in random_game(seed, state):
+        assert state.zobrist_hash == state._compute_zobrist_hash()
+        positions.append((state.position(), state.zobrist_hash))
+
+    positions.pop()
+    while state.history:
+        state.undo_move()
+        assert (state.position(), state.zobrist_hash) == positions.pop()
+    assert state.position() == start
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_legal_wall_cache_matches_full_recompute(seed):
+    cache = LegalWallCache(verify=True)
+    state = GameState()
+    for game in range(2):
+        for state, _ in random_game(seed * 2 + game, state, wall_probability=0.5):
+            cache.get_legal_walls(state)
+            # Asking twice must come from the cache unchanged
+            assert cache.get_legal_walls(state) == state.legal_walls()
+
+        # Taking moves back (an undone wall forces a recompute)
+        for _ in range(min(6, len(state.history))):
+            state.undo_move()
+            cache.get_legal_walls(state)
+        state.reset()
+
+    assert cache.incremental_updates > 0
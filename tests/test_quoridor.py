@@ -0,0 +1,30 @@
+"""
+Plays Quoridor.run_game headless and checks the games it records replay under the rules.
+"""
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np  # noqa: E402
+
+from src.game_record import GameRecordWriter, Replayer, iter_records  # noqa: E402
+from src.quoridor import Quoridor  # noqa: E402
+
+
+def test_run_game_records_games_that_end_at_the_first_win(tmp_path):
+    np.random.seed(0)
+    writer = GameRecordWriter(str(tmp_path))
+    quoridor = Quoridor(game_records=writer, render_every=0)
+
+    assert quoridor.run_game(max_games=3) == 3
+    # The board was reset after the last win, so closing records no extra game
+    quoridor._close_game_records()
+
+    records = list(iter_records([str(tmp_path)]))
+    replayer = Replayer()
+    for record in records:
+        replayer.verify(record)
+        assert record.winner is not None
+    assert len(records) == 3
+    assert replayer.games_replayed == 3
@@ -0,0 +1,66 @@
+"""
+Checks VecQuoridorEnv against one GameState per game over seeded random games.
+"""
+import numpy as np
+import pytest
+
+from src.actions import WALL_ACTIONS
+from src.constants import SQUARES
+from src.game_state import GameState
+from src.vec_env import VecQuoridorEnv
+
+GAMES = 8
+STEPS = 250
+
+
+def choose_actions(rng, masks, wall_probability=0.3):
+    actions = []
+    for mask in masks:
+        legal_actions = np.flatnonzero(mask)
+        walls = legal_actions[legal_actions < WALL_ACTIONS]
+        pawn_moves = legal_actions[legal_actions >= WALL_ACTIONS]
+        pool = walls if walls.size and rng.random() < wall_probability else pawn_moves
+        actions.append(rng.choice(pool))
+    return np.array(actions)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_game_state(seed):
+    rng = np.random.default_rng(seed)
+    env = VecQuoridorEnv(GAMES)
+    states = [GameState() for _ in range(GAMES)]
+    observations, masks = env.reset()
+    finished_games = 0
+    for _ in range(STEPS):
+        for game, state in enumerate(states):
+            assert np.array_equal(masks[game], state.legal_action_mask())
+            assert np.array_equal(observations[game], state.get_state())
+            assert env.current_player[game] == state.current_player
+            assert list(env.walls_left[game]) == state.walls_left
+
+        actions = choose_actions(rng, masks)
+        observations, rewards, dones, info = env.step(actions)
+        for game, state in enumerate(states):
+            mover = state.current_player
+            state.apply_move(int(actions[game]))
+            assert np.array_equal(info['final_observations'][game], state.get_state())
+            assert dones[game] == state.is_winner(mover)
+            if dones[game]:
+                opponent = (mover + 1) % state.total_players
+                distance = state.distance_map(opponent)[state.pawns[opponent]]
+                assert rewards[game] == pytest.approx(env.win_reward * min(distance / (SQUARES - 1), 1))
+                state.reset()
+                finished_games += 1
+            else:
+                assert rewards[game] == pytest.approx(env.step_reward)
+        masks = info['action_mask']
+
+    assert finished_games > 0
+
+
+def test_rejects_illegal_actions():
+    env = VecQuoridorEnv(2)
+    _, masks = env.reset()
+    illegal = np.flatnonzero(~masks[0])[0]
+    with pytest.raises(ValueError):
+        env.step(np.array([illegal, np.flatnonzero(masks[1])[0]]))